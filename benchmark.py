@@ -0,0 +1,199 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from solders.pubkey import Pubkey
+import storage
+from database import init_db
+from monitor import WalletMonitor
+from notifier import NotificationDispatcher
+from prices import PriceCache, HTTPPriceSource, SOL_MINT
+from rpc import SolanaRPCClient, Endpoint, LAMPORTS_PER_SOL
+from scheduler import AdaptiveScheduler
+from stubs import StubRPCServer, StubPriceServer
+
+logger = logging.getLogger(__name__)
+
+# Banco de pruebas sin conexión del ciclo del monitor: base de datos sintética,
+# stubs locales de JSON-RPC y de precios y un bot falso que solo cuenta los envíos.
+
+class FakeBot:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.sent = 0
+
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent += 1
+
+def populate(subscriptions: int, overlap: float, group_size: int) -> list[str]:
+    # overlap es la fracción de suscripciones que repiten una dirección ya seguida por otro chat
+    distinct = max(1, round(subscriptions * (1 - overlap)))
+    addresses = [str(Pubkey.new_unique()) for _ in range(distinct)]
+    rows = []
+    groups = []
+    for i in range(subscriptions):
+        group_index = i // group_size
+        if i % group_size == 0:
+            groups.append((group_index + 1, group_index, f'grupo_{group_index}'))
+        address = addresses[i] if i < distinct else random.choice(addresses)
+        rows.append((group_index + 1, address, LAMPORTS_PER_SOL, None))
+    with storage.transaction() as conn:
+        conn.executemany('INSERT INTO groups (id, chat_id, group_name) VALUES (?, ?, ?)', groups)
+        conn.executemany('INSERT OR IGNORE INTO wallets (group_id, wallet_address, lamports, tag) VALUES (?, ?, ?, ?)', rows)
+    return addresses
+
+async def run_scenario(subscriptions: int, args) -> dict:
+    # tracemalloc ralentiza todo el intérprete, así que solo se activa si se pide
+    if args.trace_memory:
+        tracemalloc.start()
+    storage.set_db_path(os.path.join(tempfile.mkdtemp(prefix='btcaller-bench-'), 'wallets.db'))
+    init_db()
+    addresses = populate(subscriptions, args.overlap, args.group_size)
+
+    stub = StubRPCServer(latency=args.rpc_latency)
+    stub.balances.update({address: LAMPORTS_PER_SOL for address in addresses})
+    await stub.start()
+    price_stub = StubPriceServer(latency=args.rpc_latency)
+    price_stub.prices[SOL_MINT] = 150.0
+    await price_stub.start()
+
+    statements = 0
+    def count_statement(_):
+        nonlocal statements
+        statements += 1
+    storage.get_connection().set_trace_callback(count_statement)
+
+    bot = FakeBot(args.send_latency)
+    notifier = NotificationDispatcher(bot, global_rate=args.global_rate, chat_rate=args.chat_rate)
+    rpc_client = SolanaRPCClient([Endpoint(stub.url, rate=1e9)], concurrency=args.rpc_concurrency, hedge_delay=60)
+    # Sin retroceso ni presupuesto: cada ciclo recorre todas las direcciones
+    prices = PriceCache(HTTPPriceSource(price_stub.url))
+    monitor = WalletMonitor(notifier, rpc_client, AdaptiveScheduler(0, 0), requests_per_second=1e9, prices=prices)
+
+    cycles = []
+    for _ in range(args.cycles):
+        # Cambiar el saldo de una fracción de las direcciones antes de cada ciclo
+        for address in random.sample(addresses, int(len(addresses) * args.change_rate)):
+            stub.balances[address] += random.choice((-1, 1)) * LAMPORTS_PER_SOL
+        requests_before, statements_before, enqueued_before = stub.requests, statements, notifier.enqueued
+        price_requests_before = price_stub.requests
+        start = time.perf_counter()
+        await monitor.run_cycle()
+        cycles.append({
+            'duration_s': time.perf_counter() - start,
+            'rpc_calls': stub.requests - requests_before,
+            'price_calls': price_stub.requests - price_requests_before,
+            'db_statements': statements - statements_before,
+            'notifications_enqueued': notifier.enqueued - enqueued_before,
+        })
+
+    # El dispatcher arranca con la cola llena para medir su rendimiento sin depender del ritmo de los ciclos
+    drain_start = time.perf_counter()
+    notifier_task = asyncio.create_task(notifier.run())
+    drained = await notifier.drain(args.drain_timeout)
+    delivery_time = time.perf_counter() - drain_start
+    notifier_task.cancel()
+    await rpc_client.close()
+    await prices.close()
+    await stub.stop()
+    await price_stub.stop()
+    storage.get_connection().set_trace_callback(None)
+    storage.close()
+    peak_memory = None
+    if args.trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+    warm = cycles[1:] or cycles
+    notifications = sum(cycle['notifications_enqueued'] for cycle in cycles)
+    return {
+        'subscriptions': subscriptions,
+        'distinct_addresses': len(addresses),
+        'cold_cycle': cycles[0],
+        'warm_cycle_mean': {key: sum(cycle[key] for cycle in warm) / len(warm) for key in cycles[0]},
+        'cycles': cycles,
+        'notifications': notifications,
+        'messages_sent': bot.sent,
+        'notification_throughput_per_s': notifications / delivery_time if drained and delivery_time else None,
+        'notifications_drained': drained,
+        'peak_traced_memory_mb': peak_memory,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def compare(current: dict, baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = {scenario['subscriptions']: scenario for scenario in json.load(f)['scenarios']}
+    print(f'\nComparación con {baseline_path}:')
+    for scenario in current['scenarios']:
+        previous = baseline.get(scenario['subscriptions'])
+        if previous is None:
+            continue
+        for key in ('duration_s', 'rpc_calls', 'db_statements'):
+            old, new = previous['warm_cycle_mean'][key], scenario['warm_cycle_mean'][key]
+            change = f'{(new - old) / old * 100:+.1f}%' if old else 'n/a'
+            print(f"  {scenario['subscriptions']:>7} suscripciones  {key:<14} {old:>10.4f} -> {new:>10.4f}  ({change})")
+
+async def main(args) -> None:
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'parameters': vars(args),
+        'scenarios': [],
+    }
+    for size in args.sizes:
+        scenario = await run_scenario(size, args)
+        results['scenarios'].append(scenario)
+        warm = scenario['warm_cycle_mean']
+        throughput = scenario['notification_throughput_per_s']
+        memory = scenario['peak_traced_memory_mb'] or scenario['max_rss_mb']
+        print(
+            f"{size:>7} suscripciones ({scenario['distinct_addresses']} direcciones): "
+            f"ciclo {warm['duration_s'] * 1000:.1f} ms, {warm['rpc_calls']:.0f} RPC, {warm['db_statements']:.0f} sentencias SQL, "
+            f"{scenario['notifications']} notificaciones en {scenario['messages_sent']} mensajes "
+            f"({f'{throughput:.0f}/s' if throughput else 'n/a'}), memoria pico {memory:.1f} MB"
+        )
+
+    output = args.output or os.path.join('bench_results', f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Resultados guardados en {output}')
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.WARNING)
+    parser = argparse.ArgumentParser(description='Benchmark sin conexión del ciclo del monitor')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='suscripciones por escenario')
+    parser.add_argument('--overlap', type=float, default=0.5, help='fracción de suscripciones que repiten dirección entre chats')
+    parser.add_argument('--group-size', type=int, default=50, help='wallets por grupo (un grupo por chat)')
+    parser.add_argument('--cycles', type=int, default=5)
+    parser.add_argument('--change-rate', type=float, default=0.01, help='fracción de direcciones que cambian en cada ciclo')
+    parser.add_argument('--rpc-latency', type=float, default=0.0, help='latencia simulada del stub JSON-RPC, en segundos')
+    parser.add_argument('--rpc-concurrency', type=int, default=4)
+    parser.add_argument('--send-latency', type=float, default=0.0, help='latencia simulada de send_message, en segundos')
+    parser.add_argument('--global-rate', type=float, default=1e6, help='límite global de envíos por segundo')
+    parser.add_argument('--chat-rate', type=float, default=1e6, help='límite de envíos por segundo y chat')
+    parser.add_argument('--drain-timeout', type=float, default=60)
+    parser.add_argument('--trace-memory', action='store_true', help='medir la memoria pico con tracemalloc (ralentiza los tiempos)')
+    parser.add_argument('--output', help='fichero JSON de resultados (por defecto bench_results/<commit>.json)')
+    parser.add_argument('--compare', help='fichero JSON de una ejecución anterior con el que comparar')
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,64 @@
+from collections import OrderedDict
+from config import CHAT_CACHE_SIZE
+from database import get_chat_groups, get_chat_wallet_addresses, wallet_exists as db_wallet_exists
+import metrics
+
+# Caché de lectura por chat para la navegación del bot: grupos, estado de sus notificaciones y del
+# seguimiento de tokens, número de wallets de cada grupo y direcciones vigiladas por el chat. Cada chat
+# se carga con una sola consulta la primera vez y se descarta entero en cualquier escritura que le
+# afecte; los chats menos usados salen primero cuando se supera CHAT_CACHE_SIZE.
+
+# Direcciones de un chat que se guardan como máximo; por encima, wallet_exists consulta la base de datos
+MAX_CACHED_ADDRESSES = 10000
+
+class ChatEntry:
+    __slots__ = ('groups', 'addresses')
+
+    def __init__(self, groups: list[tuple]):
+        # group_id -> (group_name, notifications_enabled, track_tokens, número de wallets), por nombre
+        self.groups = {group_id: (group_name, enabled, track_tokens, wallets) for group_id, group_name, enabled, track_tokens, wallets in groups}
+        # Direcciones del chat; se cargan con la primera comprobación (None = sin cargar o demasiadas)
+        self.addresses = None
+
+# chat_id -> ChatEntry
+_chats = OrderedDict()
+
+def _entry(chat_id: int) -> ChatEntry:
+    entry = _chats.get(chat_id)
+    if entry is not None:
+        _chats.move_to_end(chat_id)
+        metrics.chat_cache_lookups.inc(result='hit')
+        return entry
+    metrics.chat_cache_lookups.inc(result='miss')
+    entry = _chats[chat_id] = ChatEntry(get_chat_groups(chat_id))
+    if len(_chats) > CHAT_CACHE_SIZE:
+        _chats.popitem(last=False)
+    return entry
+
+def invalidate(chat_id: int) -> None:
+    # Tras cualquier escritura del chat: crear, borrar o activar grupos, añadir o quitar wallets
+    _chats.pop(chat_id, None)
+
+def get_groups(chat_id: int) -> list[tuple]:
+    # (id, group_name, notifications_enabled), ordenados por nombre
+    return [(group_id, group[0], group[1]) for group_id, group in _entry(chat_id).groups.items()]
+
+def get_group(chat_id: int, group_id: int):
+    # (group_name, notifications_enabled, track_tokens), o None si el grupo no existe o es de otro chat
+    group = _entry(chat_id).groups.get(group_id)
+    return group[:3] if group is not None else None
+
+def group_exists(chat_id: int, group_name: str) -> bool:
+    return any(group[0] == group_name for group in _entry(chat_id).groups.values())
+
+def count_group_wallets(chat_id: int, group_id: int) -> int:
+    group = _entry(chat_id).groups.get(group_id)
+    return group[3] if group is not None else 0
+
+def wallet_exists(chat_id: int, wallet_address: str) -> bool:
+    entry = _entry(chat_id)
+    if entry.addresses is None:
+        if sum(group[3] for group in entry.groups.values()) > MAX_CACHED_ADDRESSES:
+            return db_wallet_exists(chat_id, wallet_address)
+        entry.addresses = frozenset(get_chat_wallet_addresses(chat_id, MAX_CACHED_ADDRESSES))
+    return wallet_address in entry.addresses
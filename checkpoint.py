@@ -0,0 +1,111 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from config import CHECKPOINT_PATH, CHECKPOINT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Punto de control del estado en memoria del proceso en un JSON comprimido. Cada fuente registrada
+# aporta una sección con snapshot() y la recupera con restore(estado, segundos transcurridos), así
+# un reinicio retoma los saldos, las firmas y el calendario de sondeo en lugar de empezar en frío.
+
+# Cambia si el formato deja de ser compatible; un punto de control de otra versión se ignora
+CHECKPOINT_VERSION = 1
+
+def save_checkpoint(path: str, sections: dict) -> None:
+    # Escritura atómica: un corte a mitad deja intacto el punto de control anterior
+    data = json.dumps({'version': CHECKPOINT_VERSION, 'saved_at': time.time(), 'sections': sections},
+                      separators=(',', ':')).encode()
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=1) as f:
+            f.write(data)
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path: str):
+    # Devuelve (secciones, segundos desde que se guardó), o None si no hay un punto de control válido
+    try:
+        with gzip.open(path, 'rb') as f:
+            checkpoint = json.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError) as e:
+        logger.warning(f'Punto de control {path} ilegible; se arranca en frío: {str(e)}')
+        return None
+    if checkpoint.get('version') != CHECKPOINT_VERSION:
+        logger.warning(f'Punto de control {path} con versión {checkpoint.get("version")}; se arranca en frío')
+        return None
+    return checkpoint['sections'], max(0.0, time.time() - checkpoint['saved_at'])
+
+class Checkpointer:
+    def __init__(self, path: str = CHECKPOINT_PATH, interval: float = CHECKPOINT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._sources = {}      # nombre -> (fuente, solo al apagar)
+        # Eventos que deben marcarse antes de escribir nada: hasta entonces el punto de control del disco
+        # es mejor que el estado en memoria, y un arranque fallido no lo sobrescribe
+        self._ready = []
+        # Se restauraron secciones de solo al apagar: el primer guardado las quita del disco para que una caída
+        # no las vuelva a aplicar
+        self._restored_final = False
+
+    def register(self, name: str, source, final_only: bool = False, ready: asyncio.Event = None) -> None:
+        # final_only: la sección solo se guarda al apagar (p. ej. notificaciones sin enviar, que
+        # tras una caída ya podrían haberse enviado y se duplicarían). ready: evento que marca cuándo
+        # el estado de la fuente está completo (p. ej. el primer ciclo del monitor)
+        self._sources[name] = (source, final_only)
+        if ready is not None:
+            self._ready.append(ready)
+
+    def restore(self) -> None:
+        if not self.path:
+            return
+        loaded = load_checkpoint(self.path)
+        if loaded is None:
+            return
+        sections, elapsed = loaded
+        for name, (source, _) in self._sources.items():
+            if name in sections:
+                source.restore(sections[name], elapsed)
+        logger.info(f'Estado restaurado desde {self.path} (guardado hace {elapsed:.0f}s)')
+        self._restored_final = any(final_only and name in sections for name, (_, final_only) in self._sources.items())
+
+    def _can_save(self) -> bool:
+        if all(ready.is_set() for ready in self._ready):
+            return True
+        logger.info(f'No se guarda el punto de control {self.path}: el estado aún no se ha cargado')
+        return False
+
+    def _snapshot(self, final: bool) -> dict:
+        return {name: source.snapshot() for name, (source, final_only) in self._sources.items() if final or not final_only}
+
+    def save_now(self, final: bool = False) -> None:
+        if not self.path or not self._can_save():
+            return
+        try:
+            save_checkpoint(self.path, self._snapshot(final))
+        except OSError as e:
+            logger.error(f'No se pudo guardar el punto de control {self.path}: {str(e)}')
+
+    async def save(self, final: bool = False) -> None:
+        # La instantánea se toma en el bucle (estado coherente); la serialización y la escritura, en un hilo
+        if not self.path or not self._can_save():
+            return
+        sections = self._snapshot(final)
+        try:
+            await asyncio.to_thread(save_checkpoint, self.path, sections)
+        except OSError as e:
+            logger.error(f'No se pudo guardar el punto de control {self.path}: {str(e)}')
+
+    async def run(self) -> None:
+        await asyncio.gather(*(ready.wait() for ready in self._ready))
+        if self._restored_final:
+            await self.save()
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.save()
@@ -0,0 +1,154 @@
+import os
+from dotenv import load_dotenv
+
+# Cargar las variables de entorno desde el archivo .env
+load_dotenv()
+
+# Endpoint JSON-RPC de Solana
+SOLANA_RPC_URL = os.getenv('SOLANA_RPC_URL', 'https://api.mainnet-beta.solana.com')
+
+# Pool de endpoints JSON-RPC separados por comas; cada uno admite un límite propio con 'url|peticiones_por_segundo'
+SOLANA_RPC_URLS = os.getenv('SOLANA_RPC_URLS', SOLANA_RPC_URL)
+
+# Límite por defecto de peticiones por segundo de cada endpoint
+RPC_ENDPOINT_RPS = float(os.getenv('RPC_ENDPOINT_RPS', '10'))
+
+# Segundos sin respuesta tras los que se lanza una petición de respaldo a otro endpoint
+RPC_HEDGE_DELAY = float(os.getenv('RPC_HEDGE_DELAY', '1.5'))
+
+# Endpoints distintos que se prueban como máximo por petición
+RPC_MAX_ATTEMPTS = int(os.getenv('RPC_MAX_ATTEMPTS', '3'))
+
+# Direcciones por petición getMultipleAccounts (el RPC admite un máximo de 100)
+RPC_BATCH_SIZE = int(os.getenv('RPC_BATCH_SIZE', '100'))
+
+# Peticiones de lote en vuelo simultáneamente
+RPC_CONCURRENCY = int(os.getenv('RPC_CONCURRENCY', '4'))
+
+# Tiempo máximo por petición RPC, en segundos
+RPC_TIMEOUT = float(os.getenv('RPC_TIMEOUT', '10'))
+
+# Conexiones keep-alive mantenidas en el pool HTTP del cliente RPC
+RPC_MAX_CONNECTIONS = int(os.getenv('RPC_MAX_CONNECTIONS', '10'))
+
+# Modo de monitoreo: 'polling' (getMultipleAccounts periódico) o 'websocket' (accountSubscribe)
+MONITOR_MODE = os.getenv('MONITOR_MODE', 'polling')
+
+# Endpoint PubSub (WebSocket) de Solana
+SOLANA_WS_URL = os.getenv('SOLANA_WS_URL', 'wss://api.mainnet-beta.solana.com')
+
+# Conexiones WebSocket entre las que se reparten las suscripciones
+PUBSUB_CONNECTIONS = int(os.getenv('PUBSUB_CONNECTIONS', '4'))
+
+# Cada cuántos segundos se reconcilian las suscripciones en memoria con las wallets guardadas; los cambios
+# hechos desde el bot llegan al monitor al momento y esta pasada solo recoge los que no pasan por él
+SUBSCRIPTION_REFRESH_INTERVAL = float(os.getenv('SUBSCRIPTION_REFRESH_INTERVAL', '300'))
+
+# Ruta de la base de datos SQLite
+DB_PATH = os.getenv('DB_PATH', 'wallets.db')
+
+# Intervalo de sondeo de una wallet con actividad reciente, en segundos
+POLL_MIN_INTERVAL = float(os.getenv('POLL_MIN_INTERVAL', '10'))
+
+# Techo del intervalo de sondeo para wallets inactivas, en segundos
+POLL_MAX_INTERVAL = float(os.getenv('POLL_MAX_INTERVAL', '300'))
+
+# Factor de crecimiento del intervalo cada vez que una wallet no cambia
+POLL_BACKOFF = float(os.getenv('POLL_BACKOFF', '2'))
+
+# Presupuesto global de peticiones RPC por segundo del monitor
+RPC_REQUESTS_PER_SECOND = float(os.getenv('RPC_REQUESTS_PER_SECOND', '10'))
+
+# Límites de envío de Telegram: mensajes por segundo en total y por chat
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+
+# Envíos a Telegram en paralelo
+TELEGRAM_SEND_CONCURRENCY = int(os.getenv('TELEGRAM_SEND_CONCURRENCY', '8'))
+
+# Puerto del endpoint de métricas Prometheus (0 = desactivado)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+
+# Perfilar con cProfile uno de cada N ciclos del monitor (0 = desactivado) y dónde guardar los perfiles
+PROFILE_CYCLES = int(os.getenv('PROFILE_CYCLES', '0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+
+# Retención del histórico de saldos: días con puntos sin agregar y días con agregados por minuto
+# (lo más antiguo se conserva agregado por hora)
+HISTORY_RAW_RETENTION_DAYS = float(os.getenv('HISTORY_RAW_RETENTION_DAYS', '7'))
+HISTORY_MINUTE_RETENTION_DAYS = float(os.getenv('HISTORY_MINUTE_RETENTION_DAYS', '90'))
+
+# Cada cuántos segundos se ejecuta la compactación del histórico
+HISTORY_COMPACT_INTERVAL = float(os.getenv('HISTORY_COMPACT_INTERVAL', '3600'))
+
+# Procesos de monitoreo en paralelo (0 = el monitor corre dentro del proceso del bot).
+# Cada proceso tiene su propio cliente RPC, así que los límites por endpoint y el presupuesto
+# RPC_REQUESTS_PER_SECOND se aplican por proceso. Sus métricas se reenvían al proceso del bot, que las
+# sirve en METRICS_PORT con la etiqueta worker
+MONITOR_WORKERS = int(os.getenv('MONITOR_WORKERS', '0'))
+
+# Particiones por hash de dirección que se reparten los procesos de monitoreo
+MONITOR_PARTITIONS = int(os.getenv('MONITOR_PARTITIONS', '64'))
+
+# Segundos de validez de la concesión de una partición; pasado ese tiempo sin renovar, otro proceso la toma
+PARTITION_LEASE_TTL = float(os.getenv('PARTITION_LEASE_TTL', '15'))
+
+# Clasificar cada cambio de saldo leyendo sus transacciones (getSignaturesForAddress + getTransaction)
+CLASSIFY_TRANSACTIONS = os.getenv('CLASSIFY_TRANSACTIONS', '1') == '1'
+
+# Firmas nuevas que se leen como máximo por wallet y cambio
+TX_SIGNATURES_PER_CHANGE = int(os.getenv('TX_SIGNATURES_PER_CHANGE', '10'))
+
+# Transacciones analizadas que se conservan en memoria y en disco
+TX_CACHE_SIZE = int(os.getenv('TX_CACHE_SIZE', '5000'))
+TX_CACHE_MAX_ROWS = int(os.getenv('TX_CACHE_MAX_ROWS', '100000'))
+
+# Seguimiento de tokens SPL: cada cuánto se vuelven a descubrir las cuentas de token de una wallet sin
+# actividad de SOL, en segundos, y wallets cuyo descubrimiento se hace como máximo en cada ciclo
+TOKEN_DISCOVERY_INTERVAL = float(os.getenv('TOKEN_DISCOVERY_INTERVAL', '3600'))
+TOKEN_DISCOVERY_PER_CYCLE = int(os.getenv('TOKEN_DISCOVERY_PER_CYCLE', '50'))
+
+# Punto de control del estado en memoria del monitor (saldos, firmas y calendario de sondeo);
+# vacío para desactivarlo. Se guarda cada CHECKPOINT_INTERVAL segundos y al apagar
+CHECKPOINT_PATH = os.getenv('CHECKPOINT_PATH', 'monitor_state.json.gz')
+CHECKPOINT_INTERVAL = float(os.getenv('CHECKPOINT_INTERVAL', '60'))
+
+# Segundos que se espera al apagar a que termine el ciclo en curso y se envíen las notificaciones pendientes
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', '10'))
+
+# Recepción de actualizaciones de Telegram: 'polling' (getUpdates) o 'webhook' (servidor HTTP propio)
+TELEGRAM_MODE = os.getenv('TELEGRAM_MODE', 'polling')
+
+# Webhook: URL pública que se registra en Telegram (sin la ruta), dirección local de escucha, ruta y
+# secreto que Telegram envía en la cabecera X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+
+# Manejadores de actualizaciones en ejecución simultánea y actualizaciones pendientes como máximo;
+# por encima se responde 503 y Telegram reintenta más tarde
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '16'))
+WEBHOOK_MAX_PENDING = int(os.getenv('WEBHOOK_MAX_PENDING', '1000'))
+
+# Chats cuyos grupos y wallets se conservan en la caché de navegación del bot
+CHAT_CACHE_SIZE = int(os.getenv('CHAT_CACHE_SIZE', '1024'))
+
+# API de precios en USD con el formato de Jupiter Price v3 (GET ?ids=mint1,mint2), por ejemplo
+# https://lite-api.jup.ag/price/v3. Sin configurar las alertas no muestran valores en USD y no se
+# consulta ningún servicio externo
+PRICE_API_URL = os.getenv('PRICE_API_URL', '')
+
+# Un precio se usa sin más durante PRICE_TTL segundos; hasta PRICE_MAX_AGE se sigue usando mientras se
+# renueva en segundo plano, y pasado ese tiempo la alerta sale sin valor en USD
+PRICE_TTL = float(os.getenv('PRICE_TTL', '60'))
+PRICE_MAX_AGE = float(os.getenv('PRICE_MAX_AGE', '600'))
+
+# Cada cuántos segundos se renuevan en segundo plano los precios usados recientemente
+PRICE_REFRESH_INTERVAL = float(os.getenv('PRICE_REFRESH_INTERVAL', '30'))
+
+# Mints por petición a la API de precios y tiempo máximo de cada petición, en segundos
+PRICE_BATCH_SIZE = int(os.getenv('PRICE_BATCH_SIZE', '50'))
+PRICE_TIMEOUT = float(os.getenv('PRICE_TIMEOUT', '5'))
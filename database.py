@@ -1,63 +1,193 @@
-import sqlite3
-from solders.pubkey import Pubkey
-import requests
 import re
+from migrations import migrate
+import storage
 
 def init_db():
-    conn = sqlite3.connect('wallets.db')
-    cursor = conn.cursor()
-    cursor.execute('''CREATE TABLE IF NOT EXISTS groups (
-                        chat_id INTEGER,
-                        group_name TEXT,
-                        notifications_enabled INTEGER DEFAULT 1,
-                        PRIMARY KEY (chat_id, group_name))''')
-    cursor.execute('''CREATE TABLE IF NOT EXISTS wallets (
-                        chat_id INTEGER,
-                        group_name TEXT,
-                        wallet_address TEXT,
-                        balance REAL,
-                        tag TEXT,
-                        PRIMARY KEY (chat_id, group_name, wallet_address))''')
-    conn.commit()
-    conn.close()
-
-def save_group(chat_id, group_name):
-    conn = sqlite3.connect('wallets.db')
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO groups (chat_id, group_name) VALUES (?, ?)', (chat_id, group_name))
-    conn.commit()
-    conn.close()
-
-def save_wallet(chat_id, group_name, wallet_address, balance, tag=None):
-    conn = sqlite3.connect('wallets.db')
-    cursor = conn.cursor()
-    cursor.execute('INSERT OR REPLACE INTO wallets (chat_id, group_name, wallet_address, balance, tag) VALUES (?, ?, ?, ?, ?)',
-                   (chat_id, group_name, wallet_address, balance, tag))
-    conn.commit()
-    conn.close()
-
-def get_solana_balance(wallet_address: str) -> float:
-    url = 'https://api.mainnet-beta.solana.com'
-    headers = {'Content-Type': 'application/json'}
-    params = {
-        "jsonrpc": "2.0",
-        "id": 1,
-        "method": "getBalance",
-        "params": [wallet_address],
-    }
-    try:
-        response = requests.post(url, json=params, headers=headers)
-        data = response.json()
-        if 'result' in data and 'value' in data['result']:
-            balance = data['result']['value'] / (10**9)  # Convertir lamports a SOL
-            return balance
-        else:
-            return -1  # Indica que no se pudo obtener el saldo
-    except Exception as e:
-        print(f'Error al obtener el saldo: {str(e)}')
-        return -1
+    migrate()
+
+def save_group(chat_id, group_name) -> int:
+    # Devuelve el id del grupo creado
+    with storage.transaction() as conn:
+        return conn.execute('INSERT INTO groups (chat_id, group_name) VALUES (?, ?)', (chat_id, group_name)).lastrowid
+
+def save_wallet(group_id, wallet_address, lamports, tag=None):
+    with storage.transaction() as conn:
+        conn.execute('INSERT OR REPLACE INTO wallets (group_id, wallet_address, lamports, tag) VALUES (?, ?, ?, ?)',
+                     (group_id, wallet_address, lamports, tag))
+
+def save_wallets(group_id, rows):
+    # rows: (wallet_address, lamports, tag); una sola transacción. Si la wallet ya estaba en el
+    # grupo se actualiza su saldo y se conserva el tag anterior cuando no se indica uno nuevo.
+    with storage.transaction() as conn:
+        conn.executemany('''INSERT INTO wallets (group_id, wallet_address, lamports, tag) VALUES (?, ?, ?, ?)
+                            ON CONFLICT (group_id, wallet_address)
+                            DO UPDATE SET lamports = excluded.lamports, tag = COALESCE(excluded.tag, wallets.tag)''',
+                         [(group_id, wallet_address, lamports, tag) for wallet_address, lamports, tag in rows])
+
+def get_chat_groups(chat_id) -> list[tuple]:
+    # (id, group_name, notifications_enabled, track_tokens, número de wallets) de cada grupo del chat
+    return storage.fetchall('''
+        SELECT g.id, g.group_name, g.notifications_enabled, g.track_tokens, COUNT(w.wallet_address)
+        FROM groups g
+        LEFT JOIN wallets w ON w.group_id = g.id
+        WHERE g.chat_id = ?
+        GROUP BY g.id
+        ORDER BY g.group_name
+    ''', (chat_id,))
+
+def get_chat_wallet_addresses(chat_id, limit) -> list[str]:
+    # Direcciones distintas de todos los grupos del chat, hasta `limit`
+    rows = storage.fetchall('''
+        SELECT DISTINCT w.wallet_address FROM groups g JOIN wallets w ON w.group_id = g.id
+        WHERE g.chat_id = ? LIMIT ?
+    ''', (chat_id, limit))
+    return [row[0] for row in rows]
+
+def toggle_group_notifications(chat_id, group_id):
+    # Devuelve el nuevo estado, o None si el grupo no existe
+    with storage.transaction() as conn:
+        row = conn.execute('SELECT notifications_enabled FROM groups WHERE id = ? AND chat_id = ?', (group_id, chat_id)).fetchone()
+        if row is None:
+            return None
+        new_status = 0 if row[0] else 1
+        conn.execute('UPDATE groups SET notifications_enabled = ? WHERE id = ?', (new_status, group_id))
+    return new_status
+
+def toggle_group_tokens(chat_id, group_id):
+    # Devuelve el nuevo estado del seguimiento de tokens, o None si el grupo no existe
+    with storage.transaction() as conn:
+        row = conn.execute('SELECT track_tokens FROM groups WHERE id = ? AND chat_id = ?', (group_id, chat_id)).fetchone()
+        if row is None:
+            return None
+        new_status = 0 if row[0] else 1
+        conn.execute('UPDATE groups SET track_tokens = ? WHERE id = ?', (new_status, group_id))
+    return new_status
+
+def remove_group(chat_id, group_id):
+    # Las wallets del grupo se borran en cascada
+    with storage.transaction() as conn:
+        conn.execute('DELETE FROM groups WHERE id = ? AND chat_id = ?', (group_id, chat_id))
+
+def get_group_wallets(group_id) -> list[tuple]:
+    return storage.fetchall('SELECT wallet_address, lamports, tag FROM wallets WHERE group_id = ?', (group_id,))
+
+def get_group_wallet_page(group_id, after=None, limit=10) -> list[tuple]:
+    # Paginación por clave: la página empieza tras la última dirección de la anterior y recorre la clave primaria
+    return storage.fetchall('''
+        SELECT wallet_address, lamports, tag FROM wallets
+        WHERE group_id = ? AND wallet_address > ?
+        ORDER BY wallet_address LIMIT ?
+    ''', (group_id, after or '', limit))
+
+def get_group_wallet_keys(group_id, after=None, limit=10) -> list[str]:
+    # Solo las direcciones, para avanzar páginas sin leer saldos ni tags
+    rows = storage.fetchall('''
+        SELECT wallet_address FROM wallets
+        WHERE group_id = ? AND wallet_address > ?
+        ORDER BY wallet_address LIMIT ?
+    ''', (group_id, after or '', limit))
+    return [row[0] for row in rows]
+
+def remove_wallets(group_id, wallet_addresses):
+    # Las reglas de alerta propias de cada wallet se borran con ella
+    rows = [(group_id, wallet_address) for wallet_address in wallet_addresses]
+    with storage.transaction() as conn:
+        conn.executemany('DELETE FROM wallets WHERE group_id = ? AND wallet_address = ?', rows)
+        conn.executemany("DELETE FROM alert_rules WHERE group_id = ? AND wallet_address = ? AND wallet_address != ''", rows)
+
+def wallet_exists(chat_id, wallet_address) -> bool:
+    return storage.fetchone('''
+        SELECT 1 FROM wallets w JOIN groups g ON g.id = w.group_id
+        WHERE w.wallet_address = ? AND g.chat_id = ?
+    ''', (wallet_address, chat_id)) is not None
+
+def wallet_in_group(group_id, wallet_address) -> bool:
+    return storage.fetchone('SELECT 1 FROM wallets WHERE group_id = ? AND wallet_address = ?',
+                            (group_id, wallet_address)) is not None
+
+def set_wallet_tag(chat_id, wallet_address, tag):
+    with storage.transaction() as conn:
+        conn.execute('''UPDATE wallets SET tag = ?
+                        WHERE wallet_address = ? AND group_id IN (SELECT id FROM groups WHERE chat_id = ?)''',
+                     (tag, wallet_address, chat_id))
+
+def get_subscription_rows(group_id=None) -> list[tuple]:
+    # Las suscripciones con notificaciones activas (todas o las de un grupo) en una sola consulta, con su
+    # regla de alerta (la de la wallet y, campo a campo, la del grupo para lo que la wallet no fija)
+    return storage.fetchall(f'''
+        SELECT w.wallet_address, g.chat_id, g.id, g.group_name, w.tag, w.lamports, g.track_tokens,
+               COALESCE(wr.change_lamports, gr.change_lamports), COALESCE(wr.change_percent, gr.change_percent),
+               COALESCE(wr.below_lamports, gr.below_lamports), COALESCE(wr.above_lamports, gr.above_lamports),
+               COALESCE(wr.cooldown_seconds, gr.cooldown_seconds)
+        FROM groups g
+        JOIN wallets w ON w.group_id = g.id
+        LEFT JOIN alert_rules gr ON gr.group_id = g.id AND gr.wallet_address = ''
+        LEFT JOIN alert_rules wr ON wr.group_id = g.id AND wr.wallet_address = w.wallet_address
+        WHERE g.notifications_enabled = 1{' AND g.id = ?' if group_id is not None else ''}
+    ''', (group_id,) if group_id is not None else ())
+
+ALERT_RULE_FIELDS = ('change_lamports', 'change_percent', 'below_lamports', 'above_lamports', 'cooldown_seconds')
+
+def get_alert_rules(group_id) -> list[tuple]:
+    # (wallet_address, change_lamports, change_percent, below_lamports, above_lamports, cooldown_seconds);
+    # la regla del grupo tiene wallet_address = '' y sale primero
+    return storage.fetchall(f'SELECT wallet_address, {", ".join(ALERT_RULE_FIELDS)} FROM alert_rules WHERE group_id = ? ORDER BY wallet_address',
+                            (group_id,))
+
+def set_alert_rule(group_id, wallet_address, values):
+    # values: campo -> valor (None lo deja heredado); solo se modifican los campos indicados
+    fields = [field for field in ALERT_RULE_FIELDS if field in values]
+    with storage.transaction() as conn:
+        conn.execute(f'''INSERT INTO alert_rules (group_id, wallet_address, {", ".join(fields)}) VALUES (?, ?, {", ".join("?" * len(fields))})
+                         ON CONFLICT (group_id, wallet_address) DO UPDATE SET {", ".join(f"{field} = excluded.{field}" for field in fields)}''',
+                     (group_id, wallet_address, *(values[field] for field in fields)))
+
+def remove_alert_rule(group_id, wallet_address):
+    with storage.transaction() as conn:
+        conn.execute('DELETE FROM alert_rules WHERE group_id = ? AND wallet_address = ?', (group_id, wallet_address))
+
+def update_wallet_balances(rows):
+    # rows: (lamports, group_id, wallet_address); una sola transacción para todo el lote
+    with storage.transaction() as conn:
+        conn.executemany('UPDATE wallets SET lamports = ? WHERE group_id = ? AND wallet_address = ?', rows)
+
+def get_token_accounts() -> list[tuple]:
+    # Cuentas de token de las wallets seguidas por algún grupo con tokens y notificaciones activos
+    return storage.fetchall('''
+        SELECT token_account, wallet_address, mint, amount, decimals FROM token_accounts
+        WHERE wallet_address IN (
+            SELECT w.wallet_address FROM groups g JOIN wallets w ON w.group_id = g.id
+            WHERE g.track_tokens = 1 AND g.notifications_enabled = 1)
+    ''')
+
+def update_token_accounts(upserts, deletes):
+    # upserts: (token_account, wallet_address, mint, amount, decimals); deletes: cuentas cerradas
+    with storage.transaction() as conn:
+        conn.executemany('''INSERT INTO token_accounts (token_account, wallet_address, mint, amount, decimals) VALUES (?, ?, ?, ?, ?)
+                            ON CONFLICT (token_account) DO UPDATE SET amount = excluded.amount, decimals = excluded.decimals''', upserts)
+        conn.executemany('DELETE FROM token_accounts WHERE token_account = ?', [(account,) for account in deletes])
+
+def update_token_balances(rows):
+    # rows: (wallet_address, mint, amount, decimals); los saldos a cero se borran
+    with storage.transaction() as conn:
+        conn.executemany('''INSERT INTO token_balances (wallet_address, mint, amount, decimals) VALUES (?, ?, ?, ?)
+                            ON CONFLICT (wallet_address, mint) DO UPDATE SET amount = excluded.amount, decimals = excluded.decimals''',
+                         [row for row in rows if row[2]])
+        conn.executemany('DELETE FROM token_balances WHERE wallet_address = ? AND mint = ?',
+                         [(wallet_address, mint) for wallet_address, mint, amount, _ in rows if not amount])
+
+def count_wallet_tokens(wallet_addresses) -> dict[str, int]:
+    # Número de tokens con saldo de cada wallet
+    if not wallet_addresses:
+        return {}
+    rows = storage.fetchall(
+        f'SELECT wallet_address, COUNT(*) FROM token_balances WHERE wallet_address IN ({",".join("?" * len(wallet_addresses))}) GROUP BY wallet_address',
+        tuple(wallet_addresses))
+    return dict(rows)
 
 def is_valid_solana_wallet(wallet_address: str) -> bool:
+    # solders se importa al validar la primera dirección: el monitor y sus procesos no lo necesitan
+    from solders.pubkey import Pubkey
     try:
         Pubkey.from_string(wallet_address)
         return True
@@ -0,0 +1,132 @@
+import typing
+from collections import OrderedDict
+from chat_cache import get_group, count_group_wallets
+from database import get_group_wallet_page, get_group_wallet_keys, count_wallet_tokens
+from rpc import LAMPORTS_PER_SOL
+
+if typing.TYPE_CHECKING:
+    from telegram import InlineKeyboardMarkup
+
+# Vista paginada de un grupo: un único renderizador para el menú y las respuestas a mensajes.
+# Las páginas renderizadas se guardan en caché por (chat, grupo, página) y los límites de cada
+# página (la última dirección de la anterior) se recuerdan para navegar sin OFFSET.
+
+# Wallets por página; con tags de hasta 64 caracteres queda lejos del límite de 4096 de Telegram
+PAGE_SIZE = 10
+# Páginas renderizadas que se conservan como máximo
+MAX_CACHED_PAGES = 512
+# Grupos cuyos límites de página se recuerdan como máximo
+MAX_CACHED_CURSORS = 512
+# Longitud máxima del tag mostrado
+MAX_TAG_DISPLAY = 64
+
+# (chat_id, group_id, page) -> (texto, teclado)
+_pages = OrderedDict()
+# (chat_id, group_id) -> (total de wallets, [cursor de inicio de cada página conocida])
+_cursors = OrderedDict()
+
+def invalidate(chat_id: int, group_id: int = None, membership: bool = False) -> None:
+    # Los cambios de saldo o tag solo invalidan el texto; altas y bajas también los límites de página.
+    # Sin grupo se invalida todo el chat (p. ej. un tag se cambia por dirección en todos sus grupos)
+    for key in [key for key in _pages if key[0] == chat_id and (group_id is None or key[1] == group_id)]:
+        del _pages[key]
+    if membership:
+        for key in [key for key in _cursors if key[0] == chat_id and (group_id is None or key[1] == group_id)]:
+            del _cursors[key]
+
+def invalidate_groups(groups: set[tuple[int, int]]) -> None:
+    # Cambios de saldo de un ciclo del monitor: una sola pasada por la caché
+    for key in [key for key in _pages if key[:2] in groups]:
+        del _pages[key]
+
+def _page_cursor(chat_id: int, group_id: int, page: int):
+    # Devuelve (total, página ajustada al rango, cursor); el cursor es la última dirección de la página anterior
+    key = (chat_id, group_id)
+    if key in _cursors:
+        _cursors.move_to_end(key)
+    else:
+        _cursors[key] = (count_group_wallets(chat_id, group_id), [None])
+        if len(_cursors) > MAX_CACHED_CURSORS:
+            _cursors.popitem(last=False)
+    total, starts = _cursors[key]
+    page = max(0, min(page, (total - 1) // PAGE_SIZE))
+    # Avanzar desde la última página conocida leyendo solo las claves
+    while len(starts) <= page:
+        keys = get_group_wallet_keys(group_id, starts[-1], PAGE_SIZE)
+        if len(keys) < PAGE_SIZE:
+            break
+        starts.append(keys[-1])
+    page = min(page, len(starts) - 1)
+    return total, page, starts[page]
+
+def render_group_page(chat_id: int, group_id: int, page: int = 0) -> tuple[str, 'InlineKeyboardMarkup']:
+    # telegram se importa al renderizar: el monitor importa este módulo solo para invalidar la caché
+    from telegram import InlineKeyboardMarkup, InlineKeyboardButton
+
+    key = (chat_id, group_id, page)
+    cached = _pages.get(key)
+    if cached is not None:
+        _pages.move_to_end(key)
+        return cached
+
+    group = get_group(chat_id, group_id)
+    if group is None:
+        # No se cachea: el grupo puede haberse borrado desde otro mensaje
+        return "⚠️ El grupo ya no existe.", InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Regresar", callback_data="list_groups")]])
+    group_name, _, track_tokens = group
+    tokens_button = [InlineKeyboardButton("🪙 Dejar de seguir tokens" if track_tokens else "🪙 Seguir tokens",
+                                          callback_data=f"toggle_tokens_{group_id}")]
+
+    # Las páginas se guardan con el número ya ajustado: una petición fuera de rango reutiliza la última
+    total, page, cursor = _page_cursor(chat_id, group_id, page)
+    key = (chat_id, group_id, page)
+    cached = _pages.get(key)
+    if cached is not None:
+        _pages.move_to_end(key)
+        return cached
+    wallets = get_group_wallet_page(group_id, cursor, PAGE_SIZE) if total else []
+
+    if wallets:
+        page_count = (total + PAGE_SIZE - 1) // PAGE_SIZE
+        token_counts = count_wallet_tokens([wallet for wallet, _, _ in wallets]) if track_tokens else {}
+        lines = [f"📂 **Grupo: {group_name}**\n\n"]
+        for wallet, lamports, tag in wallets:
+            balance = (lamports or 0) / LAMPORTS_PER_SOL
+            tag = tag[:MAX_TAG_DISPLAY] if tag else tag
+            lines.append(
+                f"💳 **Wallet**: `{wallet}`\n"
+                f"💰 **Balance**: {balance:.9f} SOL\n"
+                + (f"🪙 **Tokens**: {token_counts.get(wallet, 0)}\n" if track_tokens else "") +
+                f"🏷️ **Tag**: `{tag}`\n"
+                f"🔧 `/edit_tag {wallet}`\n\n"
+            )
+        if page_count > 1:
+            lines.append(f"📄 Página {page + 1}/{page_count} · {total} wallets")
+        message = "".join(lines)
+
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton("⬅️ Anterior", callback_data=f"group_page_{page - 1}_{group_id}"))
+        if page < page_count - 1:
+            navigation.append(InlineKeyboardButton("Siguiente ➡️", callback_data=f"group_page_{page + 1}_{group_id}"))
+        buttons = [navigation] if navigation else []
+        buttons += [
+            [InlineKeyboardButton("➕ Agregar Wallet(s)", callback_data=f"add_wallet_{group_id}")],
+            [InlineKeyboardButton("🗑️ Eliminar Wallet(s)", callback_data=f"remove_wallet_{group_id}")],
+            tokens_button,
+            [InlineKeyboardButton("🔙 Regresar", callback_data="list_groups")]
+        ]
+        keyboard = InlineKeyboardMarkup(buttons)
+    else:
+        message = f"📂 **Grupo: {group_name}**\n\n🚫 Este grupo no contiene wallets actualmente."
+
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("➕ Agregar Wallet", callback_data=f"add_wallet_{group_id}")],
+            tokens_button,
+            [InlineKeyboardButton("🔙 Regresar", callback_data="list_groups")]
+        ])
+
+    _pages[key] = (message, keyboard)
+    if len(_pages) > MAX_CACHED_PAGES:
+        _pages.popitem(last=False)
+    return message, keyboard
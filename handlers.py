@@ -1,11 +1,34 @@
 import logging
-import sqlite3
+import re
+import time
+from datetime import datetime
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.error import TelegramError
 from telegram.ext import CallbackContext
-from database import save_group, save_wallet, get_solana_balance, is_valid_solana_wallet, is_valid_group_name
+from database import (
+    save_group, toggle_group_notifications, toggle_group_tokens, remove_group, remove_wallets, set_wallet_tag,
+    get_alert_rules, set_alert_rule, remove_alert_rule, wallet_in_group, is_valid_solana_wallet, is_valid_group_name
+)
+from chat_cache import get_group, get_groups, group_exists, count_group_wallets, wallet_exists
+import chat_cache
+import registry
+from group_view import render_group_page, invalidate
+from history import query_range, downsample
+from importer import parse_wallet_entries, import_wallets, MAX_IMPORT_FILE_SIZE
+from rpc import LAMPORTS_PER_SOL
 
 logger = logging.getLogger(__name__)
 
+# Wallets que se listan como máximo en el resumen de una importación
+MAX_LISTED_WALLETS = 15
+
+def parse_group_id(callback_data: str) -> int:
+    # callback_data: <acción>_<id del grupo>; los botones anteriores a los ids llevaban el nombre
+    try:
+        return int(callback_data.rsplit("_", 1)[-1])
+    except ValueError:
+        return None
+
 async def error_handler(update: Update, context: CallbackContext) -> None:
     logger.error(msg="Exception while handling an update:", exc_info=context.error)
     if update.callback_query:
@@ -50,16 +73,11 @@ async def handle_group_name_input(update: Update, context: CallbackContext) -> N
             )
             return
 
-        conn = sqlite3.connect('wallets.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM groups WHERE chat_id = ? AND group_name = ?', (chat_id, group_name))
-        exists = cursor.fetchone()[0]
-        conn.close()
-
-        if exists:
+        if group_exists(chat_id, group_name):
             await update.message.reply_text(f"⚠️ El grupo '{group_name}' ya existe.")
         else:
             save_group(chat_id, group_name)
+            chat_cache.invalidate(chat_id)
             await update.message.reply_text(f"✅ Grupo '{group_name}' creado exitosamente.")
         await list_groups(update, context)
         context.user_data["state"] = None
@@ -68,22 +86,18 @@ async def list_groups(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
     chat_id = query.message.chat_id
 
-    conn = sqlite3.connect('wallets.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT group_name, notifications_enabled FROM groups WHERE chat_id = ?', (chat_id,))
-    groups = cursor.fetchall()
-    conn.close()
+    groups = get_groups(chat_id)
 
     if groups:
         buttons = []
-        for group_name, notifications_enabled in groups:
+        for group_id, group_name, notifications_enabled in groups:
             status = "🟢" if notifications_enabled else "🔴"
             buttons.append([
-                InlineKeyboardButton(f"🗂 {group_name} ({status})", callback_data=f"view_group_{group_name}"),
-                InlineKeyboardButton("❌ Eliminar", callback_data=f"delete_group_{group_name}"),
+                InlineKeyboardButton(f"🗂 {group_name} ({status})", callback_data=f"view_group_{group_id}"),
+                InlineKeyboardButton("❌ Eliminar", callback_data=f"delete_group_{group_id}"),
                 InlineKeyboardButton(
                     "🔕 Desactivar" if notifications_enabled else "🔔 Activar",
-                    callback_data=f"toggle_notifications_{group_name}"
+                    callback_data=f"toggle_notifications_{group_id}"
                 ),
             ])
         buttons.append([InlineKeyboardButton("🔙 Regresar", callback_data="main_menu")])
@@ -105,26 +119,40 @@ async def list_groups(update: Update, context: CallbackContext) -> None:
 async def toggle_notifications(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
     chat_id = query.message.chat_id
-    group_name = query.data.split("_", 2)[-1]
+    group_id = parse_group_id(query.data)
+    group = get_group(chat_id, group_id)
 
-    conn = sqlite3.connect('wallets.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT notifications_enabled FROM groups WHERE chat_id = ? AND group_name = ?', (chat_id, group_name))
-    current_status = cursor.fetchone()
-    
-    if current_status is not None:
-        new_status = 0 if current_status[0] else 1
-        cursor.execute('UPDATE groups SET notifications_enabled = ? WHERE chat_id = ? AND group_name = ?', (new_status, chat_id, group_name))
-        conn.commit()
-        conn.close()
-        
+    new_status = toggle_group_notifications(chat_id, group_id) if group else None
+    chat_cache.invalidate(chat_id)
+
+    if new_status is not None:
+        registry.publish('group_changed', group_id)
         status_msg = "🔔 Notificaciones activadas" if new_status else "🔕 Notificaciones desactivadas"
-        await query.answer(f"{status_msg} para el grupo '{group_name}'.")
+        await query.answer(f"{status_msg} para el grupo '{group[0]}'.")
         await list_groups(update, context)
     else:
-        conn.close()
         await query.answer("⚠️ El grupo no existe.")
 
+async def toggle_tokens(update: Update, context: CallbackContext) -> None:
+    query = update.callback_query
+    chat_id = query.message.chat_id
+    group_id = parse_group_id(query.data)
+    group = get_group(chat_id, group_id)
+
+    new_status = toggle_group_tokens(chat_id, group_id) if group else None
+    chat_cache.invalidate(chat_id)
+
+    if new_status is not None:
+        registry.publish('group_changed', group_id)
+        status_msg = "🪙 Seguimiento de tokens activado" if new_status else "🪙 Seguimiento de tokens desactivado"
+        await query.answer(f"{status_msg} para el grupo '{group[0]}'.")
+        invalidate(chat_id, group_id)
+        message, keyboard = render_group_page(chat_id, group_id)
+        await query.edit_message_text(message, reply_markup=keyboard, parse_mode="Markdown")
+    else:
+        await query.answer("⚠️ El grupo no existe.")
+        await list_groups(update, context)
+
 async def main_menu(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
     await query.answer()
@@ -133,22 +161,17 @@ async def main_menu(update: Update, context: CallbackContext) -> None:
 async def remove_wallet(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
     chat_id = query.message.chat_id
-    group_name = query.data.split("_", 2)[-1]
-
-    conn = sqlite3.connect('wallets.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT wallet_address FROM wallets WHERE chat_id = ? AND group_name = ?', (chat_id, group_name))
-    wallets = cursor.fetchall()
-    conn.close()
+    group_id = parse_group_id(query.data)
+    group = get_group(chat_id, group_id)
 
-    if wallets:
+    if group and count_group_wallets(chat_id, group_id):
         await query.answer()
         await query.edit_message_text(
-            f"Envía las direcciones de wallet que deseas eliminar del grupo `{group_name}`, separadas por espacios.",
+            f"Envía las direcciones de wallet que deseas eliminar del grupo `{group[0]}`, separadas por espacios.",
             parse_mode="Markdown"
         )
         context.user_data["state"] = "awaiting_wallet_removal"
-        context.user_data["group_name"] = group_name
+        context.user_data["group_id"] = group_id
     else:
         await query.answer("No hay wallets para eliminar.")
         await query.edit_message_text("⚠️ No hay wallets en el grupo.")
@@ -171,98 +194,47 @@ async def handle_text_input(update: Update, context: CallbackContext) -> None:
 
 async def handle_wallet_removal(update: Update, context: CallbackContext) -> None:
     if context.user_data.get("state") == "awaiting_wallet_removal":
-        group_name = context.user_data.pop("group_name", None)
+        group_id = context.user_data.pop("group_id", None)
         wallet_addresses = update.message.text.strip().split()
         chat_id = update.message.chat_id
+        group = get_group(chat_id, group_id)
+        context.user_data["state"] = None
+        if group is None:
+            await update.message.reply_text("⚠️ El grupo ya no existe.")
+            return
 
-        conn = sqlite3.connect('wallets.db')
-        cursor = conn.cursor()
-
-        for wallet_address in wallet_addresses:
-            cursor.execute('DELETE FROM wallets WHERE chat_id = ? AND group_name = ? AND wallet_address = ?', (chat_id, group_name, wallet_address))
-
-        conn.commit()
-        conn.close()
+        remove_wallets(group_id, wallet_addresses)
+        chat_cache.invalidate(chat_id)
+        registry.publish('wallets_removed', group_id, wallet_addresses)
+        invalidate(chat_id, group_id, membership=True)
 
-        await update.message.reply_text(f"✅ Wallets eliminadas del grupo `{group_name}`.")
-        await show_group_wallets(update, context, chat_id, group_name)
+        await update.message.reply_text(f"✅ Wallets eliminadas del grupo `{group[0]}`.")
+        await show_group_wallets(update, context, chat_id, group_id)
         context.user_data["state"] = None
     else:
         await update.message.reply_text("No hay wallets pendientes para eliminar.")
 
-async def show_group_wallets(update: Update, context: CallbackContext, chat_id: int, group_name: str) -> None:
-    conn = sqlite3.connect('wallets.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT wallet_address, balance, tag FROM wallets WHERE chat_id = ? AND group_name = ?', (chat_id, group_name))
-    wallets = cursor.fetchall()
-    conn.close()
-
-    if wallets:
-        message = f"📂 **Grupo: {group_name}**\n\n"
-        for wallet, balance, tag in wallets:
-            message += (
-                f"💳 **Wallet**: `{wallet}`\n"
-                f"💰 **Balance**: {balance:.9f} SOL\n"
-                f"🏷️ **Tag**: `{tag}`\n"
-                f"🔧 `/edit_tag {wallet}`\n\n"
-            )
-
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("➕ Agregar Wallet(s)", callback_data=f"add_wallet_{group_name}")],
-            [InlineKeyboardButton("🗑️ Eliminar Wallet(s)", callback_data=f"remove_wallet_{group_name}")],
-            [InlineKeyboardButton("🔙 Regresar", callback_data="list_groups")]
-        ])
-
-        await update.message.reply_text(message, reply_markup=keyboard, parse_mode="Markdown")
-    else:
-        message = f"📂 **Grupo: {group_name}**\n\n🚫 Este grupo no contiene wallets actualmente."
-
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("➕ Agregar Wallet", callback_data=f"add_wallet_{group_name}")],
-            [InlineKeyboardButton("🔙 Regresar", callback_data="list_groups")]
-        ])
-
-        await update.message.reply_text(message, reply_markup=keyboard, parse_mode="Markdown")
+async def show_group_wallets(update: Update, context: CallbackContext, chat_id: int, group_id: int) -> None:
+    message, keyboard = render_group_page(chat_id, group_id)
+    await update.message.reply_text(message, reply_markup=keyboard, parse_mode="Markdown")
 
 async def view_group(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
     chat_id = query.message.chat_id
-    group_name = query.data.split("_", 2)[-1]
-
-    conn = sqlite3.connect('wallets.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT wallet_address, balance, tag FROM wallets WHERE chat_id = ? AND group_name = ?', (chat_id, group_name))
-    wallets = cursor.fetchall()
-    conn.close()
-
-    if wallets:
-        message = f"📂 **Grupo: {group_name}**\n\n"
-        for wallet, balance, tag in wallets:
-            message += (
-                f"💳 **Wallet**: `{wallet}`\n"
-                f"💰 **Balance**: {balance:.9f} SOL\n"
-                f"🏷️ **Tag**: `{tag}`\n"
-                f"🔧 `/edit_tag {wallet}`\n\n"
-            )
-
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("➕ Agregar Wallet(s)", callback_data=f"add_wallet_{group_name}")],
-            [InlineKeyboardButton("🗑️ Eliminar Wallet(s)", callback_data=f"remove_wallet_{group_name}")],
-            [InlineKeyboardButton("🔙 Regresar", callback_data="list_groups")]
-        ])
+    await edit_group_page(query, chat_id, parse_group_id(query.data), 0)
 
-        if query.message.text != message:
-            await query.edit_message_text(message, reply_markup=keyboard, parse_mode="Markdown")
-    else:
-        message = f"📂 **Grupo: {group_name}**\n\n🚫 Este grupo no contiene wallets actualmente."
-
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("➕ Agregar Wallet", callback_data=f"add_wallet_{group_name}")],
-            [InlineKeyboardButton("🔙 Regresar", callback_data="list_groups")]
-        ])
+async def group_page(update: Update, context: CallbackContext) -> None:
+    query = update.callback_query
+    chat_id = query.message.chat_id
+    # callback_data: group_page_<página>_<id del grupo>
+    page = int(query.data.split("_")[2])
+    await edit_group_page(query, chat_id, parse_group_id(query.data), page)
 
-        if query.message.text != message:
-            await query.edit_message_text(message, reply_markup=keyboard, parse_mode="Markdown")
+async def edit_group_page(query, chat_id: int, group_id: int, page: int) -> None:
+    message, keyboard = render_group_page(chat_id, group_id, page)
+    await query.answer()
+    if query.message.text != message:
+        await query.edit_message_text(message, reply_markup=keyboard, parse_mode="Markdown")
 
 async def edit_tag(update: Update, context: CallbackContext) -> None:
     chat_id = update.message.chat_id
@@ -274,13 +246,7 @@ async def edit_tag(update: Update, context: CallbackContext) -> None:
 
     wallet_address = args[0]
 
-    conn = sqlite3.connect('wallets.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT tag FROM wallets WHERE chat_id = ? AND wallet_address = ?', (chat_id, wallet_address))
-    existing_tag = cursor.fetchone()
-    conn.close()
-
-    if existing_tag:
+    if wallet_exists(chat_id, wallet_address):
         context.user_data["state"] = "editing_tag_wallet"
         context.user_data["wallet_address"] = wallet_address
         await update.message.reply_text(f"Envía el nuevo tag para la wallet: `{wallet_address}`")
@@ -293,12 +259,9 @@ async def set_tag(update: Update, context: CallbackContext) -> None:
         wallet_address = context.user_data.pop("wallet_address")
         new_tag = update.message.text.strip()
 
-        conn = sqlite3.connect('wallets.db')
-        cursor = conn.cursor()
-        cursor.execute('UPDATE wallets SET tag = ? WHERE chat_id = ? AND wallet_address = ?', (new_tag, chat_id, wallet_address))
-
-        conn.commit()
-        conn.close()
+        set_wallet_tag(chat_id, wallet_address, new_tag)
+        invalidate(chat_id)
+        registry.publish('tag_set', chat_id, wallet_address, new_tag)
 
         await update.message.reply_text(f"✅ El tag para la wallet `{wallet_address}` ha sido actualizado a: `{new_tag}`.")
         context.user_data["state"] = None
@@ -308,70 +271,258 @@ async def set_tag(update: Update, context: CallbackContext) -> None:
 async def add_wallet(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
     chat_id = query.message.chat_id
-    group_name = query.data.split("_", 2)[-1]
-
-    conn = sqlite3.connect('wallets.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT group_name FROM groups WHERE chat_id = ?', (chat_id,))
-    groups = cursor.fetchall()
-    conn.close()
+    group_id = parse_group_id(query.data)
+    group = get_group(chat_id, group_id)
 
-    if group_name in [group[0] for group in groups]:
+    if group:
         await query.answer()
         await query.edit_message_text(
-            f"Envía la dirección de la wallet para agregarla al grupo `{group_name}`.",
+            f"Envía las direcciones de wallet para agregarlas al grupo `{group[0]}`, separadas por espacios, "
+            f"o un archivo .csv/.txt con una wallet por línea (`dirección,tag`).",
             parse_mode="Markdown"
         )
         context.user_data["state"] = "awaiting_wallet"
-        context.user_data["group_name"] = group_name
+        context.user_data["group_id"] = group_id
     else:
         await query.answer("El grupo no existe.")
         await query.edit_message_text("⚠️ El grupo ya no existe.")
 
 async def handle_wallet_input(update: Update, context: CallbackContext) -> None:
     if context.user_data.get("state") == "awaiting_wallet":
-        group_name = context.user_data.pop("group_name")
-        wallet_addresses = update.message.text.strip().split()
+        group_id = context.user_data.pop("group_id")
         chat_id = update.message.chat_id
-
-        added_wallets = []
-        invalid_wallets = []
-        failed_wallets = []
-
-        for wallet_address in wallet_addresses:
-            if is_valid_solana_wallet(wallet_address):
-                balance = get_solana_balance(wallet_address)
-                if balance != -1:
-                    save_wallet(chat_id, group_name, wallet_address, balance)
-                    added_wallets.append(wallet_address)
-                else:
-                    failed_wallets.append(wallet_address)
-            else:
-                invalid_wallets.append(wallet_address)
-
-        response = ""
-        if added_wallets:
-            response += f"✅ **Wallets añadidas al grupo `{group_name}`**:\n" + "\n".join(f"- `{wallet}`" for wallet in added_wallets) + "\n"
-        if invalid_wallets:
-            response += "⚠️ **Direcciones no válidas:**\n" + "\n".join(f"- `{wallet}`" for wallet in invalid_wallets) + "\n"
-        if failed_wallets:
-            response += "⚠️ **Error al obtener saldo:**\n" + "\n".join(f"- `{wallet}`" for wallet in failed_wallets) + "\n"
-
-        await update.message.reply_text(response, parse_mode="Markdown")
-        await show_group_wallets(update, context, chat_id, group_name)
         context.user_data["state"] = None
+        await run_wallet_import(update, context, chat_id, group_id, parse_wallet_entries(update.message.text))
+
+async def handle_document(update: Update, context: CallbackContext) -> None:
+    if context.user_data.get("state") != "awaiting_wallet":
+        await update.message.reply_text("⚠️ Para importar wallets desde un archivo, primero pulsa «➕ Agregar Wallet(s)» en un grupo.")
+        return
+
+    document = update.message.document
+    file_name = (document.file_name or "").lower()
+    if not file_name.endswith((".csv", ".txt")):
+        await update.message.reply_text("⚠️ Solo se admiten archivos .csv o .txt con una wallet por línea (`dirección,tag`).", parse_mode="Markdown")
+        return
+    if document.file_size and document.file_size > MAX_IMPORT_FILE_SIZE:
+        await update.message.reply_text("⚠️ El archivo es demasiado grande (máximo 1 MB).")
+        return
+
+    group_id = context.user_data.pop("group_id")
+    chat_id = update.message.chat_id
+    context.user_data["state"] = None
+
+    telegram_file = await document.get_file()
+    content = await telegram_file.download_as_bytearray()
+    text = bytes(content).decode("utf-8", errors="replace")
+    await run_wallet_import(update, context, chat_id, group_id, parse_wallet_entries(text))
+
+async def run_wallet_import(update: Update, context: CallbackContext, chat_id: int, group_id: int, entries: list) -> None:
+    if not entries:
+        await update.message.reply_text("⚠️ No se encontraron direcciones de wallet en el mensaje.")
+        return
+    group = get_group(chat_id, group_id)
+    if group is None:
+        await update.message.reply_text("⚠️ El grupo ya no existe.")
+        return
+    group_name = group[0]
+
+    # Un único mensaje de estado que se edita con el progreso
+    status = await update.message.reply_text(f"⏳ Importando {len(entries)} wallets al grupo `{group_name}`...", parse_mode="Markdown")
+
+    async def report_progress(done: int, total: int) -> None:
+        try:
+            await status.edit_text(f"⏳ Obteniendo saldos: {done}/{total} wallets...")
+        except TelegramError as e:
+            logger.warning(f'No se pudo actualizar el progreso de la importación: {str(e)}')
+
+    added_wallets, invalid_wallets, failed_wallets = await import_wallets(group_id, entries, report_progress)
+    chat_cache.invalidate(chat_id)
+    if added_wallets:
+        registry.publish('wallets_added', group_id)
+    invalidate(chat_id, group_id, membership=True)
+
+    response = f"✅ **{len(added_wallets)} wallets añadidas al grupo `{group_name}`**\n"
+    response += "".join(f"- `{wallet}`\n" for wallet in added_wallets[:MAX_LISTED_WALLETS])
+    if len(added_wallets) > MAX_LISTED_WALLETS:
+        response += f"... y {len(added_wallets) - MAX_LISTED_WALLETS} más\n"
+    if invalid_wallets:
+        response += f"⚠️ **{len(invalid_wallets)} direcciones no válidas:**\n" + "".join(f"- `{wallet}`\n" for wallet in invalid_wallets[:MAX_LISTED_WALLETS])
+    if failed_wallets:
+        response += f"⚠️ **Error al obtener saldo de {len(failed_wallets)} wallets:**\n" + "".join(f"- `{wallet}`\n" for wallet in failed_wallets[:MAX_LISTED_WALLETS])
+
+    await status.edit_text(response, parse_mode="Markdown")
+    await show_group_wallets(update, context, chat_id, group_id)
 
 async def delete_group(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
     chat_id = query.message.chat_id
-    group_name = query.data.split("_", 2)[-1]
+    group_id = parse_group_id(query.data)
+    group = get_group(chat_id, group_id)
+    if group is None:
+        await query.answer("⚠️ El grupo no existe.")
+        await list_groups(update, context)
+        return
+
+    remove_group(chat_id, group_id)
+    chat_cache.invalidate(chat_id)
+    registry.publish('group_removed', group_id)
+    invalidate(chat_id, group_id, membership=True)
+
+    await query.answer(f"✅ Grupo `{group[0]}` eliminado.")
+    await list_groups(update, context)
+
+HISTORY_UNITS = {'h': 3600, 'd': 86400}
+HISTORY_MAX_RANGE = 366 * 86400
+HISTORY_ROWS = 12
+
+def parse_history_range(value: str):
+    match = re.fullmatch(r"(\d+)([hd])", value.lower())
+    if not match:
+        return None
+    seconds = int(match.group(1)) * HISTORY_UNITS[match.group(2)]
+    return seconds if 0 < seconds <= HISTORY_MAX_RANGE else None
+
+async def history(update: Update, context: CallbackContext) -> None:
+    chat_id = update.message.chat_id
+    args = context.args
 
-    conn = sqlite3.connect('wallets.db')
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM groups WHERE chat_id = ? AND group_name = ?', (chat_id, group_name))
-    cursor.execute('DELETE FROM wallets WHERE chat_id = ? AND group_name = ?', (chat_id, group_name))
-    conn.commit()
-    conn.close()
+    if len(args) < 1:
+        await update.message.reply_text("⚠️ Debes proporcionar una dirección de wallet. Ejemplo: `/history <wallet_address> [24h|7d|30d]`")
+        return
+
+    wallet_address = args[0]
+    range_name = args[1] if len(args) > 1 else "24h"
+    seconds = parse_history_range(range_name)
+    if seconds is None:
+        await update.message.reply_text("⚠️ Rango no válido. Usa horas o días, por ejemplo `24h`, `7d` o `90d` (máximo un año).")
+        return
+
+    if not wallet_exists(chat_id, wallet_address):
+        await update.message.reply_text(f"⚠️ La wallet `{wallet_address}` no se encuentra en el sistema.")
+        return
+
+    end = int(time.time()) + 1
+    start = end - seconds
+    points = query_range(wallet_address, start, end)
+    if not points:
+        await update.message.reply_text(f"📭 No hay histórico para la wallet `{wallet_address}` en las últimas {range_name}.", parse_mode="Markdown")
+        return
+
+    first, last = points[0][3], points[-1][3]
+    minimum = min(point[1] for point in points)
+    maximum = max(point[2] for point in points)
+    message = (
+        f"📈 **Histórico de** `{wallet_address}` (últimas {range_name})\n\n"
+        f"🪙 **Inicial:** {first / LAMPORTS_PER_SOL:.9f} SOL\n"
+        f"💎 **Actual:** {last / LAMPORTS_PER_SOL:.9f} SOL\n"
+        f"📊 **Cambio:** {(last - first) / LAMPORTS_PER_SOL:+.9f} SOL\n"
+        f"⬇️ **Mínimo:** {minimum / LAMPORTS_PER_SOL:.9f} SOL\n"
+        f"⬆️ **Máximo:** {maximum / LAMPORTS_PER_SOL:.9f} SOL\n\n"
+    )
+    for ts, lamports in downsample(points, start, end, HISTORY_ROWS):
+        message += f"`{datetime.fromtimestamp(ts).strftime('%d/%m %H:%M')}`  {lamports / LAMPORTS_PER_SOL:.4f} SOL\n"
+
+    await update.message.reply_text(message, parse_mode="Markdown")
+
+# Opciones de /alert_rule: nombre -> (columna, conversión del valor escrito)
+RULE_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+def parse_rule_duration(value: str) -> int:
+    match = re.fullmatch(r"(\d+)([smhd]?)", value.lower())
+    if not match:
+        raise ValueError(value)
+    return int(match.group(1)) * RULE_UNITS[match.group(2) or 's']
+
+RULE_OPTIONS = {
+    'cambio': ('change_lamports', lambda value: round(float(value) * LAMPORTS_PER_SOL)),
+    'pct': ('change_percent', float),
+    'min': ('below_lamports', lambda value: round(float(value) * LAMPORTS_PER_SOL)),
+    'max': ('above_lamports', lambda value: round(float(value) * LAMPORTS_PER_SOL)),
+    'cooldown': ('cooldown_seconds', parse_rule_duration),
+}
+RULE_USAGE = ("⚠️ Uso: `/alert_rule <grupo> [wallet] [cambio=<SOL>] [pct=<n>] [min=<SOL>] [max=<SOL>] [cooldown=<10m|1h>]`\n"
+              "Con `off` una opción vuelve a heredarse; con `reset` se borra la regla. Sin opciones se muestran las reglas del grupo.")
+
+def parse_rule_options(args: list[str]) -> dict:
+    # nombre=valor -> columna: valor (None = heredado); ValueError si alguna opción no es válida
+    values = {}
+    for arg in args:
+        name, _, value = arg.partition("=")
+        if name.lower() not in RULE_OPTIONS or not value:
+            raise ValueError(arg)
+        field, convert = RULE_OPTIONS[name.lower()]
+        try:
+            number = None if value.lower() == "off" else convert(value)
+        except (ValueError, OverflowError):
+            raise ValueError(arg)
+        if number is not None and not 0 <= number < 2 ** 63:
+            raise ValueError(arg)
+        # Un porcentaje de 0 alertaría en cada sondeo
+        if field == 'change_percent' and number == 0:
+            raise ValueError(arg)
+        values[field] = number
+    return values
+
+def format_alert_rule(change_lamports, change_percent, below_lamports, above_lamports, cooldown_seconds) -> str:
+    parts = []
+    if change_lamports is not None:
+        parts.append(f"cambio de más de {change_lamports / LAMPORTS_PER_SOL:.9g} SOL")
+    if change_percent is not None:
+        parts.append(f"cambio de más del {change_percent:g}%")
+    if below_lamports is not None:
+        parts.append(f"por debajo de {below_lamports / LAMPORTS_PER_SOL:.9g} SOL")
+    if above_lamports is not None:
+        parts.append(f"por encima de {above_lamports / LAMPORTS_PER_SOL:.9g} SOL")
+    if cooldown_seconds:
+        parts.append(f"como mucho una alerta cada {cooldown_seconds} s")
+    return ", ".join(parts) or "heredada"
+
+async def alert_rule(update: Update, context: CallbackContext) -> None:
+    chat_id = update.message.chat_id
+    args = list(context.args)
+
+    # Las opciones van al final; antes, la wallet opcional y el nombre del grupo (que puede tener espacios)
+    reset = bool(args) and args[-1].lower() == "reset"
+    if reset:
+        args.pop()
+    options = []
+    while args and "=" in args[-1]:
+        options.insert(0, args.pop())
+    wallet_address = ""
+    if len(args) > 1 and is_valid_solana_wallet(args[-1]):
+        wallet_address = args.pop()
+    group_name = " ".join(args)
+    if not group_name or (reset and options):
+        await update.message.reply_text(RULE_USAGE, parse_mode="Markdown")
+        return
+
+    group_id = next((group_id for group_id, name, _ in get_groups(chat_id) if name == group_name), None)
+    if group_id is None:
+        await update.message.reply_text(f"⚠️ El grupo `{group_name}` no existe.", parse_mode="Markdown")
+        return
+    if wallet_address and not wallet_in_group(group_id, wallet_address):
+        await update.message.reply_text(f"⚠️ La wallet `{wallet_address}` no está en el grupo `{group_name}`.", parse_mode="Markdown")
+        return
+
+    try:
+        values = parse_rule_options(options)
+    except ValueError as e:
+        await update.message.reply_text(f"⚠️ Opción no válida: `{e}`\n\n{RULE_USAGE}", parse_mode="Markdown")
+        return
 
-    await query.answer(f"✅ Grupo `{group_name}` eliminado.")
-    await list_groups(update, context)
\ No newline at end of file
+    if reset:
+        remove_alert_rule(group_id, wallet_address)
+    elif values:
+        set_alert_rule(group_id, wallet_address, values)
+    if reset or values:
+        registry.publish('group_changed', group_id)
+
+    rules = get_alert_rules(group_id)
+    message = f"📏 **Reglas de alerta de** `{group_name}`\n\n"
+    if not rules:
+        message += "Sin reglas: se avisa de cualquier cambio de más de 0.01 SOL.\n"
+    for address, *rule in rules:
+        target = f"`{address}`" if address else "Grupo"
+        message += f"🔹 {target}: {format_alert_rule(*rule)}\n"
+    await update.message.reply_text(message, parse_mode="Markdown")
\ No newline at end of file
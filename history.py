@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+from contextlib import closing
+import storage
+from config import HISTORY_RAW_RETENTION_DAYS, HISTORY_MINUTE_RETENTION_DAYS, HISTORY_COMPACT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+
+# Histórico de saldos en tres niveles: puntos sin agregar (balance_history) y agregados
+# por minuto y por hora (balance_history_rollup). La compactación mueve los puntos
+# antiguos al nivel siguiente para que el volumen crezca con el tiempo de forma acotada.
+
+def append_points(points: list[tuple[str, int, int]]) -> None:
+    # points: (wallet_address, ts, lamports); un solo executemany por ciclo
+    if not points:
+        return
+    with storage.transaction() as conn:
+        conn.executemany('INSERT OR REPLACE INTO balance_history (wallet_address, ts, lamports) VALUES (?, ?, ?)', points)
+
+def query_range(wallet_address: str, start: int, end: int) -> list[tuple[int, int, int, int]]:
+    # Devuelve (ts, min, max, close) ordenado por ts mezclando los tres niveles; todas las
+    # consultas recorren un rango de la clave primaria
+    raw = storage.fetchall(
+        'SELECT ts, lamports, lamports, lamports FROM balance_history WHERE wallet_address = ? AND ts >= ? AND ts < ?',
+        (wallet_address, start, end)
+    )
+    rollups = storage.fetchall(
+        '''SELECT bucket, min_lamports, max_lamports, close_lamports FROM balance_history_rollup
+           WHERE wallet_address = ? AND resolution IN (?, ?) AND bucket >= ? AND bucket < ?''',
+        (wallet_address, MINUTE, HOUR, start, end)
+    )
+    return sorted(raw + rollups)
+
+def downsample(points: list[tuple[int, int, int, int]], start: int, end: int, slots: int) -> list[tuple[int, int]]:
+    # Reduce los puntos a como mucho `slots` intervalos iguales, con el último saldo de cada uno
+    width = max(1, (end - start + slots - 1) // slots)
+    closes = {}
+    for ts, _, _, close in points:
+        closes[(ts - start) // width] = (ts, close)
+    return [closes[slot] for slot in sorted(closes)]
+
+def _wallets_with_rows(conn, table: str, condition: str, params: tuple):
+    # Wallets con alguna fila que cumple condition, recorriendo la clave primaria de una dirección a la siguiente
+    wallet_address = ''
+    while True:
+        wallet_address = conn.execute(f'SELECT MIN(wallet_address) FROM {table} WHERE wallet_address > ?', (wallet_address,)).fetchone()[0]
+        if wallet_address is None:
+            return
+        if conn.execute(f'SELECT 1 FROM {table} WHERE wallet_address = ? AND {condition} LIMIT 1', (wallet_address, *params)).fetchone():
+            yield wallet_address
+
+def _rollup_raw(conn, wallet_address: str, cutoff: int) -> int:
+    # Agrega en minutos los puntos anteriores a cutoff (alineado a minuto, así los minutos están completos)
+    conn.execute('''
+        INSERT OR REPLACE INTO balance_history_rollup
+            (wallet_address, resolution, bucket, min_lamports, max_lamports, close_lamports, samples)
+        SELECT h.wallet_address, ?, h.ts / ? * ?, MIN(h.lamports), MAX(h.lamports),
+               (SELECT c.lamports FROM balance_history c
+                WHERE c.wallet_address = h.wallet_address AND c.ts >= h.ts / ? * ? AND c.ts < h.ts / ? * ? + ?
+                ORDER BY c.ts DESC LIMIT 1),
+               COUNT(*)
+        FROM balance_history h
+        WHERE h.wallet_address = ? AND h.ts < ?
+        GROUP BY h.wallet_address, h.ts / ?
+    ''', (MINUTE, MINUTE, MINUTE, MINUTE, MINUTE, MINUTE, MINUTE, MINUTE, wallet_address, cutoff, MINUTE))
+    return conn.execute('DELETE FROM balance_history WHERE wallet_address = ? AND ts < ?', (wallet_address, cutoff)).rowcount
+
+def _rollup_minutes(conn, wallet_address: str, cutoff: int) -> int:
+    conn.execute('''
+        INSERT OR REPLACE INTO balance_history_rollup
+            (wallet_address, resolution, bucket, min_lamports, max_lamports, close_lamports, samples)
+        SELECT m.wallet_address, ?, m.bucket / ? * ?, MIN(m.min_lamports), MAX(m.max_lamports),
+               (SELECT c.close_lamports FROM balance_history_rollup c
+                WHERE c.wallet_address = m.wallet_address AND c.resolution = ?
+                  AND c.bucket >= m.bucket / ? * ? AND c.bucket < m.bucket / ? * ? + ?
+                ORDER BY c.bucket DESC LIMIT 1),
+               SUM(m.samples)
+        FROM balance_history_rollup m
+        WHERE m.wallet_address = ? AND m.resolution = ? AND m.bucket < ?
+        GROUP BY m.wallet_address, m.bucket / ?
+    ''', (HOUR, HOUR, HOUR, MINUTE, HOUR, HOUR, HOUR, HOUR, HOUR, wallet_address, MINUTE, cutoff, HOUR))
+    return conn.execute('DELETE FROM balance_history_rollup WHERE wallet_address = ? AND resolution = ? AND bucket < ?',
+                        (wallet_address, MINUTE, cutoff)).rowcount
+
+def compact(now: float = None) -> tuple[int, int]:
+    now = int(now if now is not None else time.time())
+    raw_cutoff = (now - int(HISTORY_RAW_RETENTION_DAYS * DAY)) // MINUTE * MINUTE
+    minute_cutoff = (now - int(HISTORY_MINUTE_RETENTION_DAYS * DAY)) // HOUR * HOUR
+    # Con su propia conexión y una transacción corta por wallet: las escrituras del monitor y del bot solo
+    # esperan a que termine la wallet en curso, no toda la compactación
+    raw_rows = minute_rows = 0
+    with closing(storage.open_connection()) as conn:
+        for wallet_address in list(_wallets_with_rows(conn, 'balance_history', 'ts < ?', (raw_cutoff,))):
+            with storage.separate_transaction(conn):
+                raw_rows += _rollup_raw(conn, wallet_address, raw_cutoff)
+        for wallet_address in list(_wallets_with_rows(conn, 'balance_history_rollup', 'resolution = ? AND bucket < ?', (MINUTE, minute_cutoff))):
+            with storage.separate_transaction(conn):
+                minute_rows += _rollup_minutes(conn, wallet_address, minute_cutoff)
+    return raw_rows, minute_rows
+
+async def run_compaction(interval: float = HISTORY_COMPACT_INTERVAL) -> None:
+    while True:
+        try:
+            # En un hilo para no bloquear el event loop con tablas grandes
+            raw_rows, minute_rows = await asyncio.to_thread(compact)
+            if raw_rows or minute_rows:
+                logger.info(f'Histórico compactado: {raw_rows} puntos a minutos, {minute_rows} minutos a horas')
+        except Exception:
+            logger.exception('Error al compactar el histórico de saldos')
+        await asyncio.sleep(interval)
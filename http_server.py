@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger(__name__)
+
+# Servidor HTTP/1.1 asíncrono mínimo (keep-alive, cuerpos con Content-Length),
+# suficiente para los stubs locales y los endpoints internos del bot.
+
+MAX_BODY_SIZE = 10 * 1024 * 1024
+
+REASONS = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large', 414: 'URI Too Long', 429: 'Too Many Requests',
+           431: 'Request Header Fields Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+class Request:
+    def __init__(self, method: str, target: str, headers: dict[str, str], body: bytes):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+class Response:
+    def __init__(self, status: int = 200, body: bytes = b'', headers: dict[str, str] = None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+def json_response(data, status: int = 200, headers: dict[str, str] = None) -> Response:
+    return Response(status, json.dumps(data).encode(), {'Content-Type': 'application/json', **(headers or {})})
+
+def text_response(text: str, status: int = 200, content_type: str = 'text/plain; charset=utf-8') -> Response:
+    return Response(status, text.encode(), {'Content-Type': content_type})
+
+class HTTPServer:
+    def __init__(self, handler: Callable[[Request], Awaitable[Response]], host: str = '127.0.0.1', port: int = 0):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                if isinstance(request, Response):
+                    await self._write_response(writer, request, keep_alive=False)
+                    break
+                try:
+                    response = await self.handler(request)
+                except Exception:
+                    logger.exception(f'Error al atender {request.method} {request.path}')
+                    response = text_response('Internal Server Error', 500)
+                keep_alive = request.headers.get('connection', '').lower() != 'close'
+                await self._write_response(writer, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.CancelledError):
+            # CancelledError: el servidor se está cerrando con la conexión aún abierta
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        # readline lanza ValueError si una línea supera el límite del stream (64 KiB); la conexión se cierra
+        # tras la respuesta porque el resto de la línea sigue en el buffer
+        try:
+            request_line = await reader.readline()
+        except ValueError:
+            return text_response('URI Too Long', 414)
+        if not request_line:
+            return None
+        try:
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            return text_response('Bad Request', 400)
+        headers = {}
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                return text_response('Request Header Fields Too Large', 431)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        # Solo dígitos: int() también aceptaría signos, espacios y guiones bajos
+        length = headers.get('content-length', '') or '0'
+        if not (length.isascii() and length.isdigit()):
+            return text_response('Bad Request', 400)
+        length = int(length)
+        if length > MAX_BODY_SIZE:
+            return text_response('Payload Too Large', 413)
+        body = await reader.readexactly(length) if length else b''
+        return Request(method.upper(), target, headers, body)
+
+    async def _write_response(self, writer: asyncio.StreamWriter, response: Response, keep_alive: bool) -> None:
+        head = [f'HTTP/1.1 {response.status} {REASONS.get(response.status, "Unknown")}']
+        headers = {'Content-Length': str(len(response.body)), 'Connection': 'keep-alive' if keep_alive else 'close', **response.headers}
+        head.extend(f'{name}: {value}' for name, value in headers.items())
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + response.body)
+        await writer.drain()
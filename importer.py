@@ -0,0 +1,70 @@
+import re
+import time
+from typing import Awaitable, Callable
+from database import save_wallets, is_valid_solana_wallet
+from rpc import get_rpc_client
+
+# Importación masiva de wallets: texto pegado o documentos CSV/TXT con una wallet por
+# línea y tag opcional ("dirección,tag"). Los saldos se piden en lotes getMultipleAccounts
+# y todo se guarda en una sola transacción.
+
+MAX_IMPORT_FILE_SIZE = 1024 * 1024
+MAX_TAG_LENGTH = 64
+PROGRESS_INTERVAL = 1.5
+
+BASE58_PATTERN = re.compile(r"[1-9A-HJ-NP-Za-km-z]{32,44}")
+FIELD_SEPARATORS = re.compile(r"[,;\t]")
+HEADER_NAMES = {'wallet', 'wallet_address', 'address', 'direccion', 'dirección'}
+
+def parse_wallet_entries(text: str) -> list[tuple[str, str]]:
+    entries = []
+    for line in text.splitlines():
+        line = line.strip().lstrip('﻿')
+        if not line or line.startswith('#'):
+            continue
+        if FIELD_SEPARATORS.search(line):
+            fields = [field.strip().strip('"') for field in FIELD_SEPARATORS.split(line)]
+            if fields[0].lower() in HEADER_NAMES:
+                continue
+            tag = fields[1][:MAX_TAG_LENGTH] if len(fields) > 1 and fields[1] else None
+            entries.append((fields[0], tag))
+        else:
+            # Sin separadores: varias direcciones separadas por espacios, como al pegarlas en el chat
+            entries.extend((address, None) for address in line.split())
+    return entries
+
+def validate_entries(entries: list[tuple[str, str]]) -> tuple[list[tuple[str, str]], list[str]]:
+    # Elimina duplicados (gana el último tag) y separa las direcciones no válidas
+    unique = {}
+    for address, tag in entries:
+        if address in unique and tag is None:
+            continue
+        unique[address] = tag
+    valid, invalid = [], []
+    for address, tag in unique.items():
+        if BASE58_PATTERN.fullmatch(address) and is_valid_solana_wallet(address):
+            valid.append((address, tag))
+        else:
+            invalid.append(address)
+    return valid, invalid
+
+async def import_wallets(group_id: int, entries: list[tuple[str, str]],
+                         on_progress: Callable[[int, int], Awaitable[None]] = None) -> tuple[list[str], list[str], list[str]]:
+    # Devuelve (añadidas, no válidas, sin saldo)
+    valid, invalid = validate_entries(entries)
+    last_progress = 0.0
+
+    async def progress(done: int, total: int) -> None:
+        nonlocal last_progress
+        # Telegram limita las ediciones de un mismo mensaje: se informa como mucho cada PROGRESS_INTERVAL
+        if on_progress is not None and (done == total or time.monotonic() - last_progress >= PROGRESS_INTERVAL):
+            last_progress = time.monotonic()
+            await on_progress(done, total)
+
+    balances = await get_rpc_client().get_multiple_balances([address for address, _ in valid], on_progress=progress)
+    rows = [(address, balances[address], tag) for address, tag in valid if address in balances]
+    save_wallets(group_id, rows)
+
+    added = [address for address, _, _ in rows]
+    failed = [address for address, _ in valid if address not in balances]
+    return added, invalid, failed
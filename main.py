@@ -1,21 +1,26 @@
 import asyncio
 import logging
 import os
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
-import nest_asyncio
+import signal
 from dotenv import load_dotenv
-from handlers import (
-    start, create_group, list_groups, view_group, delete_group, add_wallet, 
-    remove_wallet, main_menu, handle_text_input, edit_tag, toggle_notifications, error_handler
+from monitor import WalletMonitor, run_worker
+from notifier import NotificationDispatcher
+from sharding import WorkerPool
+from checkpoint import Checkpointer
+from group_view import invalidate_groups
+import registry
+from config import (
+    MONITOR_MODE, MONITOR_WORKERS, METRICS_HOST, METRICS_PORT, SHUTDOWN_TIMEOUT, TELEGRAM_MODE,
+    WEBHOOK_URL, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET
 )
-from monitor import monitor_wallets
+from metrics import start_metrics_server
+from http_server import HTTPServer
+from history import run_compaction
 from database import init_db
 
 # Cargar las variables de entorno desde el archivo .env
 load_dotenv()
 
-nest_asyncio.apply()
-
 # Configura el registro de errores
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -25,6 +30,15 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 async def main():
+    # Las dependencias del bot se importan aquí: con spawn, los procesos de monitoreo vuelven a importar
+    # este módulo y así no cargan telegram ni los manejadores
+    from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
+    from handlers import (
+        start, create_group, list_groups, view_group, group_page, delete_group, add_wallet,
+        remove_wallet, main_menu, handle_text_input, handle_document, edit_tag, toggle_notifications, toggle_tokens, history, alert_rule, error_handler
+    )
+    from webhook import WebhookReceiver
+
     # Inicializar la base de datos
     init_db()
 
@@ -33,28 +47,109 @@ async def main():
     if not token:
         raise ValueError("El token del bot de Telegram no está definido en la variable de entorno TELEGRAM_BOT_TOKEN")
 
-    # Crear la aplicación de Telegram
-    application = Application.builder().token(token).build()
+    # Crear la aplicación de Telegram; en modo webhook las actualizaciones llegan por el servidor HTTP propio
+    builder = Application.builder().token(token)
+    if TELEGRAM_MODE == 'webhook':
+        builder = builder.updater(None)
+    application = builder.build()
 
     # Añadir manejadores
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CallbackQueryHandler(create_group, pattern="create_group"))
     application.add_handler(CallbackQueryHandler(list_groups, pattern="list_groups"))
     application.add_handler(CallbackQueryHandler(view_group, pattern="view_group_"))
+    application.add_handler(CallbackQueryHandler(group_page, pattern=r'^group_page_'))
     application.add_handler(CallbackQueryHandler(delete_group, pattern="delete_group_"))
     application.add_handler(CallbackQueryHandler(add_wallet, pattern="add_wallet_"))
     application.add_handler(CallbackQueryHandler(remove_wallet, pattern="remove_wallet_"))
     application.add_handler(CallbackQueryHandler(main_menu, pattern="main_menu"))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_input))
+    application.add_handler(MessageHandler(filters.Document.ALL, handle_document))
     application.add_handler(CommandHandler("edit_tag", edit_tag))
+    application.add_handler(CommandHandler("history", history))
+    application.add_handler(CommandHandler("alert_rule", alert_rule))
     application.add_handler(CallbackQueryHandler(toggle_notifications, pattern=r'^toggle_notifications_'))
+    application.add_handler(CallbackQueryHandler(toggle_tokens, pattern=r'^toggle_tokens_'))
     application.add_error_handler(error_handler)
 
+    # Endpoint de métricas Prometheus opcional
+    if METRICS_PORT:
+        await start_metrics_server(METRICS_HOST, METRICS_PORT)
+
+    # Cola de notificaciones con límites de envío de Telegram
+    notifier = NotificationDispatcher(application.bot)
+
+    # El estado del monitor y las notificaciones sin enviar se retoman del último punto de control
+    checkpointer = Checkpointer()
+    checkpointer.register('notifications', notifier, final_only=True)
+    if MONITOR_WORKERS:
+        # Los procesos de monitoreo reenvían alertas e invalidaciones de caché a este proceso
+        pool = WorkerPool(notifier, run_worker, MONITOR_WORKERS, on_saved=invalidate_groups)
+        registry.subscribe(pool.publish)
+        monitoring, stop_monitoring = pool.run(), pool.close
+    else:
+        monitor = WalletMonitor(notifier)
+        # Los manejadores avisan al monitor de cada cambio en las wallets vigiladas
+        registry.subscribe(monitor.notify_change)
+        # Nada se guarda hasta el primer ciclo: un arranque fallido no pisa el punto de control anterior
+        checkpointer.register('monitor', monitor, ready=monitor.first_cycle)
+        monitoring = monitor.run_pubsub() if MONITOR_MODE == 'websocket' else monitor.run_polling()
+        stop_monitoring = monitor.stop
+    checkpointer.restore()
+
+    # Apagado ordenado con SIGTERM (despliegues) o SIGINT
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for stop_signal in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(stop_signal, stopping.set)
+
+    background = [
+        asyncio.create_task(notifier.run()),
+        # Compactación periódica del histórico de saldos
+        asyncio.create_task(run_compaction()),
+        asyncio.create_task(checkpointer.run()),
+    ]
     # Inicia el monitoreo de wallets en segundo plano
-    asyncio.create_task(monitor_wallets(application))
+    monitor_task = asyncio.create_task(monitoring)
+
+    async with application:
+        await application.start()
+        if TELEGRAM_MODE == 'webhook':
+            receiver = WebhookReceiver(application)
+            webhook_server = HTTPServer(receiver.handle, WEBHOOK_HOST, WEBHOOK_PORT)
+            await webhook_server.start()
+            logger.info(f'Webhook de Telegram escuchando en {webhook_server.url}{WEBHOOK_PATH}')
+            if WEBHOOK_URL:
+                await application.bot.set_webhook(f'{WEBHOOK_URL.rstrip("/")}{WEBHOOK_PATH}', secret_token=WEBHOOK_SECRET)
+        else:
+            await application.updater.start_polling()
+        await stopping.wait()
+        logger.info('Apagando el bot...')
+        if TELEGRAM_MODE == 'webhook':
+            # El webhook sigue registrado: Telegram guarda las actualizaciones hasta el siguiente arranque
+            await webhook_server.stop()
+            if not await receiver.drain(SHUTDOWN_TIMEOUT):
+                logger.warning(f'Se interrumpen actualizaciones en curso tras {SHUTDOWN_TIMEOUT}s')
+        else:
+            await application.updater.stop()
 
-    # Inicia el polling
-    await application.run_polling()
+        # El ciclo en curso termina y guarda sus saldos; sus alertas se envían o quedan en el punto de control
+        stop_monitoring()
+        try:
+            await asyncio.wait_for(monitor_task, SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f'El monitor no terminó en {SHUTDOWN_TIMEOUT}s; se cancela')
+        except Exception:
+            logger.exception('El monitor terminó con un error')
+        if not MONITOR_WORKERS:
+            await monitor.close()
+        if not await notifier.drain(SHUTDOWN_TIMEOUT):
+            logger.warning(f'Quedan {notifier.pending_count()} notificaciones sin enviar; se enviarán al arrancar')
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        await checkpointer.save(final=True)
+        await application.stop()
 
 if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,215 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+from contextlib import contextmanager
+from typing import Callable
+from config import PROFILE_CYCLES, PROFILE_DIR
+from http_server import HTTPServer, Request, Response, text_response
+
+logger = logging.getLogger(__name__)
+
+# Métricas en memoria con exposición en formato de texto de Prometheus
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+# Última instantánea de cada proceso de monitoreo: nombre del proceso -> {métrica: valores}. Solo el proceso
+# del bot sirve /metrics; las series de los procesos salen con la etiqueta worker
+_remote = {}
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def snapshot(self) -> dict:
+        return dict(self._values)
+
+    def _series(self):
+        # (etiquetas, valores de las etiquetas, valor) propios y de cada proceso de monitoreo
+        for key, value in sorted(self._values.items()):
+            yield self.labelnames, key, value
+        for source, values in sorted(_remote.items()):
+            for key, value in sorted(values.get(self.name, {}).items()):
+                yield self.labelnames + ('worker',), key + (source,), value
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for labelnames, key, value in self._series():
+            lines.append(f'{self.name}{_format_labels(labelnames, key)} {_format_value(value)}')
+        return lines
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), function: Callable[[], float] = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def render(self) -> list[str]:
+        if self.function is not None:
+            self._values[()] = self.function()
+        return super().render()
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        counts = state[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        # Copia de los contadores por cubo: la cola de procesos serializa en otro hilo
+        return {key: [list(counts), total, count] for key, (counts, total, count) in self._values.items()}
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for labelnames, key, (counts, total, count) in self._series():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labelnames, key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(labelnames, key)} {count}')
+        return lines
+
+def render() -> str:
+    return '\n'.join(line for metric in _registry for line in metric.render()) + '\n'
+
+def snapshot() -> dict:
+    # Valores de las métricas de este proceso, para reenviarlos desde un proceso de monitoreo
+    return {metric.name: metric.snapshot() for metric in _registry if metric._values}
+
+def merge(source: str, values: dict) -> None:
+    # Sustituye la instantánea anterior del proceso: los valores ya son acumulados
+    _remote[source] = values
+
+# Monitor
+cycle_seconds = Histogram('btcaller_monitor_cycle_seconds', 'Duración de cada ciclo de sondeo del monitor')
+wallets_polled = Counter('btcaller_monitor_wallets_polled_total', 'Direcciones consultadas por el monitor')
+wallets_changed = Counter('btcaller_monitor_wallets_changed_total', 'Direcciones cuyo saldo cambió')
+cycle_wallets = Gauge('btcaller_monitor_cycle_wallets', 'Direcciones del último ciclo', ('state',))
+schedule_lag = Gauge('btcaller_monitor_schedule_lag_seconds', 'Retraso de la fecha límite vencida más antigua')
+
+# RPC
+rpc_request_seconds = Histogram('btcaller_rpc_request_seconds', 'Latencia de las peticiones JSON-RPC', ('endpoint', 'method'))
+rpc_errors = Counter('btcaller_rpc_errors_total', 'Errores de las peticiones JSON-RPC', ('endpoint', 'method', 'kind'))
+
+# Base de datos
+db_seconds = Histogram('btcaller_db_seconds', 'Tiempo en operaciones SQLite', ('operation',),
+                       buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+
+# Transacciones
+tx_cache_lookups = Counter('btcaller_tx_cache_lookups_total', 'Búsquedas en la caché de transacciones analizadas', ('result',))
+
+# Caché de navegación
+chat_cache_lookups = Counter('btcaller_chat_cache_lookups_total', 'Búsquedas en la caché por chat de grupos y wallets', ('result',))
+
+# Precios
+price_lookups = Counter('btcaller_price_lookups_total', 'Precios pedidos a la caché de precios en USD', ('result',))
+price_fetch_seconds = Histogram('btcaller_price_fetch_seconds', 'Duración de cada consulta a la API de precios')
+price_errors = Counter('btcaller_price_errors_total', 'Consultas fallidas a la API de precios')
+
+# Telegram
+notification_latency = Histogram('btcaller_notification_latency_seconds', 'Tiempo desde que se encola una notificación hasta su envío')
+notifications_sent = Counter('btcaller_notifications_total', 'Notificaciones procesadas por el dispatcher', ('result',))
+notification_queue_depth = Gauge('btcaller_notification_queue_depth', 'Notificaciones pendientes de envío')
+update_seconds = Histogram('btcaller_update_seconds', 'Tiempo desde que llega una actualización por webhook hasta que termina su manejador')
+webhook_updates = Counter('btcaller_webhook_updates_total', 'Peticiones recibidas en el webhook de Telegram', ('result',))
+webhook_pending = Gauge('btcaller_webhook_pending_updates', 'Actualizaciones del webhook recibidas y sin terminar')
+
+async def handle_metrics_request(request: Request) -> Response:
+    if request.path != '/metrics':
+        return text_response('Not Found', 404)
+    return text_response(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+async def start_metrics_server(host: str, port: int) -> HTTPServer:
+    server = HTTPServer(handle_metrics_request, host, port)
+    await server.start()
+    logger.info(f'Métricas disponibles en {server.url}/metrics')
+    return server
+
+class CycleProfiler:
+    # Perfila con cProfile uno de cada `every` ciclos, guarda el .prof y registra las funciones más costosas
+    def __init__(self, every: int = PROFILE_CYCLES, directory: str = PROFILE_DIR, top: int = 15):
+        self.every = every
+        self.directory = directory
+        self.top = top
+        self._cycle = 0
+
+    @contextmanager
+    def profile(self):
+        self._cycle += 1
+        if not self.every or self._cycle % self.every:
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            os.makedirs(self.directory, exist_ok=True)
+            # Con el pid: los procesos de monitoreo comparten el directorio
+            path = os.path.join(self.directory, f'cycle-{int(time.time())}-{os.getpid()}-{self._cycle}.prof')
+            profiler.dump_stats(path)
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(self.top)
+            logger.info(f'Perfil del ciclo {self._cycle} guardado en {path}\n{summary.getvalue()}')
@@ -0,0 +1,156 @@
+import logging
+import time
+import storage
+
+logger = logging.getLogger(__name__)
+
+# Migraciones del esquema: cada una se aplica una sola vez, en orden y en su propia transacción,
+# y queda registrada en schema_version. Las bases de datos existentes se actualizan en el sitio.
+
+def _baseline(conn):
+    # Esquema original; IF NOT EXISTS para adoptar bases de datos creadas antes de las migraciones
+    conn.execute('''CREATE TABLE IF NOT EXISTS groups (
+                        chat_id INTEGER,
+                        group_name TEXT,
+                        notifications_enabled INTEGER DEFAULT 1,
+                        PRIMARY KEY (chat_id, group_name))''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS wallets (
+                        chat_id INTEGER,
+                        group_name TEXT,
+                        wallet_address TEXT,
+                        balance REAL,
+                        tag TEXT,
+                        PRIMARY KEY (chat_id, group_name, wallet_address))''')
+    # Histórico de saldos por dirección en lamports; WITHOUT ROWID agrupa los puntos de cada wallet en disco
+    conn.execute('''CREATE TABLE IF NOT EXISTS balance_history (
+                        wallet_address TEXT NOT NULL,
+                        ts INTEGER NOT NULL,
+                        lamports INTEGER NOT NULL,
+                        PRIMARY KEY (wallet_address, ts)) WITHOUT ROWID''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS balance_history_rollup (
+                        wallet_address TEXT NOT NULL,
+                        resolution INTEGER NOT NULL,
+                        bucket INTEGER NOT NULL,
+                        min_lamports INTEGER NOT NULL,
+                        max_lamports INTEGER NOT NULL,
+                        close_lamports INTEGER NOT NULL,
+                        samples INTEGER NOT NULL,
+                        PRIMARY KEY (wallet_address, resolution, bucket)) WITHOUT ROWID''')
+
+def _group_ids_and_lamports(conn):
+    # Grupos con id entero (el nombre deja de viajar en callback_data y en los joins),
+    # wallets colgando del grupo con borrado en cascada y saldos en lamports enteros
+    conn.execute('''CREATE TABLE groups_new (
+                        id INTEGER PRIMARY KEY,
+                        chat_id INTEGER NOT NULL,
+                        group_name TEXT NOT NULL,
+                        notifications_enabled INTEGER NOT NULL DEFAULT 1,
+                        UNIQUE (chat_id, group_name))''')
+    conn.execute('''CREATE TABLE wallets_new (
+                        group_id INTEGER NOT NULL REFERENCES groups_new (id) ON DELETE CASCADE,
+                        wallet_address TEXT NOT NULL,
+                        lamports INTEGER,
+                        tag TEXT,
+                        PRIMARY KEY (group_id, wallet_address)) WITHOUT ROWID''')
+    conn.execute('''INSERT INTO groups_new (chat_id, group_name, notifications_enabled)
+                    SELECT chat_id, group_name, COALESCE(notifications_enabled, 1) FROM groups ORDER BY chat_id, group_name''')
+    # Las wallets sin grupo no se monitorizaban ni se podían ver: se descartan
+    conn.execute('''INSERT INTO wallets_new (group_id, wallet_address, lamports, tag)
+                    SELECT g.id, w.wallet_address, CAST(ROUND(w.balance * 1000000000) AS INTEGER), w.tag
+                    FROM wallets w
+                    JOIN groups_new g ON g.chat_id = w.chat_id AND g.group_name = w.group_name''')
+    conn.execute('DROP TABLE wallets')
+    conn.execute('DROP TABLE groups')
+    # Al renombrar, SQLite actualiza la referencia de wallets_new a la tabla groups
+    conn.execute('ALTER TABLE groups_new RENAME TO groups')
+    conn.execute('ALTER TABLE wallets_new RENAME TO wallets')
+
+def _indexes(conn):
+    # edit_tag, /history y el cambio de tag buscan por dirección dentro del chat
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_wallets_address ON wallets (wallet_address)')
+    # El monitor solo lee los grupos con notificaciones activas
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_groups_notifications ON groups (notifications_enabled, id)')
+
+def _partition_leases(conn):
+    # Coordinación de los procesos de monitoreo: latido de cada proceso y dueño de cada partición
+    conn.execute('''CREATE TABLE IF NOT EXISTS monitor_workers (
+                        owner TEXT PRIMARY KEY,
+                        heartbeat REAL NOT NULL)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS partition_leases (
+                        partition INTEGER PRIMARY KEY,
+                        owner TEXT NOT NULL,
+                        expires_at REAL NOT NULL)''')
+
+def _parsed_transactions(conn):
+    # Caché en disco de transacciones ya analizadas, por firma
+    conn.execute('''CREATE TABLE IF NOT EXISTS parsed_transactions (
+                        signature TEXT PRIMARY KEY,
+                        cached_at INTEGER NOT NULL,
+                        summary TEXT NOT NULL)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_parsed_transactions_cached_at ON parsed_transactions (cached_at)')
+
+def _token_tracking(conn):
+    # Seguimiento de tokens SPL activable por grupo; las cuentas y saldos de token son por dirección y
+    # se comparten entre todos los grupos que siguen la misma wallet
+    conn.execute('ALTER TABLE groups ADD COLUMN track_tokens INTEGER NOT NULL DEFAULT 0')
+    conn.execute('''CREATE TABLE IF NOT EXISTS token_accounts (
+                        token_account TEXT PRIMARY KEY,
+                        wallet_address TEXT NOT NULL,
+                        mint TEXT NOT NULL,
+                        amount INTEGER NOT NULL,
+                        decimals INTEGER NOT NULL)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_token_accounts_wallet ON token_accounts (wallet_address)')
+    conn.execute('''CREATE TABLE IF NOT EXISTS token_balances (
+                        wallet_address TEXT NOT NULL,
+                        mint TEXT NOT NULL,
+                        amount INTEGER NOT NULL,
+                        decimals INTEGER NOT NULL,
+                        PRIMARY KEY (wallet_address, mint)) WITHOUT ROWID''')
+
+def _alert_rules(conn):
+    # Reglas de alerta por grupo (wallet_address = '') o por wallet dentro del grupo; los campos NULL de la
+    # regla de una wallet se heredan de la del grupo
+    conn.execute('''CREATE TABLE IF NOT EXISTS alert_rules (
+                        group_id INTEGER NOT NULL REFERENCES groups (id) ON DELETE CASCADE,
+                        wallet_address TEXT NOT NULL DEFAULT '',
+                        change_lamports INTEGER,
+                        change_percent REAL,
+                        below_lamports INTEGER,
+                        above_lamports INTEGER,
+                        cooldown_seconds INTEGER,
+                        PRIMARY KEY (group_id, wallet_address)) WITHOUT ROWID''')
+
+# (versión, descripción, función); añadir siempre al final con la siguiente versión
+MIGRATIONS = [
+    (1, 'esquema inicial', _baseline),
+    (2, 'ids enteros de grupo y saldos en lamports', _group_ids_and_lamports),
+    (3, 'índices por dirección y notificaciones', _indexes),
+    (4, 'concesiones de particiones del monitor', _partition_leases),
+    (5, 'caché de transacciones analizadas', _parsed_transactions),
+    (6, 'seguimiento de tokens SPL', _token_tracking),
+    (7, 'reglas de alerta por grupo y wallet', _alert_rules),
+]
+
+def current_version() -> int:
+    with storage.transaction() as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+                            version INTEGER PRIMARY KEY,
+                            description TEXT NOT NULL,
+                            applied_at INTEGER NOT NULL)''')
+        return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+def migrate() -> int:
+    # Aplica las migraciones pendientes y devuelve la versión final del esquema
+    version = current_version()
+    for target, description, apply in MIGRATIONS:
+        if target <= version:
+            continue
+        logger.info(f'Aplicando migración {target}: {description}')
+        with storage.transaction() as conn:
+            # sqlite3 no abre transacción implícita antes de un DDL: se abre a mano para que la migración sea atómica
+            conn.execute('BEGIN')
+            apply(conn)
+            conn.execute('INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                         (target, description, int(time.time())))
+        version = target
+    return version
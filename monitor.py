@@ -1,77 +1,468 @@
 import asyncio
+import logging
+import signal
 import sqlite3
-from telegram.ext import Application
-from database import get_solana_balance
-
-async def monitor_wallets(application: Application) -> None:
-    while True:
-        # Obtener todas las wallets y sus estados de notificación en una sola consulta
-        conn = sqlite3.connect('wallets.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT g.chat_id, g.group_name, w.wallet_address, w.tag, g.notifications_enabled
-            FROM wallets w
-            JOIN groups g ON w.chat_id = g.chat_id AND w.group_name = g.group_name
-        ''')
-        wallets = cursor.fetchall()
-        conn.close()
-
-        # Utilizar asyncio.gather para obtener los saldos en paralelo
-        tasks = [fetch_and_update_balance(application, chat_id, group_name, wallet_address, tag, notifications_enabled) for chat_id, group_name, wallet_address, tag, notifications_enabled in wallets]
-        await asyncio.gather(*tasks)
+import time
+from config import (
+    SOLANA_WS_URL, SUBSCRIPTION_REFRESH_INTERVAL, POLL_MIN_INTERVAL, RPC_BATCH_SIZE, RPC_REQUESTS_PER_SECOND,
+    MONITOR_MODE, CLASSIFY_TRANSACTIONS
+)
+from database import get_subscription_rows, update_wallet_balances, get_token_accounts, update_token_accounts, update_token_balances
+from group_view import invalidate_groups
+from sharding import worker_name, LeaseManager, QueueSink, renew_leases, receive_changes, forward_metrics
+from history import append_points
+import storage
+import metrics
+from notifier import NotificationDispatcher
+from prices import PriceCache, SOL_MINT, get_price_cache
+from pubsub import PubSubClient
+from rpc import SolanaRPCClient, get_rpc_client, RPCError, LAMPORTS_PER_SOL
+from scheduler import AdaptiveScheduler
+from registry import Subscription, SubscriptionRegistry
+from rules import REASON_BELOW, REASON_ABOVE
+from tokens import TokenTracker
+from transactions import TransactionClassifier, Classification
+from utils import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre avisos de retraso del planificador
+OVERRUN_WARNING_INTERVAL = 60
+# Transacciones detalladas como máximo en una alerta
+MAX_ALERT_TRANSACTIONS = 5
+
+class WalletMonitor:
+    def __init__(self, notifier: NotificationDispatcher, rpc_client: SolanaRPCClient = None,
+                 scheduler: AdaptiveScheduler = None, requests_per_second: float = RPC_REQUESTS_PER_SECOND,
+                 on_saved=invalidate_groups, classifier: TransactionClassifier = None, prices: PriceCache | bool = None):
+        self.notifier = notifier
+        # Se llama con los (chat_id, group_id) cuyos saldos se acaban de guardar
+        self.on_saved = on_saved
+        # Particiones de direcciones que vigila este proceso (None = todas)
+        self.partitions = None
+        self.rpc = rpc_client or get_rpc_client()
+        # Presupuesto global de peticiones: sondeo, descubrimiento de tokens y clasificación
+        self._budget = TokenBucket(requests_per_second)
+        if classifier is None and CLASSIFY_TRANSACTIONS:
+            classifier = TransactionClassifier(self.rpc, budget=self._budget)
+        self.classifier = classifier
+        # Precios en USD de SOL y de los tokens para las alertas. Por defecto la caché configurada;
+        # prices=False los desactiva y las alertas muestran solo cantidades (self.prices = None)
+        self.prices = get_price_cache() if prices is None else prices or None
+        # Suscripciones por dirección y reglas de alerta en columnas
+        self.registry = SubscriptionRegistry()
+        # Cambios publicados por el bot pendientes de aplicar al inicio del siguiente ciclo
+        self._changes = []
+        # Últimas alertas restauradas de un punto de control, hasta la siguiente lectura de suscripciones
+        self._restored_alerts = {}
+        # Saldos modificados pendientes de escribir: (chat_id, group_id, wallet_address) -> lamports
+        self._pending_writes = {}
+        # Grupos con cambios de tokens desde la última escritura: (chat_id, group_id)
+        self._pending_token_groups = set()
+        # Cuentas de token de las wallets cuyos grupos siguen tokens
+        self.tokens = TokenTracker(self.rpc, budget=self._budget)
+        # Puntos del histórico pendientes de escribir: (wallet_address, ts, lamports)
+        self._pending_history = []
+        # Últimos lamports observados por dirección, para detectar actividad, y cuándo se observaron
+        self._last_lamports = {}
+        self._observed_at = {}
+        self.scheduler = scheduler if scheduler is not None else AdaptiveScheduler()
+        self._last_refresh = None
+        self._last_overrun_warning = 0.0
+        self._stopping = asyncio.Event()
+        # Se marca al completar el primer ciclo (o la primera sincronización de suscripciones): hasta entonces
+        # el registro no está cargado y un punto de control perdería las últimas alertas restauradas
+        self.first_cycle = asyncio.Event()
+        # Despierta la espera entre ciclos al parar o al llegar cambios de suscripciones
+        self._wakeup = asyncio.Event()
+        self.profiler = metrics.CycleProfiler()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+
+    async def close(self) -> None:
+        # Cierra los clientes HTTP de precios y de RPC una vez parado el monitor
+        if self.prices is not None:
+            await self.prices.close()
+        await self.rpc.close()
+
+    def notify_change(self, change: tuple) -> None:
+        # Recibe los cambios de registry.publish; los aplica el propio bucle del monitor (en sondeo, entre dos ciclos)
+        self._changes.append(change)
+        self._wakeup.set()
+
+    async def run_polling(self) -> None:
+        # Al parar, el ciclo en curso termina: sus alertas y sus saldos se guardan juntos
+        refresh_prices = asyncio.create_task(self.prices.run()) if self.prices is not None else None
+        try:
+            while not self._stopping.is_set():
+                await self.run_cycle()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._time_to_next_cycle())
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+        finally:
+            if refresh_prices is not None:
+                refresh_prices.cancel()
+        self.flush()
+
+    async def run_pubsub(self) -> None:
+        async def refresh_subscriptions() -> None:
+            # Mantener las suscripciones accountSubscribe alineadas con las wallets guardadas. stop() despierta
+            # la espera: en Python 3.11 wait_for puede tragarse entonces la cancelación de run_until_stopped,
+            # así que el bucle comprueba la parada por su cuenta
+            while not self._stopping.is_set():
+                if self.refresh_subscriptions(time.monotonic()):
+                    await client.sync(set(self.registry.subscriptions))
+                self.first_cycle.set()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._last_refresh + SUBSCRIPTION_REFRESH_INTERVAL - time.monotonic())
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+        client = PubSubClient(SOLANA_WS_URL, self.process_balances, self.rpc.get_multiple_balances)
+        coroutines = [client.run(), refresh_subscriptions()]
+        if self.prices is not None:
+            coroutines.append(self.prices.run())
+        await run_until_stopped(*coroutines, stopping=self._stopping)
+        # Las notificaciones ya procesadas actualizan los saldos en memoria antes de encolar la alerta
+        self.flush()
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            'lamports': dict(self._last_lamports),
+            'observed_at': dict(self._observed_at),
+            'schedule': self.scheduler.snapshot(now),
+            'signatures': self.classifier.snapshot() if self.classifier is not None else {},
+            'token_discovery': self.tokens.snapshot(now),
+            # Solo importan para los periodos de enfriamiento de las reglas
+            'last_alerts': {
+                f'{subscription.group_id} {wallet_address}': last_alert
+                for (wallet_address, subscription), last_alert in zip(self.registry.rows, self.registry.rules.last_alert.tolist())
+                if last_alert != float('-inf')
+            },
+        }
+
+    def restore(self, state: dict, elapsed: float) -> None:
+        # Los instantes del planificador son de time.monotonic, que no sobrevive al reinicio: se guardan relativos
+        now = time.monotonic() - elapsed
+        self._last_lamports.update(state.get('lamports', {}))
+        self._observed_at.update(state.get('observed_at', {}))
+        self.scheduler.restore(state.get('schedule', {}), now)
+        if self.classifier is not None:
+            self.classifier.restore(state.get('signatures', {}))
+        self.tokens.restore(state.get('token_discovery', {}), now)
+        self._restored_alerts = {
+            (int(key.split(' ', 1)[0]), key.split(' ', 1)[1]): last_alert for key, last_alert in state.get('last_alerts', {}).items()
+        }
 
-        await asyncio.sleep(10)
-
-async def fetch_and_update_balance(application: Application, chat_id: int, group_name: str, wallet_address: str, tag: str, notifications_enabled: bool) -> None:
-    if notifications_enabled:  # Verifica si las notificaciones están activadas
-        new_balance = get_solana_balance(wallet_address)
-        if new_balance != -1:
-            conn = sqlite3.connect('wallets.db')
-            cursor = conn.cursor()
-            cursor.execute(
-                'SELECT balance FROM wallets WHERE chat_id = ? AND group_name = ? AND wallet_address = ?',
-                (chat_id, group_name, wallet_address)
+    async def run_cycle(self) -> None:
+        with self.profiler.profile(), metrics.cycle_seconds.time():
+            await self._run_cycle()
+        self.first_cycle.set()
+
+    async def _run_cycle(self) -> None:
+        now = time.monotonic()
+        if self.refresh_subscriptions(now):
+            # Las cuentas de token comparten planificador y presupuesto con las wallets
+            self.scheduler.sync(set(self.registry.subscriptions) | set(self.tokens.accounts), now)
+            # La sincronización ya incluye las cuentas abiertas o cerradas hasta ahora
+            self.tokens.take_account_changes()
+
+        # Solo se sondean las direcciones vencidas que caben en el presupuesto global de peticiones
+        due = self.scheduler.pop_due(now, self._budget.available() * RPC_BATCH_SIZE)
+        if not due and not self.tokens.due_discovery(set(), now):
+            return
+
+        # Cada dirección distinta se consulta una sola vez, aunque la sigan varios chats
+        wallet_due = [address for address in due if address in self.registry.subscriptions]
+        token_due = [address for address in due if address in self.tokens.accounts]
+        # Wallets y cuentas de token van en lotes separados: se cobra cada lote que se envía, aunque el
+        # reparto pida una ficha más de las disponibles; la deuda retrasa los ciclos siguientes
+        self._budget.consume(sum((len(batch) + RPC_BATCH_SIZE - 1) // RPC_BATCH_SIZE for batch in (wallet_due, token_due)))
+        balances, amounts = await asyncio.gather(
+            self.rpc.get_multiple_balances(wallet_due),
+            self.rpc.get_token_amounts(token_due),
+        )
+        changed = await self.process_balances(balances)
+        changed |= await self.process_token_amounts(amounts, changed, now)
+
+        now = time.monotonic()
+        # Las cuentas que el descubrimiento encuentra se sondean desde ya; las cerradas dejan de sondearse
+        opened, closed = self.tokens.take_account_changes()
+        self.scheduler.remove(closed)
+        self.scheduler.add(opened, now)
+        for address in due:
+            if address in balances or address in amounts:
+                self.scheduler.reschedule(address, address in changed, now)
+            else:
+                self.scheduler.retry(address, now)
+
+        metrics.wallets_polled.inc(len(due))
+        metrics.wallets_changed.inc(len(changed))
+        metrics.cycle_wallets.set(len(due), state='polled')
+        metrics.cycle_wallets.set(len(changed), state='changed')
+        self._check_overrun(now)
+
+    def _time_to_next_cycle(self) -> float:
+        now = time.monotonic()
+        next_deadline = self.scheduler.next_deadline()
+        delay = POLL_MIN_INTERVAL if next_deadline is None else next_deadline - now
+        if next_deadline is not None and next_deadline <= now:
+            # Hay trabajo vencido: esperar solo a la siguiente ficha del presupuesto
+            delay = self._budget.delay()
+        if self._last_refresh is None:
+            return 0.0
+        refresh_in = self._last_refresh + SUBSCRIPTION_REFRESH_INTERVAL - now
+        return max(0.0, min(delay, refresh_in))
+
+    def _check_overrun(self, now: float) -> None:
+        lag = self.scheduler.lag(now)
+        metrics.schedule_lag.set(lag)
+        if lag > POLL_MIN_INTERVAL and now - self._last_overrun_warning >= OVERRUN_WARNING_INTERVAL:
+            self._last_overrun_warning = now
+            logger.warning(
+                f'El monitor va {lag:.1f}s retrasado sobre el calendario de sondeo de {len(self.scheduler)} wallets; '
+                f'considera subir RPC_REQUESTS_PER_SECOND o POLL_MAX_INTERVAL'
             )
-            row = cursor.fetchone()
-            old_balance = row[0] if row else None
-
-            if old_balance is not None and abs(new_balance - old_balance) > 0.01:
-                cursor.execute(
-                    'UPDATE wallets SET balance = ? WHERE chat_id = ? AND group_name = ? AND wallet_address = ?',
-                    (new_balance, chat_id, group_name, wallet_address)
-                )
-                conn.commit()
-                conn.close()
-
-                cambio_balance = new_balance - old_balance
+
+    def set_partitions(self, partitions: set[int]) -> None:
+        # Las suscripciones se releen en el siguiente ciclo con el nuevo reparto
+        self.partitions = partitions
+        self.registry.partitions = partitions
+        self._last_refresh = None
+
+    def refresh_subscriptions(self, now: float) -> bool:
+        # Aplica los cambios publicados por el bot y, cada SUBSCRIPTION_REFRESH_INTERVAL, reconcilia el registro
+        # con la base de datos. Devuelve True si hay que resincronizar las direcciones vigiladas
+        changes, self._changes = self._changes, []
+        if self._last_refresh is None or now - self._last_refresh >= SUBSCRIPTION_REFRESH_INTERVAL:
+            # La lectura completa ya incluye los cambios pendientes
+            self.registry.reconcile(get_subscription_rows(), last_alerts=self._restored_alerts)
+            self._restored_alerts = {}
+            self._last_refresh = now
+        elif not any([self.registry.apply(change) for change in changes]):
+            return False
+
+        token_wallets = {
+            wallet_address for wallet_address, subscriptions in self.registry.subscriptions.items()
+            if any(subscription.track_tokens for subscription in subscriptions)
+        }
+        self.tokens.sync(token_wallets, get_token_accounts() if token_wallets else [])
+        return True
+
+    async def process_balances(self, balances: dict[str, int]) -> set[str]:
+        # Devuelve las direcciones cuyo saldo cambió respecto a la última observación
+        changed = set()
+        ts = int(time.time())
+        since = {wallet_address: self._observed_at[wallet_address] for wallet_address in balances if wallet_address in self._observed_at}
+        for wallet_address, lamports in balances.items():
+            self._observed_at[wallet_address] = ts
+            previous = self._last_lamports.get(wallet_address)
+            if previous != lamports:
+                self._pending_history.append((wallet_address, ts, lamports))
+                if previous is not None:
+                    changed.add(wallet_address)
+                self._last_lamports[wallet_address] = lamports
+
+        # Todas las reglas en una pasada vectorial; solo se leen las transacciones de las direcciones que alertan
+        rows, reasons, baselines = self.registry.rules.evaluate(balances, time.time())
+        alerts = {}
+        for row, reason, old_lamports in zip(rows.tolist(), reasons.tolist(), baselines.tolist()):
+            wallet_address, subscription = self.registry.rows[row]
+            # La referencia se actualiza ya: una relectura de suscripciones durante la clasificación la conserva
+            subscription.lamports = balances[wallet_address]
+            self._pending_writes[(subscription.chat_id, subscription.group_id, wallet_address)] = subscription.lamports
+            alerts.setdefault(wallet_address, []).append(
+                (subscription, old_lamports, reason, int(self.registry.rules.below[row]), int(self.registry.rules.above[row])))
+        # El precio se lee una vez para todas las alertas del ciclo
+        classifications, prices = await asyncio.gather(self.classify(list(alerts), since), self.quote([SOL_MINT] if alerts else []))
+
+        tasks = [
+            self.fetch_and_update_balance(wallet_address, balances[wallet_address], wallet_alerts,
+                                          classifications.get(wallet_address, []), prices.get(SOL_MINT))
+            for wallet_address, wallet_alerts in alerts.items()
+        ]
+        await asyncio.gather(*tasks)
+        self.flush()
+        return changed
+
+    async def process_token_amounts(self, amounts: dict[str, int], changed: set[str], now: float) -> set[str]:
+        # Aplica las cantidades sondeadas y redescubre las cuentas de las wallets con movimiento de SOL;
+        # devuelve las cuentas de token que cambiaron
+        token_changes, changed_accounts = self.tokens.apply_amounts(amounts)
+        discovery = self.tokens.due_discovery(changed, now)
+        if discovery:
+            token_changes += await self.tokens.discover(discovery)
+        alerts = []
+        for wallet_address, mint, old_amount, new_amount, decimals in token_changes:
+            subscriptions = [subscription for subscription in self.registry.subscriptions.get(wallet_address, ()) if subscription.track_tokens]
+            if subscriptions:
+                alerts.append((wallet_address, mint, old_amount, new_amount, decimals, subscriptions))
+        # Los precios de todos los mints con alerta en una sola consulta
+        prices = await self.quote({alert[1] for alert in alerts})
+        for wallet_address, mint, old_amount, new_amount, decimals, subscriptions in alerts:
+            await self.fetch_and_update_token_balance(wallet_address, mint, old_amount, new_amount, decimals, subscriptions,
+                                                      prices.get(mint))
+        self.flush()
+        return changed_accounts
+
+    async def quote(self, mints) -> dict[str, float]:
+        # Precio en USD de cada mint que lo tenga; sin API de precios las alertas salen solo con cantidades
+        if self.prices is None or not mints:
+            return {}
+        return await self.prices.get(mints)
+
+    async def classify(self, addresses: list[str], since: dict[str, float]) -> dict[str, list[Classification]]:
+        # Si no se pueden leer las transacciones la alerta sale igualmente, clasificada por el saldo
+        if self.classifier is None or not addresses:
+            return {}
+        try:
+            return await self.classifier.classify(addresses, since)
+        except (RPCError, sqlite3.Error) as e:
+            logger.error(f'Error al clasificar las transacciones de {len(addresses)} wallets: {str(e)}')
+            return {}
+
+    def flush(self) -> None:
+        # Escribe los saldos modificados, los tokens y los puntos del histórico en una única transacción
+        token_accounts, closed_accounts, token_balances = self.tokens.pending()
+        if not self._pending_writes and not self._pending_history and not token_accounts and not closed_accounts and not token_balances:
+            return
+        rows = [(lamports, group_id, wallet_address) for (_, group_id, wallet_address), lamports in self._pending_writes.items()]
+        try:
+            with storage.transaction():
+                update_wallet_balances(rows)
+                append_points(self._pending_history)
+                update_token_accounts(token_accounts, closed_accounts)
+                update_token_balances(token_balances)
+        except sqlite3.Error as e:
+            # Se conservan los cambios pendientes y se reintenta en el siguiente ciclo
+            logger.error(f'Error al guardar {len(rows)} saldos y {len(self._pending_history)} puntos del histórico: {str(e)}')
+            return
+        # Las páginas de grupo en caché con saldos antiguos dejan de ser válidas
+        self.on_saved({(chat_id, group_id) for chat_id, group_id, _ in self._pending_writes} | self._pending_token_groups)
+        self._pending_writes.clear()
+        self._pending_history.clear()
+        self._pending_token_groups.clear()
+        self.tokens.clear_pending()
+
+    async def fetch_and_update_balance(self, wallet_address: str, lamports: int, alerts: list[tuple],
+                                       classifications: list[Classification] = (), sol_price: float = None) -> None:
+        # alerts: (suscripción, saldo de referencia anterior, motivo, umbral inferior, umbral superior) de cada
+        # suscripción de la dirección cuya regla ha saltado
+        new_balance = lamports / LAMPORTS_PER_SOL
+        for subscription, old_lamports, reason, below_lamports, above_lamports in alerts:
+            old_balance = old_lamports / LAMPORTS_PER_SOL
+            cambio_balance = new_balance - old_balance
+            if classifications:
+                tipo_de = ", ".join(dict.fromkeys(classification.kind for classification in classifications))
+            else:
                 tipo_de = classify_balance_change(cambio_balance)
+            detalle = "".join(format_classification(classification) for classification in classifications[-MAX_ALERT_TRANSACTIONS:])
+            if reason & REASON_BELOW:
+                detalle += f"📏 *Regla:* saldo por debajo de {below_lamports / LAMPORTS_PER_SOL:.9f} SOL\n"
+            if reason & REASON_ABOVE:
+                detalle += f"📏 *Regla:* saldo por encima de {above_lamports / LAMPORTS_PER_SOL:.9f} SOL\n"
 
-                solscan_url = f"https://solscan.io/account/{wallet_address}"
-                message = f"""
+            tag = subscription.tag
+            solscan_url = f"https://solscan.io/account/{wallet_address}"
+            message = f"""
                 🚨 *Cambio de saldo en la wallet* {'- 🏷️ ' + tag if tag else ''} `{wallet_address}`
 
-💸 *Grupo:* `{group_name}`
-🪙 *Saldo anterior:* {old_balance:.9f} SOL
-💎 *Nuevo saldo:* {new_balance:.9f} SOL
+💸 *Grupo:* `{subscription.group_name}`
+🪙 *Saldo anterior:* {old_balance:.9f} SOL{format_usd(old_balance, sol_price)}
+💎 *Nuevo saldo:* {new_balance:.9f} SOL{format_usd(new_balance, sol_price)}
 🛑 *Tipo de cambio:* {tipo_de}
-
+{detalle}
 🔗 [Ver en Solscan]({solscan_url})
                 """
 
-                await application.bot.send_message(
-                    chat_id,
-                    message,
-                    parse_mode="Markdown"
-                )
-            else:
-                conn.close()
+            # El envío lo hace el dispatcher: el sondeo no espera a Telegram
+            self.notifier.enqueue(subscription.chat_id, message)
+
+    async def fetch_and_update_token_balance(self, wallet_address: str, mint: str, old_amount: int, new_amount: int,
+                                             decimals: int, subscriptions: list[Subscription], price: float = None) -> None:
+        old_balance = old_amount / 10 ** decimals
+        new_balance = new_amount / 10 ** decimals
+        tipo_de = "Entrada de token" if new_amount > old_amount else "Salida de token"
+        for subscription in subscriptions:
+            self._pending_token_groups.add((subscription.chat_id, subscription.group_id))
+
+            tag = subscription.tag
+            solscan_url = f"https://solscan.io/token/{mint}"
+            message = f"""
+                🪙 *Cambio de tokens en la wallet* {'- 🏷️ ' + tag if tag else ''} `{wallet_address}`
+
+💸 *Grupo:* `{subscription.group_name}`
+🔹 *Token:* `{mint}`
+📉 *Cantidad anterior:* {old_balance:,.{decimals}f}{format_usd(old_balance, price)}
+📈 *Nueva cantidad:* {new_balance:,.{decimals}f}{format_usd(new_balance, price)}
+🛑 *Tipo de cambio:* {tipo_de}
+
+🔗 [Ver token en Solscan]({solscan_url})
+                """
+
+            self.notifier.enqueue(subscription.chat_id, message)
+
+async def run_until_stopped(*coroutines, stopping: asyncio.Event = None) -> None:
+    # Ejecuta las corrutinas hasta que una termina o falla (su error se propaga) o se pide parar,
+    # y cancela el resto
+    tasks = [asyncio.create_task(coroutine) for coroutine in coroutines]
+    if stopping is not None:
+        tasks.append(asyncio.create_task(stopping.wait()))
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def run_worker(queue, inbox) -> None:
+    # Punto de entrada de cada proceso de monitoreo
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    try:
+        asyncio.run(_run_worker(queue, inbox))
+    except KeyboardInterrupt:
+        pass
+
+async def _run_worker(queue, inbox) -> None:
+    sink = QueueSink(queue)
+    monitor = WalletMonitor(sink, on_saved=sink.invalidate_groups)
+    # Sin concesiones todavía no se vigila ninguna partición
+    monitor.set_partitions(set())
+    leases = LeaseManager(worker_name())
+    # WorkerPool para los procesos con SIGTERM: se termina el ciclo en curso y se liberan las particiones
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, monitor.stop)
+    run = monitor.run_pubsub if MONITOR_MODE == 'websocket' else monitor.run_polling
+    try:
+        await run_until_stopped(run(), renew_leases(monitor, leases), receive_changes(monitor, inbox), forward_metrics(sink))
+    finally:
+        leases.release()
+        await monitor.close()
+        sink.send_metrics()
 
 def classify_balance_change(cambio_balance: float) -> str:
-    if cambio_balance < -0.002039:
-        return "Compra de token"
-    elif cambio_balance == -0.002039:
-        return "Transferencia de Token"
-    elif cambio_balance > -0.002039:
-        return "Venta de Token"
+    # Solo cuando no se han podido leer las transacciones: sin ellas únicamente se conoce el sentido del cambio
+    if cambio_balance > 0:
+        return "Entrada de SOL"
+    elif cambio_balance < 0:
+        return "Salida de SOL"
     else:
-        return "Sin Clasificación"
\ No newline at end of file
+        return "Sin Clasificación"
+
+def format_classification(classification: Classification) -> str:
+    line = f"🔁 {classification.kind}"
+    if classification.mint:
+        line += f": {classification.amount:+,.6f} `{classification.mint}`"
+    if classification.sol:
+        line += f" · {classification.sol:+.6f} SOL"
+    return f"{line} ([tx](https://solscan.io/tx/{classification.signature}))\n"
+
+def format_usd(amount: float, price: float) -> str:
+    return f" (≈ {amount * price:,.2f} USD)" if price is not None else ""
\ No newline at end of file
@@ -0,0 +1,183 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from config import TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_SEND_CONCURRENCY
+from utils import TokenBucket
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 4096
+DIGEST_SEPARATOR = "\n━━━━━━━━━━━━\n"
+MAX_SEND_ATTEMPTS = 5
+
+class NotificationDispatcher:
+    # Cola de salida de mensajes de Telegram desacoplada del monitor. Respeta el límite
+    # global y el de cada chat, y agrupa en un único resumen los mensajes de un mismo
+    # chat que se acumulan mientras ese chat espera su turno.
+
+    def __init__(self, bot, global_rate: float = TELEGRAM_GLOBAL_RATE, chat_rate: float = TELEGRAM_CHAT_RATE,
+                 concurrency: int = TELEGRAM_SEND_CONCURRENCY):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.concurrency = concurrency
+        self._global_bucket = TokenBucket(global_rate)
+        self._chat_buckets = {}     # chat_id -> TokenBucket
+        self._pending = {}          # chat_id -> [(instante de encolado, texto)]
+        self._attempts = {}         # chat_id -> intentos fallidos del envío en curso
+        # chat_id -> 'split' (mensajes de uno en uno) o 'plain' (el siguiente sin Markdown), tras un
+        # error de formato; un mensaje mal formado no arrastra al resto del resumen
+        self._fallback = {}
+        self._ready = []            # heap (instante en que el chat puede enviar, secuencia, chat_id)
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.enqueued = 0
+        metrics.notification_queue_depth.function = self.pending_count
+
+    def enqueue(self, chat_id: int, text: str) -> None:
+        self.enqueued += 1
+        self._idle.clear()
+        if chat_id not in self._pending:
+            self._pending[chat_id] = []
+            self._schedule(chat_id, time.monotonic() + self._chat_bucket(chat_id).delay())
+        self._pending[chat_id].append((time.monotonic(), text))
+
+    def pending_count(self) -> int:
+        return sum(len(parts) for parts in self._pending.values())
+
+    def snapshot(self) -> dict[str, list[str]]:
+        # Mensajes sin enviar de cada chat, para el punto de control al apagar
+        return {str(chat_id): [text for _, text in parts] for chat_id, parts in self._pending.items()}
+
+    def restore(self, pending: dict[str, list[str]], elapsed: float) -> None:
+        for chat_id, texts in pending.items():
+            for text in texts:
+                self.enqueue(int(chat_id), text)
+
+    async def run(self) -> None:
+        await asyncio.gather(*(self._worker() for _ in range(max(1, self.concurrency))))
+
+    async def drain(self, timeout: float) -> bool:
+        # Espera a que se vacíe la cola; devuelve False si quedan mensajes al agotar el plazo
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return not self._pending
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate)
+        return bucket
+
+    def _schedule(self, chat_id: int, ready_at: float) -> None:
+        heapq.heappush(self._ready, (ready_at, next(self._counter), chat_id))
+        self._wakeup.set()
+
+    async def _next_chat(self) -> int:
+        while True:
+            now = time.monotonic()
+            if self._ready and self._ready[0][0] <= now:
+                return heapq.heappop(self._ready)[2]
+            timeout = self._ready[0][0] - now if self._ready else None
+            self._wakeup.clear()
+            # asyncio.wait en lugar de wait_for: en Python 3.11 wait_for se traga la cancelación del worker si
+            # llega a la vez que el aviso, y el apagado esperaría a un worker que ya no termina
+            wakeup = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait((wakeup,), timeout=timeout)
+            finally:
+                wakeup.cancel()
+
+    async def _worker(self) -> None:
+        # telegram se importa al empezar a enviar: los procesos de monitoreo solo encolan
+        from telegram.error import RetryAfter, BadRequest, Forbidden, NetworkError, TelegramError
+        while True:
+            chat_id = await self._next_chat()
+            bucket = self._chat_bucket(chat_id)
+            if not bucket.try_acquire():
+                self._schedule(chat_id, time.monotonic() + bucket.delay())
+                continue
+            await self._global_bucket.acquire()
+
+            # Todo lo acumulado para el chat hasta este momento sale en un solo resumen
+            parts = self._pending[chat_id]
+            fallback = self._fallback.get(chat_id)
+            text, sent = build_digest([text for _, text in (parts[:1] if fallback else parts)])
+            try:
+                await self.bot.send_message(chat_id, text, parse_mode=None if fallback == 'plain' else "Markdown")
+            except RetryAfter as e:
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+                logger.warning(f'Control de flujo de Telegram en el chat {chat_id}: reintento en {retry_after}s')
+                metrics.notifications_sent.inc(sent, result='flood_control')
+                self._schedule(chat_id, time.monotonic() + retry_after)
+                continue
+            except BadRequest as e:
+                # BadRequest hereda de NetworkError, pero reintentarlo no sirve: si es el Markdown, los mensajes se
+                # reenvían por separado y el que falle sale como texto plano; si no, se descarta
+                if "can't parse entities" in str(e).lower() and fallback != 'plain':
+                    logger.warning(f'Error de formato al notificar al chat {chat_id}: {str(e)}')
+                    self._fallback[chat_id] = 'split' if sent > 1 else 'plain'
+                    self._schedule(chat_id, time.monotonic() + bucket.delay())
+                    continue
+                logger.error(f'No se pudo notificar al chat {chat_id}: {str(e)}')
+                metrics.notifications_sent.inc(sent, result='dropped')
+            except Forbidden as e:
+                # Bot bloqueado o expulsado: tampoco se entregará nada de lo que queda para el chat
+                sent = len(parts)
+                logger.error(f'Se descartan {sent} notificaciones para el chat {chat_id}: {str(e)}')
+                metrics.notifications_sent.inc(sent, result='dropped')
+            except NetworkError as e:
+                attempts = self._attempts.get(chat_id, 0) + 1
+                if attempts < MAX_SEND_ATTEMPTS:
+                    self._attempts[chat_id] = attempts
+                    logger.warning(f'Error de red al notificar al chat {chat_id} (intento {attempts}): {str(e)}')
+                    metrics.notifications_sent.inc(sent, result='retried')
+                    self._schedule(chat_id, time.monotonic() + 2 ** attempts)
+                    continue
+                logger.error(f'Se descartan {sent} notificaciones para el chat {chat_id} tras {attempts} intentos: {str(e)}')
+                metrics.notifications_sent.inc(sent, result='dropped')
+            except TelegramError as e:
+                # Errores permanentes (bot bloqueado, chat inexistente...): no tiene sentido reintentar
+                logger.error(f'No se pudo notificar al chat {chat_id}: {str(e)}')
+                metrics.notifications_sent.inc(sent, result='dropped')
+            except Exception:
+                logger.exception(f'Error inesperado al notificar al chat {chat_id}')
+                metrics.notifications_sent.inc(sent, result='dropped')
+            else:
+                now = time.monotonic()
+                for enqueued_at, _ in parts[:sent]:
+                    metrics.notification_latency.observe(now - enqueued_at)
+                metrics.notifications_sent.inc(sent, result='sent')
+
+            self._attempts.pop(chat_id, None)
+            if fallback == 'plain':
+                self._fallback[chat_id] = 'split'
+            del parts[:sent]
+            if parts:
+                self._schedule(chat_id, time.monotonic() + bucket.delay())
+            else:
+                self._fallback.pop(chat_id, None)
+                del self._pending[chat_id]
+                if not self._pending:
+                    self._idle.set()
+
+def build_digest(texts: list[str]) -> tuple[str, int]:
+    # Une los mensajes que caben en un solo envío; devuelve el texto y cuántos incluye. Un mensaje
+    # demasiado largo se corta en un salto de línea para no partir una entidad Markdown
+    digest = texts[0]
+    if len(digest) > MAX_MESSAGE_LENGTH:
+        cut = digest.rfind('\n', 0, MAX_MESSAGE_LENGTH)
+        digest = digest[:cut if cut > 0 else MAX_MESSAGE_LENGTH]
+    count = 1
+    for text in texts[1:]:
+        if len(digest) + len(DIGEST_SEPARATOR) + len(text) > MAX_MESSAGE_LENGTH:
+            break
+        digest += DIGEST_SEPARATOR + text
+        count += 1
+    return digest, count
@@ -0,0 +1,139 @@
+import asyncio
+from abc import ABC, abstractmethod
+import logging
+import time
+import httpx
+from config import PRICE_API_URL, PRICE_TTL, PRICE_MAX_AGE, PRICE_REFRESH_INTERVAL, PRICE_BATCH_SIZE, PRICE_TIMEOUT
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Precios en USD para las alertas. La caché renueva en segundo plano, una vez por intervalo y en una
+# sola consulta por lote de mints, los precios usados recientemente; así todas las alertas de un ciclo
+# leen la misma cotización sin esperar a la API. Un precio caducado se sigue sirviendo mientras se
+# renueva, y las peticiones simultáneas de un mismo mint comparten la consulta en curso.
+
+# Mint de SOL envuelto: el precio de SOL se pide como el de un token más
+SOL_MINT = 'So11111111111111111111111111111111111111112'
+
+class PriceError(Exception):
+    pass
+
+class PriceSource(ABC):
+    # Origen de precios intercambiable: fetch devuelve mint -> precio en USD, omite los mints sin
+    # precio y lanza PriceError si la consulta falla
+    @abstractmethod
+    async def fetch(self, mints: list[str]) -> dict[str, float]:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+class HTTPPriceSource(PriceSource):
+    # API con el formato de Jupiter Price v3: GET url?ids=a,b -> {mint: {"usdPrice": precio, ...}}
+    def __init__(self, url: str = PRICE_API_URL, batch_size: int = PRICE_BATCH_SIZE, timeout: float = PRICE_TIMEOUT):
+        self.url = url
+        self.batch_size = batch_size
+        self._client = httpx.AsyncClient(timeout=timeout)
+
+    async def fetch(self, mints: list[str]) -> dict[str, float]:
+        batches = [mints[i:i + self.batch_size] for i in range(0, len(mints), self.batch_size)]
+        prices = {}
+        for batch_prices in await asyncio.gather(*(self._fetch_batch(batch) for batch in batches)):
+            prices.update(batch_prices)
+        return prices
+
+    async def _fetch_batch(self, mints: list[str]) -> dict[str, float]:
+        try:
+            with metrics.price_fetch_seconds.time():
+                response = await self._client.get(self.url, params={'ids': ','.join(mints)})
+            if response.status_code != 200:
+                raise PriceError(f'HTTP {response.status_code}')
+            quotes = response.json()
+            return {
+                mint: float(quotes[mint]['usdPrice']) for mint in mints
+                if isinstance(quotes.get(mint), dict) and quotes[mint].get('usdPrice') is not None
+            }
+        except (httpx.HTTPError, ValueError, TypeError, AttributeError) as e:
+            raise PriceError(f'{type(e).__name__}: {str(e)}') from e
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+class PriceCache:
+    def __init__(self, source: PriceSource, ttl: float = PRICE_TTL, max_age: float = PRICE_MAX_AGE,
+                 refresh_interval: float = PRICE_REFRESH_INTERVAL):
+        self.source = source
+        self.ttl = ttl
+        self.max_age = max(ttl, max_age)
+        self.refresh_interval = refresh_interval
+        self._quotes = {}               # mint -> (precio en USD, instante de la consulta)
+        self._pending = {}              # mint -> consulta en curso que lo incluye
+        self._used = {SOL_MINT: 0.0}    # mint -> último uso; SOL se renueva siempre
+        # Tras un fallo de la API las alertas no la esperan hasta la siguiente renovación periódica
+        self._failed_until = 0.0
+
+    async def get(self, mints) -> dict[str, float]:
+        # Precio en USD de cada mint; los que no tienen precio o lo tienen demasiado antiguo se omiten
+        now = time.monotonic()
+        stale, missing = [], []
+        for mint in mints:
+            self._used[mint] = now
+            quote = self._quotes.get(mint)
+            if quote is None or now - quote[1] > self.max_age:
+                missing.append(mint)
+                metrics.price_lookups.inc(result='miss')
+            elif now - quote[1] > self.ttl:
+                stale.append(mint)
+                metrics.price_lookups.inc(result='stale')
+            else:
+                metrics.price_lookups.inc(result='hit')
+        if stale:
+            # Se responde con el precio anterior sin esperar a la renovación
+            self._refresh(stale)
+        if missing and now >= self._failed_until:
+            await asyncio.wait(self._refresh(missing))
+        now = time.monotonic()
+        return {mint: self._quotes[mint][0] for mint in mints if mint in self._quotes and now - self._quotes[mint][1] <= self.max_age}
+
+    def _refresh(self, mints: list[str]) -> set[asyncio.Task]:
+        # Una sola consulta en curso por mint: quien lo pida mientras tanto espera la misma
+        tasks = {self._pending[mint] for mint in mints if mint in self._pending}
+        new = [mint for mint in dict.fromkeys(mints) if mint not in self._pending]
+        if new:
+            task = asyncio.create_task(self._fetch(new))
+            for mint in new:
+                self._pending[mint] = task
+            tasks.add(task)
+        return tasks
+
+    async def _fetch(self, mints: list[str]) -> None:
+        try:
+            prices = await self.source.fetch(mints)
+            now = time.monotonic()
+            for mint, price in prices.items():
+                self._quotes[mint] = (price, now)
+        except PriceError as e:
+            self._failed_until = time.monotonic() + self.refresh_interval
+            metrics.price_errors.inc()
+            logger.warning(f'Error al consultar el precio de {len(mints)} mints: {str(e)}')
+        finally:
+            for mint in mints:
+                self._pending.pop(mint, None)
+
+    async def run(self) -> None:
+        # Renovación periódica de los precios usados; los que nadie pide en max_age se olvidan
+        while True:
+            now = time.monotonic()
+            for mint in [mint for mint, used in self._used.items() if mint != SOL_MINT and now - used > self.max_age]:
+                del self._used[mint]
+                self._quotes.pop(mint, None)
+            await asyncio.wait(self._refresh(list(self._used)))
+            await asyncio.sleep(self.refresh_interval)
+
+    async def close(self) -> None:
+        await self.source.close()
+
+def get_price_cache():
+    # None si no hay API de precios configurada
+    return PriceCache(HTTPPriceSource()) if PRICE_API_URL else None
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable
+import websockets
+from config import PUBSUB_CONNECTIONS
+
+logger = logging.getLogger(__name__)
+
+MAX_RECONNECT_DELAY = 60
+
+class PubSubConnection:
+    def __init__(self, url: str, on_notification: Callable[[str, int], None], on_reconnect: Callable[[list[str]], Awaitable[None]]):
+        self.url = url
+        self.addresses = set()          # direcciones asignadas a esta conexión
+        self.on_notification = on_notification
+        self.on_reconnect = on_reconnect
+        self._ws = None
+        self._request_id = 0
+        self._pending = {}              # id de petición -> dirección pendiente de suscribir
+        self._subscription_ids = {}     # dirección -> id de suscripción
+        self._addresses_by_id = {}      # id de suscripción -> dirección
+        self._catch_up_task = None
+
+    async def run(self) -> None:
+        delay = 1
+        while True:
+            try:
+                async with websockets.connect(self.url, ping_interval=20, max_size=None) as ws:
+                    self._ws = ws
+                    delay = 1
+                    # Tras (re)conectar se vuelven a suscribir todas las direcciones asignadas
+                    for address in list(self.addresses):
+                        await self._send_subscribe(address)
+                    # Sondeo de recuperación para cubrir los cambios ocurridos sin conexión
+                    if self.addresses:
+                        self._catch_up_task = asyncio.create_task(self.on_reconnect(list(self.addresses)))
+                    async for raw in ws:
+                        await self._handle_message(raw)
+                logger.warning(f'Conexión PubSub cerrada por el servidor ({self.url})')
+            except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+                logger.warning(f'Conexión PubSub perdida ({self.url}): {str(e)}')
+            finally:
+                self._ws = None
+                self._pending.clear()
+                self._subscription_ids.clear()
+                self._addresses_by_id.clear()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    async def subscribe(self, address: str) -> None:
+        self.addresses.add(address)
+        if self._ws is not None:
+            await self._send_subscribe(address)
+
+    async def unsubscribe(self, address: str) -> None:
+        self.addresses.discard(address)
+        subscription_id = self._subscription_ids.pop(address, None)
+        if subscription_id is not None:
+            self._addresses_by_id.pop(subscription_id, None)
+            await self._send("accountUnsubscribe", [subscription_id])
+
+    async def _send(self, method: str, params: list) -> int:
+        self._request_id += 1
+        try:
+            await self._ws.send(json.dumps({"jsonrpc": "2.0", "id": self._request_id, "method": method, "params": params}))
+        except (AttributeError, websockets.exceptions.ConnectionClosed):
+            # La conexión se cerró; el bucle de reconexión volverá a suscribir
+            pass
+        return self._request_id
+
+    async def _send_subscribe(self, address: str) -> None:
+        request_id = await self._send("accountSubscribe", [address, {"encoding": "base64", "commitment": "confirmed"}])
+        self._pending[request_id] = address
+
+    async def _handle_message(self, raw: str) -> None:
+        message = json.loads(raw)
+        if message.get('method') == 'accountNotification':
+            params = message['params']
+            address = self._addresses_by_id.get(params['subscription'])
+            if address is not None:
+                value = params['result']['value']
+                self.on_notification(address, value['lamports'] if value else 0)
+        elif 'id' in message:
+            address = self._pending.pop(message['id'], None)
+            if address is None:
+                return
+            if 'error' in message:
+                logger.error(f"Error al suscribir {address}: {message['error']}")
+                return
+            subscription_id = message['result']
+            self._subscription_ids[address] = subscription_id
+            self._addresses_by_id[subscription_id] = address
+            # La dirección pudo retirarse mientras la suscripción estaba pendiente
+            if address not in self.addresses:
+                await self.unsubscribe(address)
+
+class PubSubClient:
+    def __init__(self, url: str, on_change: Callable[[dict[str, int]], Awaitable[None]],
+                 fetch_balances: Callable[[list[str]], Awaitable[dict[str, int]]], connections: int = PUBSUB_CONNECTIONS):
+        self.on_change = on_change
+        self.fetch_balances = fetch_balances
+        self._connections = [PubSubConnection(url, self._on_notification, self._catch_up) for _ in range(max(1, connections))]
+        self._assignment = {}   # dirección -> conexión que la tiene suscrita
+        self._buffer = {}
+        self._ready = asyncio.Event()
+
+    async def run(self) -> None:
+        await asyncio.gather(self._dispatch(), *(connection.run() for connection in self._connections))
+
+    async def sync(self, addresses: set[str]) -> None:
+        for address in [address for address in self._assignment if address not in addresses]:
+            await self._assignment.pop(address).unsubscribe(address)
+        for address in addresses:
+            if address not in self._assignment:
+                # Repartir las suscripciones de forma equilibrada entre las conexiones
+                connection = min(self._connections, key=lambda c: len(c.addresses))
+                self._assignment[address] = connection
+                await connection.subscribe(address)
+
+    def push(self, balances: dict[str, int]) -> None:
+        self._buffer.update(balances)
+        self._ready.set()
+
+    def _on_notification(self, address: str, lamports: int) -> None:
+        self.push({address: lamports})
+
+    async def _catch_up(self, addresses: list[str]) -> None:
+        self.push(await self.fetch_balances(addresses))
+
+    async def _dispatch(self) -> None:
+        # Las notificaciones que llegan mientras se procesa un lote se agrupan en el siguiente
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            balances, self._buffer = self._buffer, {}
+            try:
+                await self.on_change(balances)
+            except Exception:
+                logger.exception('Error al procesar los cambios de saldo recibidos por PubSub')
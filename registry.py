@@ -0,0 +1,153 @@
+import itertools
+import numpy as np
+from database import get_subscription_rows
+from rules import RuleEngine, resolve_rule
+from sharding import partition_of
+
+# Registro en memoria de las suscripciones que vigila el monitor. Se carga una vez al arrancar y
+# después se mantiene con los cambios que publican los manejadores del bot (wallets añadidas o
+# quitadas, grupos borrados o activados, tags, reglas); una reconciliación periódica con la base de
+# datos corrige lo que no haya llegado por ese canal. Las filas de las reglas de alerta, las
+# suscripciones por dirección y el grupo de cada fila se actualizan en su sitio: una reconciliación
+# sin diferencias no reconstruye nada.
+
+# Funciones que reciben los cambios publicados en este proceso
+_listeners = []
+
+def subscribe(listener) -> None:
+    _listeners.append(listener)
+
+def publish(*change) -> None:
+    # ('wallets_added', group_id), ('wallets_removed', group_id, [direcciones]), ('group_removed', group_id),
+    # ('group_changed', group_id) tras activar o desactivar notificaciones o tokens o cambiar sus reglas,
+    # ('tag_set', chat_id, dirección, tag)
+    for listener in _listeners:
+        listener(change)
+
+class Subscription:
+    __slots__ = ('chat_id', 'group_id', 'group_name', 'tag', 'lamports', 'track_tokens', 'rule')
+
+    def __init__(self, chat_id: int, group_id: int, group_name: str, tag: str, lamports: int, track_tokens: bool = False,
+                 rule: tuple = (None,) * 5):
+        self.chat_id = chat_id
+        self.group_id = group_id
+        self.group_name = group_name
+        self.tag = tag
+        self.lamports = lamports
+        self.track_tokens = track_tokens
+        # Campos de la regla tal como salen de la base de datos (None = sin fijar)
+        self.rule = rule
+
+class SubscriptionRegistry:
+    def __init__(self):
+        # Índice dirección -> suscripciones (chat, grupo, tag) con el último saldo conocido de cada una
+        self.subscriptions = {}
+        # (dirección, suscripción) de cada fila de las reglas y grupo de cada fila
+        self.rows = []
+        self.groups = np.empty(0, dtype=np.int64)
+        self.rules = RuleEngine()
+        # Particiones de direcciones que se cargan (None = todas)
+        self.partitions = None
+        # Nombres de grupo y reglas repetidos se guardan una sola vez; tras quitar filas pueden sobrar
+        self._shared = {}
+        self._removed = False
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def apply(self, change: tuple) -> bool:
+        # Devuelve True si cambió alguna suscripción
+        kind, *args = change
+        if kind in ('wallets_added', 'group_changed'):
+            group_id, = args
+            return self.reconcile(get_subscription_rows(group_id), group_id=group_id)
+        if kind == 'group_removed':
+            group_id, = args
+            return self._remove(self.groups == group_id)
+        if kind == 'wallets_removed':
+            group_id, wallet_addresses = args
+            ids = [self.rules.wallet_ids[address] for address in wallet_addresses if address in self.rules.wallet_ids]
+            return self._remove((self.groups == group_id) & np.isin(self.rules.wallet, ids))
+        if kind == 'tag_set':
+            chat_id, wallet_address, tag = args
+            for subscription in self.subscriptions.get(wallet_address, ()):
+                if subscription.chat_id == chat_id:
+                    subscription.tag = tag
+            return False
+        raise ValueError(f'Cambio de suscripciones desconocido: {kind}')
+
+    def reconcile(self, db_rows: list[tuple], group_id: int = None, last_alerts: dict = None) -> bool:
+        # Ajusta el registro a las filas de get_subscription_rows (todas o las de un grupo): las suscripciones
+        # nuevas se añaden, las que faltan se quitan y el resto se actualiza en su sitio conservando su saldo
+        # de referencia y su última alerta. last_alerts: (group_id, dirección) -> instante, para las nuevas
+        scope = range(len(self.rows)) if group_id is None else np.flatnonzero(self.groups == group_id).tolist()
+        current = {(self.rows[index][1].group_id, self.rows[index][0]): index for index in scope}
+        changed = False
+        added = []
+        for wallet_address, chat_id, row_group_id, group_name, tag, lamports, track_tokens, *rule in db_rows:
+            if self.partitions is not None and partition_of(wallet_address) not in self.partitions:
+                continue
+            key = (row_group_id, wallet_address)
+            index = current.pop(key, None)
+            rule = tuple(rule)
+            if index is None:
+                subscription = Subscription(chat_id, row_group_id, self._share(group_name), tag, lamports, bool(track_tokens),
+                                            self._share(rule))
+                added.append((wallet_address, subscription, (last_alerts or {}).get(key, float('-inf'))))
+                continue
+            subscription = self.rows[index][1]
+            if (subscription.group_name, subscription.tag, subscription.track_tokens, subscription.rule) != (group_name, tag, bool(track_tokens), rule):
+                subscription.group_name = self._share(group_name)
+                subscription.tag = tag
+                subscription.track_tokens = bool(track_tokens)
+                if subscription.rule != rule:
+                    subscription.rule = self._share(rule)
+                    self.rules.set_rule(index, resolve_rule(*rule))
+                changed = True
+
+        if current:
+            removed = np.zeros(len(self.rows), dtype=bool)
+            removed[list(current.values())] = True
+            changed |= self._remove(removed)
+        if added:
+            self._add(added)
+            changed = True
+        if group_id is None and self._removed:
+            # Sin limpiar, los valores compartidos y los números de dirección de las reglas crecerían sin límite
+            self._shared = {value: value for _, subscription in self.rows for value in (subscription.group_name, subscription.rule)}
+            if len(self.rules.wallet_ids) > 2 * len(self.subscriptions):
+                self.rules.compact()
+            self._removed = False
+        return changed
+
+    def _share(self, value):
+        return self._shared.setdefault(value, value)
+
+    def _add(self, added: list[tuple]) -> None:
+        # added: (dirección, suscripción, última alerta)
+        for wallet_address, subscription, _ in added:
+            self.rows.append((wallet_address, subscription))
+            self.subscriptions.setdefault(wallet_address, []).append(subscription)
+        self.groups = np.concatenate((self.groups, np.fromiter((subscription.group_id for _, subscription, _ in added),
+                                                               dtype=np.int64, count=len(added))))
+        self.rules.append([wallet_address for wallet_address, _, _ in added],
+                          [subscription.lamports for _, subscription, _ in added],
+                          [resolve_rule(*subscription.rule) for _, subscription, _ in added],
+                          [last_alert for _, _, last_alert in added])
+
+    def _remove(self, removed: np.ndarray) -> bool:
+        # removed: máscara booleana de las filas que se quitan
+        if not removed.any():
+            return False
+        for index in np.flatnonzero(removed).tolist():
+            wallet_address, subscription = self.rows[index]
+            subscriptions = self.subscriptions[wallet_address]
+            subscriptions.remove(subscription)
+            if not subscriptions:
+                del self.subscriptions[wallet_address]
+        keep = ~removed
+        self.rows = list(itertools.compress(self.rows, keep.tolist()))
+        self.groups = self.groups[keep]
+        self.rules.take(keep)
+        self._removed = True
+        return True
@@ -0,0 +1,324 @@
+import asyncio
+import base64
+import logging
+import time
+from typing import Awaitable, Callable
+from urllib.parse import urlsplit
+import httpx
+from config import (
+    SOLANA_RPC_URLS, RPC_ENDPOINT_RPS, RPC_HEDGE_DELAY, RPC_MAX_ATTEMPTS, RPC_BATCH_SIZE, RPC_CONCURRENCY,
+    RPC_TIMEOUT, RPC_MAX_CONNECTIONS
+)
+from utils import TokenBucket
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LAMPORTS_PER_SOL = 10**9
+MAX_BATCH_SIZE = 100
+
+# Programas de token SPL y Token-2022; en ambos el campo amount (u64) empieza en el byte 64 de la cuenta
+TOKEN_PROGRAM_IDS = ('TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA', 'TokenzQdBNbLqP5VEhdkAS6EPFLC1PHnBqCXEpPxuEb')
+TOKEN_AMOUNT_OFFSET = 64
+
+# Peso del último resultado en las medias móviles de latencia y errores
+HEALTH_ALPHA = 0.2
+MAX_BACKOFF = 60
+
+class RPCError(Exception):
+    pass
+
+class RPCUnavailableError(RPCError):
+    # Fallo del endpoint (timeout, 429, 5xx, conexión): se puede reintentar en otro
+    pass
+
+class Endpoint:
+    def __init__(self, url: str, rate: float = RPC_ENDPOINT_RPS):
+        self.url = url
+        # Solo el host: la URL completa puede llevar claves de API en la ruta o la query
+        self.name = urlsplit(url).netloc or url
+        self.bucket = TokenBucket(rate)
+        self.latency = None             # media móvil de la latencia, en segundos
+        self.error_rate = 0.0           # media móvil de la tasa de fallos (0..1)
+        self.consecutive_failures = 0
+        self.backoff_until = 0.0
+
+    def __repr__(self) -> str:
+        return f'Endpoint({self.url!r})'
+
+    def available(self, now: float) -> bool:
+        return now >= self.backoff_until
+
+    def score(self) -> float:
+        # Menor es mejor: latencia esperada penalizada por errores y por la espera del límite de tasa
+        latency = self.latency if self.latency is not None else 0.0
+        return latency * (1 + 4 * self.error_rate) + self.error_rate + self.bucket.delay()
+
+    def record_latency(self, latency: float) -> None:
+        self.latency = latency if self.latency is None else (1 - HEALTH_ALPHA) * self.latency + HEALTH_ALPHA * latency
+
+    def record_success(self, latency: float) -> None:
+        self.record_latency(latency)
+        self.error_rate *= 1 - HEALTH_ALPHA
+        self.consecutive_failures = 0
+
+    def record_failure(self, retry_after: float = None) -> None:
+        self.error_rate = (1 - HEALTH_ALPHA) * self.error_rate + HEALTH_ALPHA
+        self.consecutive_failures += 1
+        # Respetar Retry-After si el endpoint lo indica; si no, retroceso exponencial
+        backoff = retry_after if retry_after is not None else min(0.5 * 2 ** (self.consecutive_failures - 1), MAX_BACKOFF)
+        self.backoff_until = time.monotonic() + backoff
+
+def parse_endpoints(spec: str) -> list[Endpoint]:
+    endpoints = []
+    for item in spec.split(','):
+        url, _, rate = item.strip().partition('|')
+        if url:
+            endpoints.append(Endpoint(url, float(rate) if rate else RPC_ENDPOINT_RPS))
+    return endpoints
+
+def _method_of(payload) -> str:
+    # Un lote JSON-RPC es una lista de peticiones del mismo método
+    return payload[0]['method'] if isinstance(payload, list) else payload['method']
+
+def _retry_after(response: httpx.Response):
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        return None
+
+class SolanaRPCClient:
+    def __init__(self, endpoints: list[Endpoint] = None, timeout: float = RPC_TIMEOUT, concurrency: int = RPC_CONCURRENCY,
+                 max_connections: int = RPC_MAX_CONNECTIONS, hedge_delay: float = RPC_HEDGE_DELAY, max_attempts: int = RPC_MAX_ATTEMPTS):
+        self.endpoints = endpoints if endpoints is not None else parse_endpoints(SOLANA_RPC_URLS)
+        if not self.endpoints:
+            raise ValueError('No hay endpoints RPC configurados')
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.hedge_delay = hedge_delay
+        self.max_attempts = max(1, max_attempts)
+        # Limita las peticiones en vuelo de todo el proceso (monitor y handlers comparten el cliente)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._client = None
+        self._request_id = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # La sesión se crea al primer uso para quedar ligada al event loop en ejecución
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                headers={'Content-Type': 'application/json'},
+            )
+        return self._client
+
+    def _pick(self, exclude: set[Endpoint]):
+        now = time.monotonic()
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude and endpoint.available(now)]
+        return min(candidates, key=Endpoint.score) if candidates else None
+
+    async def _pick_primary(self) -> Endpoint:
+        endpoint = self._pick(set())
+        if endpoint is None:
+            # Todos los endpoints están en retroceso: esperar al primero que se libere
+            endpoint = min(self.endpoints, key=lambda e: e.backoff_until)
+            await asyncio.sleep(min(endpoint.backoff_until - time.monotonic(), self.timeout))
+        return endpoint
+
+    async def call(self, method: str, params: list):
+        self._request_id += 1
+        payload = {"jsonrpc": "2.0", "id": self._request_id, "method": method, "params": params}
+        return await self._send_with_failover(payload)
+
+    async def _send_with_failover(self, payload):
+        # Envía al endpoint más sano; si tarda más de hedge_delay se lanza una copia a otro
+        # y gana la primera respuesta. Los fallos recuperables pasan al siguiente endpoint.
+        primary = await self._pick_primary()
+        tried = {primary}
+        pending = {asyncio.create_task(self._send(primary, payload))}
+        last_error = None
+        try:
+            while pending:
+                can_hedge = len(tried) < self.max_attempts
+                done, pending = await asyncio.wait(pending, timeout=self.hedge_delay if can_hedge else None,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        return task.result()
+                    except RPCUnavailableError as e:
+                        last_error = e
+                if can_hedge and (not done or not pending):
+                    backup = self._pick(tried)
+                    if backup is not None:
+                        tried.add(backup)
+                        pending.add(asyncio.create_task(self._send(backup, payload)))
+        finally:
+            for task in pending:
+                task.cancel()
+        raise last_error or RPCUnavailableError(f"{_method_of(payload)}: ningún endpoint disponible")
+
+    async def _send(self, endpoint: Endpoint, payload):
+        method = _method_of(payload)
+        await endpoint.bucket.acquire()
+        async with self._semaphore:
+            start = time.monotonic()
+            try:
+                response = await self._get_client().post(endpoint.url, json=payload)
+            except asyncio.CancelledError:
+                # Perdió la carrera contra una petición de respaldo: cuenta como respuesta lenta
+                endpoint.record_latency(time.monotonic() - start)
+                metrics.rpc_errors.inc(endpoint=endpoint.name, method=method, kind='hedged')
+                raise
+            except httpx.HTTPError as e:
+                endpoint.record_failure()
+                kind = 'timeout' if isinstance(e, httpx.TimeoutException) else 'connection'
+                metrics.rpc_errors.inc(endpoint=endpoint.name, method=method, kind=kind)
+                raise RPCUnavailableError(f'{method} en {endpoint.url}: {type(e).__name__} {str(e)}') from e
+            latency = time.monotonic() - start
+        metrics.rpc_request_seconds.observe(latency, endpoint=endpoint.name, method=method)
+
+        if response.status_code == 429 or response.status_code >= 500:
+            endpoint.record_failure(_retry_after(response))
+            metrics.rpc_errors.inc(endpoint=endpoint.name, method=method, kind=f'http_{response.status_code}')
+            raise RPCUnavailableError(f'{method} en {endpoint.url}: HTTP {response.status_code}')
+        if response.status_code >= 400:
+            metrics.rpc_errors.inc(endpoint=endpoint.name, method=method, kind=f'http_{response.status_code}')
+            raise RPCError(f'{method} en {endpoint.url}: HTTP {response.status_code}')
+        try:
+            data = response.json()
+        except ValueError as e:
+            endpoint.record_failure()
+            metrics.rpc_errors.inc(endpoint=endpoint.name, method=method, kind='invalid_response')
+            raise RPCUnavailableError(f'{method} en {endpoint.url}: respuesta no válida') from e
+        endpoint.record_success(latency)
+        if isinstance(data, list):
+            # Respuesta de un lote: los errores de cada elemento los trata call_batch
+            return data
+        if 'error' in data:
+            metrics.rpc_errors.inc(endpoint=endpoint.name, method=method, kind='rpc_error')
+            raise RPCError(f"{method}: {data['error']}")
+        return data['result']
+
+    async def call_batch(self, method: str, params_list: list[list]) -> list:
+        # Varias llamadas del mismo método en una sola petición HTTP; devuelve los resultados en el
+        # mismo orden, con None en las llamadas que fallaron individualmente
+        if not params_list:
+            return []
+        first_id = self._request_id + 1
+        self._request_id += len(params_list)
+        payload = [
+            {"jsonrpc": "2.0", "id": first_id + i, "method": method, "params": params}
+            for i, params in enumerate(params_list)
+        ]
+        response = await self._send_with_failover(payload)
+        if not isinstance(response, list):
+            raise RPCError(f'{method}: respuesta de lote no válida')
+        results = [None] * len(params_list)
+        for item in response:
+            index = item.get('id', 0) - first_id
+            if not 0 <= index < len(results):
+                continue
+            if 'error' in item:
+                logger.warning(f"{method}: {item['error']}")
+            else:
+                results[index] = item.get('result')
+        return results
+
+    async def get_signatures_for_address(self, requests: list[tuple[str, str, int]]) -> list:
+        # requests: (dirección, última firma vista o None, límite). Firmas más recientes primero; None si falló.
+        # Con el mismo compromiso que las suscripciones de pubsub: con el de por defecto (finalized) la
+        # transacción que provocó la notificación todavía no aparece
+        return await self.call_batch("getSignaturesForAddress", [
+            [address, {"limit": limit, "commitment": "confirmed", **({"until": until} if until else {})}]
+            for address, until, limit in requests
+        ])
+
+    async def get_transactions(self, signatures: list[str], max_supported_version: int = 0) -> list:
+        # Transacciones en formato jsonParsed; None si no se encontró o falló
+        return await self.call_batch("getTransaction", [
+            [signature, {"encoding": "jsonParsed", "commitment": "confirmed", "maxSupportedTransactionVersion": max_supported_version}]
+            for signature in signatures
+        ])
+
+    async def get_balance(self, wallet_address: str) -> int:
+        result = await self.call("getBalance", [wallet_address])
+        return result['value']
+
+    async def get_multiple_accounts(self, addresses: list[str], data_slice: dict, batch_size: int = RPC_BATCH_SIZE,
+                                    on_progress: Callable[[int, int], Awaitable[None]] = None) -> dict[str, dict]:
+        # Cuentas en lotes getMultipleAccounts; None si la cuenta no existe.
+        # Las direcciones cuyo lote falló no aparecen en el resultado
+        unique_addresses = list(dict.fromkeys(addresses))
+        batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        accounts = {}
+        done = 0
+
+        async def fetch_batch(batch: list[str]) -> None:
+            try:
+                result = await self.call("getMultipleAccounts", [batch, {"encoding": "base64", "dataSlice": data_slice}])
+            except RPCError as e:
+                logger.error(f'Error al obtener {len(batch)} cuentas: {str(e)}')
+            else:
+                accounts.update(zip(batch, result['value']))
+            if on_progress is not None:
+                nonlocal done
+                done += len(batch)
+                await on_progress(done, len(unique_addresses))
+
+        await asyncio.gather(*(
+            fetch_batch(unique_addresses[i:i + batch_size])
+            for i in range(0, len(unique_addresses), batch_size)
+        ))
+        return accounts
+
+    async def get_multiple_balances(self, addresses: list[str], batch_size: int = RPC_BATCH_SIZE,
+                                    on_progress: Callable[[int, int], Awaitable[None]] = None) -> dict[str, int]:
+        # Solo interesan los lamports: se pide un dataSlice vacío para no descargar los datos de la cuenta
+        accounts = await self.get_multiple_accounts(addresses, {"offset": 0, "length": 0}, batch_size, on_progress)
+        # Una cuenta inexistente tiene saldo 0
+        return {address: account['lamports'] if account else 0 for address, account in accounts.items()}
+
+    async def get_token_amounts(self, token_accounts: list[str], batch_size: int = RPC_BATCH_SIZE) -> dict[str, int]:
+        # Cantidad en unidades mínimas de cada cuenta de token, leyendo solo los 8 bytes del campo amount;
+        # None si la cuenta se ha cerrado
+        accounts = await self.get_multiple_accounts(token_accounts, {"offset": TOKEN_AMOUNT_OFFSET, "length": 8}, batch_size)
+        return {
+            address: int.from_bytes(base64.b64decode(account['data'][0]), 'little') if account else None
+            for address, account in accounts.items()
+        }
+
+    async def get_token_accounts_by_owner(self, owners: list[str]) -> list:
+        # Cuentas de token (SPL y Token-2022) de cada propietario: lista de (cuenta, mint, cantidad, decimales),
+        # o None si alguna de las consultas falló
+        requests = [[owner, {"programId": program}, {"encoding": "jsonParsed"}] for owner in owners for program in TOKEN_PROGRAM_IDS]
+        results = await self.call_batch("getTokenAccountsByOwner", requests)
+        holdings = []
+        for i in range(0, len(results), len(TOKEN_PROGRAM_IDS)):
+            chunk = results[i:i + len(TOKEN_PROGRAM_IDS)]
+            if any(result is None for result in chunk):
+                holdings.append(None)
+                continue
+            accounts = []
+            for result in chunk:
+                for item in result['value']:
+                    info = item['account']['data']['parsed']['info']
+                    amount = info['tokenAmount']
+                    accounts.append((item['pubkey'], info['mint'], int(amount['amount']), amount['decimals']))
+            holdings.append(accounts)
+        return holdings
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+_rpc_client = None
+
+def get_rpc_client() -> SolanaRPCClient:
+    global _rpc_client
+    if _rpc_client is None:
+        _rpc_client = SolanaRPCClient()
+    return _rpc_client
+
+async def get_multiple_balances(addresses: list[str], batch_size: int = RPC_BATCH_SIZE) -> dict[str, int]:
+    return await get_rpc_client().get_multiple_balances(addresses, batch_size)
@@ -0,0 +1,121 @@
+import numpy as np
+from rpc import LAMPORTS_PER_SOL
+
+# Reglas de alerta evaluadas en bloque. Cada suscripción (grupo, wallet) ocupa una fila de unas
+# columnas NumPy con su saldo de referencia (el de la última alerta) y los umbrales de su regla; en
+# cada ciclo los saldos leídos se reparten a las filas de su wallet y todas las reglas se comprueban
+# con unas pocas operaciones vectoriales, sin un bucle de Python por suscripción.
+
+# Cambio que alerta cuando la regla no fija ningún umbral de cambio (0.01 SOL)
+DEFAULT_CHANGE_LAMPORTS = LAMPORTS_PER_SOL // 100
+
+# Motivos de una alerta (máscara de bits)
+REASON_CHANGE = 1
+REASON_BELOW = 2
+REASON_ABOVE = 4
+
+# Valores centinela de las columnas: umbral desactivado y suscripción sin saldo de referencia
+INT64_MIN = np.iinfo(np.int64).min
+INT64_MAX = np.iinfo(np.int64).max
+NO_BASELINE = INT64_MIN
+
+def resolve_rule(change_lamports, change_percent, below_lamports, above_lamports, cooldown_seconds) -> tuple:
+    # Campos de la regla (None = sin fijar) a valores de columna. Sin umbral absoluto ni porcentual se
+    # aplica el cambio por defecto; con solo uno de ellos, el otro queda desactivado
+    if change_lamports is None and change_percent is None:
+        change_lamports = DEFAULT_CHANGE_LAMPORTS
+    return (
+        INT64_MAX if change_lamports is None else change_lamports,
+        np.inf if change_percent is None else change_percent,
+        INT64_MIN if below_lamports is None else below_lamports,
+        INT64_MAX if above_lamports is None else above_lamports,
+        cooldown_seconds or 0,
+    )
+
+class RuleEngine:
+    def __init__(self):
+        self.wallet_ids = {}                                # dirección -> fila de la columna de wallets
+        self.wallet = np.empty(0, dtype=np.int64)           # fila de wallet de cada suscripción
+        self.baseline = np.empty(0, dtype=np.int64)         # lamports de la última alerta
+        self.change = np.empty(0, dtype=np.int64)           # cambio absoluto mínimo que alerta
+        self.percent = np.empty(0, dtype=np.float64)        # cambio porcentual mínimo que alerta
+        self.below = np.empty(0, dtype=np.int64)            # alerta al bajar de este saldo
+        self.above = np.empty(0, dtype=np.int64)            # alerta al superar este saldo
+        self.cooldown = np.empty(0, dtype=np.float64)       # segundos mínimos entre dos alertas
+        self.last_alert = np.empty(0, dtype=np.float64)     # instante (time.time) de la última alerta
+
+    def __len__(self) -> int:
+        return len(self.wallet)
+
+    def load(self, wallet_addresses: list[str], baselines: list, rules: list[tuple], last_alerts: list[float]) -> None:
+        # Sustituye todas las filas
+        self.__init__()
+        self.append(wallet_addresses, baselines, rules, last_alerts)
+
+    def append(self, wallet_addresses: list[str], baselines: list, rules: list[tuple], last_alerts: list[float]) -> None:
+        # Una fila por suscripción, en el orden de las listas. baselines: lamports o None;
+        # rules: tuplas de resolve_rule; last_alerts: instante de la última alerta o -inf
+        wallet = np.fromiter((self.wallet_ids.setdefault(address, len(self.wallet_ids)) for address in wallet_addresses),
+                             dtype=np.int64, count=len(wallet_addresses))
+        baseline = np.fromiter((NO_BASELINE if lamports is None else lamports for lamports in baselines),
+                               dtype=np.int64, count=len(baselines))
+        columns = list(zip(*rules)) if rules else [(), (), (), (), ()]
+        self.wallet = np.concatenate((self.wallet, wallet))
+        self.baseline = np.concatenate((self.baseline, baseline))
+        self.change = np.concatenate((self.change, np.array(columns[0], dtype=np.int64)))
+        self.percent = np.concatenate((self.percent, np.array(columns[1], dtype=np.float64)))
+        self.below = np.concatenate((self.below, np.array(columns[2], dtype=np.int64)))
+        self.above = np.concatenate((self.above, np.array(columns[3], dtype=np.int64)))
+        self.cooldown = np.concatenate((self.cooldown, np.array(columns[4], dtype=np.float64)))
+        self.last_alert = np.concatenate((self.last_alert, np.array(last_alerts, dtype=np.float64)))
+
+    def set_rule(self, row: int, rule: tuple) -> None:
+        self.change[row], self.percent[row], self.below[row], self.above[row], self.cooldown[row] = rule
+
+    def take(self, keep: np.ndarray) -> None:
+        # Conserva las filas marcadas en keep (máscara booleana), en su orden
+        for column in ('wallet', 'baseline', 'change', 'percent', 'below', 'above', 'cooldown', 'last_alert'):
+            setattr(self, column, getattr(self, column)[keep])
+
+    def compact(self) -> None:
+        # Las direcciones que ya no tienen filas conservan su número hasta aquí
+        used, self.wallet = np.unique(self.wallet, return_inverse=True)
+        addresses = list(self.wallet_ids)
+        self.wallet_ids = {addresses[wallet]: index for index, wallet in enumerate(used.tolist())}
+
+    def evaluate(self, balances: dict[str, int], now: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Devuelve (filas que alertan, motivo de cada una, saldo de referencia anterior) y mueve su
+        # referencia al saldo nuevo. Las filas en enfriamiento conservan la referencia: el cambio acumulado
+        # alerta cuando termina
+        empty = np.empty(0, dtype=np.int64)
+        if not balances or not len(self.wallet):
+            return empty, empty, empty
+        ids = np.fromiter((self.wallet_ids.get(address, -1) for address in balances), dtype=np.int64, count=len(balances))
+        values = np.fromiter(balances.values(), dtype=np.int64, count=len(balances))
+        known = ids >= 0
+        current = np.zeros(len(self.wallet_ids), dtype=np.int64)
+        polled = np.zeros(len(self.wallet_ids), dtype=bool)
+        current[ids[known]] = values[known]
+        polled[ids[known]] = True
+
+        rows = np.flatnonzero(polled[self.wallet] & (self.baseline != NO_BASELINE))
+        old = self.baseline[rows]
+        new = current[self.wallet[rows]]
+        delta = np.abs(new - old)
+
+        # Ambos umbrales se superan estrictamente ("más de", como se muestran). Sobre un saldo de referencia 0
+        # no hay porcentaje: una regla solo porcentual usa entonces el cambio por defecto, o no alertaría nunca
+        percent = self.percent[rows]
+        change = np.where((old == 0) & (self.change[rows] == INT64_MAX), DEFAULT_CHANGE_LAMPORTS, self.change[rows])
+        reasons = np.where(delta > change, REASON_CHANGE, 0)
+        reasons |= np.where((old > 0) & (delta * 100.0 > percent * np.maximum(old, 1)), REASON_CHANGE, 0)
+        below = self.below[rows]
+        reasons |= np.where((old >= below) & (new < below), REASON_BELOW, 0)
+        above = self.above[rows]
+        reasons |= np.where((old <= above) & (new > above), REASON_ABOVE, 0)
+
+        fire = (reasons != 0) & (now - self.last_alert[rows] >= self.cooldown[rows])
+        rows, reasons, old, new = rows[fire], reasons[fire], old[fire], new[fire]
+        self.baseline[rows] = new
+        self.last_alert[rows] = now
+        return rows, reasons, old
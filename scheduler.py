@@ -0,0 +1,83 @@
+import heapq
+import itertools
+from config import POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_BACKOFF
+
+class AdaptiveScheduler:
+    # Cola de prioridad por fecha límite: las wallets que cambian se sondean cada
+    # min_interval y las inactivas retroceden exponencialmente hasta max_interval.
+
+    def __init__(self, min_interval: float = POLL_MIN_INTERVAL, max_interval: float = POLL_MAX_INTERVAL, backoff: float = POLL_BACKOFF):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff = backoff
+        self._heap = []             # (deadline, secuencia, dirección)
+        self._deadlines = {}        # dirección -> deadline vigente
+        self._intervals = {}        # dirección -> intervalo actual
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def sync(self, addresses: set[str], now: float) -> None:
+        self.remove([address for address in self._deadlines if address not in addresses])
+        self.add(addresses, now)
+
+    def add(self, addresses, now: float) -> None:
+        for address in addresses:
+            if address not in self._deadlines:
+                self.schedule(address, now, self.min_interval)
+
+    def remove(self, addresses) -> None:
+        # Las entradas retiradas quedan en el heap y se descartan al salir (borrado perezoso)
+        for address in addresses:
+            self._deadlines.pop(address, None)
+            self._intervals.pop(address, None)
+
+    def schedule(self, address: str, deadline: float, interval: float) -> None:
+        self._deadlines[address] = deadline
+        self._intervals[address] = interval
+        heapq.heappush(self._heap, (deadline, next(self._counter), address))
+
+    def snapshot(self, now: float) -> dict[str, list[float]]:
+        # Segundos hasta la fecha límite e intervalo actual de cada dirección
+        return {address: [deadline - now, self._intervals[address]] for address, deadline in self._deadlines.items()}
+
+    def restore(self, entries: dict[str, list[float]], now: float) -> None:
+        for address, (remaining, interval) in entries.items():
+            interval = min(max(interval, self.min_interval), self.max_interval)
+            self.schedule(address, now + min(remaining, interval), interval)
+
+    def pop_due(self, now: float, limit: int) -> list[str]:
+        due = []
+        while self._heap and len(due) < limit and self._heap[0][0] <= now:
+            deadline, _, address = heapq.heappop(self._heap)
+            if self._deadlines.get(address) == deadline:
+                due.append(address)
+        return due
+
+    def reschedule(self, address: str, changed: bool, now: float) -> None:
+        if address not in self._intervals:
+            return
+        if changed:
+            interval = self.min_interval
+        else:
+            interval = min(self._intervals[address] * self.backoff, self.max_interval)
+        self.schedule(address, now + interval, interval)
+
+    def retry(self, address: str, now: float) -> None:
+        # Tras un fallo se reintenta con el mismo intervalo, sin retroceder
+        if address in self._intervals:
+            self.schedule(address, now + self._intervals[address], self._intervals[address])
+
+    def _discard_stale(self) -> None:
+        while self._heap and self._deadlines.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def next_deadline(self):
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def lag(self, now: float) -> float:
+        # Retraso de la fecha límite vencida más antigua; 0 si el bucle va al día
+        deadline = self.next_deadline()
+        return max(0.0, now - deadline) if deadline is not None else 0.0
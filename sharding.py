@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import socket
+import time
+import zlib
+from config import MONITOR_PARTITIONS, PARTITION_LEASE_TTL, METRICS_PORT
+import storage
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Reparto del monitoreo entre varios procesos. Cada dirección pertenece a una partición fija
+# (crc32 de la dirección) y cada partición la vigila un solo proceso mientras mantenga su concesión
+# en la tabla partition_leases. Los procesos que comparten la base de datos, en la misma máquina o
+# no, se reparten las particiones a partes iguales; si uno muere, sus concesiones caducan y los
+# demás las toman en la siguiente renovación.
+
+# Segundos entre comprobaciones de los procesos hijos
+SUPERVISE_INTERVAL = 5
+# Segundos entre dos envíos de las métricas de un proceso de monitoreo al proceso del bot
+METRICS_FORWARD_INTERVAL = 10
+
+def partition_of(wallet_address: str, partitions: int = MONITOR_PARTITIONS) -> int:
+    # hash() cambia entre procesos; crc32 es estable
+    return zlib.crc32(wallet_address.encode()) % partitions
+
+def worker_name() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+class LeaseManager:
+    def __init__(self, owner: str, partitions: int = MONITOR_PARTITIONS, ttl: float = PARTITION_LEASE_TTL):
+        self.owner = owner
+        self.partitions = partitions
+        self.ttl = ttl
+        # Conexión propia: renew corre en otro hilo y no debe tomar el cerrojo de la compartida
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = storage.open_connection()
+        return self._connection
+
+    def renew(self, now: float) -> set[int]:
+        # Renueva el latido y las concesiones propias, suelta el exceso sobre la cuota justa y toma
+        # particiones libres o caducadas hasta completarla. Devuelve las particiones propias.
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE serializa el reparto entre procesos
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('''INSERT INTO monitor_workers (owner, heartbeat) VALUES (?, ?)
+                            ON CONFLICT (owner) DO UPDATE SET heartbeat = excluded.heartbeat''', (self.owner, now))
+            conn.execute('DELETE FROM monitor_workers WHERE heartbeat < ?', (now - self.ttl,))
+            workers = [row[0] for row in conn.execute('SELECT owner FROM monitor_workers ORDER BY owner')]
+            index = workers.index(self.owner)
+            share = self.partitions // len(workers) + (1 if index < self.partitions % len(workers) else 0)
+
+            owned = sorted(row[0] for row in conn.execute(
+                'SELECT partition FROM partition_leases WHERE owner = ? AND expires_at >= ?', (self.owner, now)))
+            if len(owned) > share:
+                conn.executemany('DELETE FROM partition_leases WHERE partition = ? AND owner = ?',
+                                 [(partition, self.owner) for partition in owned[share:]])
+                owned = owned[:share]
+            conn.execute('UPDATE partition_leases SET expires_at = ? WHERE owner = ?', (now + self.ttl, self.owner))
+
+            if len(owned) < share:
+                taken = {row[0] for row in conn.execute('SELECT partition FROM partition_leases WHERE expires_at >= ?', (now,))}
+                free = [partition for partition in range(self.partitions) if partition not in taken][:share - len(owned)]
+                conn.executemany('''INSERT INTO partition_leases (partition, owner, expires_at) VALUES (?, ?, ?)
+                                    ON CONFLICT (partition) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at''',
+                                 [(partition, self.owner, now + self.ttl) for partition in free])
+                owned += free
+        return set(owned)
+
+    def release(self) -> None:
+        # Al parar de forma ordenada las particiones quedan libres sin esperar a que caduquen
+        with self._connect() as conn:
+            conn.execute('DELETE FROM partition_leases WHERE owner = ?', (self.owner,))
+            conn.execute('DELETE FROM monitor_workers WHERE owner = ?', (self.owner,))
+        self._connection.close()
+        self._connection = None
+
+class QueueSink:
+    # Sustituye al dispatcher en los procesos de monitoreo: reenvía alertas e invalidaciones al bot
+    def __init__(self, queue):
+        self.queue = queue
+
+    def enqueue(self, chat_id: int, text: str) -> None:
+        self.queue.put(('notify', chat_id, text))
+
+    def invalidate_groups(self, groups: set[tuple[int, int]]) -> None:
+        self.queue.put(('invalidate', list(groups)))
+
+    def send_metrics(self) -> None:
+        if METRICS_PORT:
+            self.queue.put(('metrics', multiprocessing.current_process().name, metrics.snapshot()))
+
+async def forward_metrics(sink: QueueSink, interval: float = METRICS_FORWARD_INTERVAL) -> None:
+    # En los procesos de monitoreo: el proceso del bot sirve /metrics con las series de todos
+    while True:
+        await asyncio.sleep(interval)
+        sink.send_metrics()
+
+async def receive_changes(monitor, inbox) -> None:
+    # En los procesos de monitoreo: pasa al monitor los cambios de suscripciones que envía el bot
+    loop = asyncio.get_running_loop()
+    while True:
+        change = await loop.run_in_executor(None, _get_change, inbox)
+        if change is not None:
+            monitor.notify_change(change)
+
+def _get_change(inbox):
+    try:
+        return inbox.get(timeout=1)
+    except queue.Empty:
+        return None
+
+class WorkerPool:
+    # Lanza los procesos de monitoreo, reenvía sus mensajes al dispatcher y relanza los que mueren.
+    # Cada proceso tiene además su propia cola de entrada para los cambios de suscripciones del bot
+    def __init__(self, notifier, target, workers: int, on_saved=None):
+        self.notifier = notifier
+        self.target = target
+        self.workers = workers
+        self.on_saved = on_saved
+        self._context = multiprocessing.get_context('spawn')
+        self.queue = self._context.Queue()
+        self.processes = []
+        self.inboxes = []
+        self._closing = False
+
+    def _spawn(self, index: int):
+        # Un proceso relanzado empieza con una cola nueva: su primera lectura de suscripciones ya incluye lo perdido
+        inbox = self._context.Queue()
+        process = self._context.Process(target=self.target, args=(self.queue, inbox), name=f'monitor-worker-{index}', daemon=True)
+        process.start()
+        if index < len(self.inboxes):
+            self.inboxes[index] = inbox
+        else:
+            self.inboxes.append(inbox)
+        logger.info(f'Proceso de monitoreo {index} iniciado (pid {process.pid})')
+        return process
+
+    async def run(self) -> None:
+        self.processes = [self._spawn(index) for index in range(self.workers)]
+        try:
+            await asyncio.gather(self._forward(), self._supervise())
+        finally:
+            self.stop()
+
+    def _get(self):
+        try:
+            return self.queue.get(timeout=1)
+        except queue.Empty:
+            return None
+
+    async def _forward(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await loop.run_in_executor(None, self._get)
+            if item is None:
+                # Al cerrar, se termina cuando los procesos han salido y su cola está vacía
+                if self._closing and not any(process.is_alive() for process in self.processes):
+                    return
+                continue
+            if item[0] == 'notify':
+                self.notifier.enqueue(item[1], item[2])
+            elif item[0] == 'invalidate' and self.on_saved is not None:
+                self.on_saved(set(map(tuple, item[1])))
+            elif item[0] == 'metrics':
+                metrics.merge(item[1], item[2])
+
+    def publish(self, change: tuple) -> None:
+        # Cada proceso aplica a su registro solo las direcciones de sus particiones
+        for inbox in self.inboxes:
+            inbox.put(change)
+
+    async def _supervise(self) -> None:
+        while True:
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+            if self._closing:
+                return
+            for index, process in enumerate(self.processes):
+                if not process.is_alive():
+                    # Sus concesiones caducan solas; el relevo se reparte en la siguiente renovación
+                    logger.warning(f'El proceso de monitoreo {index} terminó (código {process.exitcode}); relanzando')
+                    self.processes[index] = self._spawn(index)
+
+    def close(self) -> None:
+        # Cada proceso termina su ciclo y guarda sus saldos al recibir SIGTERM; run() acaba cuando
+        # se han reenviado sus últimas alertas
+        self._closing = True
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+
+    def stop(self) -> None:
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join(timeout=5)
+
+async def renew_leases(monitor, leases: LeaseManager) -> None:
+    # Renueva con margen suficiente para que la concesión no caduque entre dos renovaciones
+    while True:
+        partitions = await asyncio.to_thread(leases.renew, time.time())
+        if partitions != monitor.partitions:
+            logger.info(f'{leases.owner} vigila {len(partitions)} de {leases.partitions} particiones')
+            monitor.set_partitions(partitions)
+        await asyncio.sleep(leases.ttl / 3)
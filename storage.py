@@ -0,0 +1,83 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from config import DB_PATH
+import metrics
+
+# Conexión SQLite de larga duración compartida por handlers y monitor.
+# El modo WAL permite leer mientras el monitor escribe sin bloquear los handlers.
+
+_db_path = DB_PATH
+_connection = None
+_lock = threading.RLock()
+_transaction_depth = 0
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=5000')
+    # Necesario para el borrado en cascada de las wallets de un grupo
+    conn.execute('PRAGMA foreign_keys=ON')
+    return conn
+
+def open_connection() -> sqlite3.Connection:
+    # Conexión aparte para trabajos largos en otro hilo: no toma el cerrojo de la compartida, así que
+    # las lecturas del event loop no la esperan y sus escrituras solo esperan en SQLite (busy_timeout)
+    return connect(_db_path)
+
+def set_db_path(path: str) -> None:
+    global _db_path
+    close()
+    _db_path = path
+
+def get_connection() -> sqlite3.Connection:
+    global _connection
+    with _lock:
+        if _connection is None:
+            _connection = connect(_db_path)
+        return _connection
+
+def fetchall(sql: str, params: tuple = ()) -> list[tuple]:
+    with _lock, metrics.db_seconds.time(operation='read'):
+        return get_connection().execute(sql, params).fetchall()
+
+def fetchone(sql: str, params: tuple = ()):
+    with _lock, metrics.db_seconds.time(operation='read'):
+        return get_connection().execute(sql, params).fetchone()
+
+@contextmanager
+def transaction():
+    # Confirma al salir del bloque o revierte si se produce una excepción.
+    # Las transacciones anidadas se unen a la más externa.
+    global _transaction_depth
+    with _lock:
+        conn = get_connection()
+        if _transaction_depth:
+            _transaction_depth += 1
+            try:
+                yield conn
+            finally:
+                _transaction_depth -= 1
+            return
+        _transaction_depth = 1
+        try:
+            with metrics.db_seconds.time(operation='write'), conn:
+                yield conn
+        finally:
+            _transaction_depth = 0
+
+@contextmanager
+def separate_transaction(conn: sqlite3.Connection):
+    # Transacción corta en una conexión de open_connection para trabajos que encadenan muchas. Toma el cerrojo
+    # de la compartida: las escrituras del event loop esperan su turno aquí, como mucho una transacción, y no
+    # en el busy_timeout de SQLite, donde un escritor que vuelve a empezar enseguida no les deja hueco
+    with _lock, metrics.db_seconds.time(operation='write'), conn:
+        yield conn
+
+def close() -> None:
+    global _connection
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+            _connection = None
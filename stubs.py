@@ -0,0 +1,343 @@
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import random
+import time
+import httpx
+import websockets
+from http_server import HTTPServer, Request, Response, json_response
+from prices import SOL_MINT
+
+logger = logging.getLogger(__name__)
+
+# Servidores locales que imitan a Solana para probar el bot sin conexión
+
+class StubPubSubServer:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.host = host
+        self.port = port
+        self.balances = {}          # dirección -> lamports
+        self._subscriptions = {}    # id de suscripción -> (conexión, dirección)
+        self._next_id = 0
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f'ws://{self.host}:{self.port}'
+
+    @property
+    def subscribed_addresses(self) -> set[str]:
+        return {address for _, address in self._subscriptions.values()}
+
+    async def start(self) -> None:
+        self._server = await websockets.serve(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def set_balance(self, address: str, lamports: int) -> None:
+        self.balances[address] = lamports
+        for subscription_id, (connection, subscribed_address) in list(self._subscriptions.items()):
+            if subscribed_address == address:
+                await self._notify(connection, subscription_id, lamports)
+
+    async def drop_connections(self) -> None:
+        # Simula una caída del nodo: el cliente debe reconectar y volver a suscribirse
+        for connection in {connection for connection, _ in self._subscriptions.values()}:
+            await connection.close()
+
+    async def _handle(self, connection) -> None:
+        try:
+            async for raw in connection:
+                request = json.loads(raw)
+                method, params = request.get('method'), request.get('params', [])
+                if method == 'accountSubscribe':
+                    self._next_id += 1
+                    self._subscriptions[self._next_id] = (connection, params[0])
+                    response = {"jsonrpc": "2.0", "id": request['id'], "result": self._next_id}
+                elif method == 'accountUnsubscribe':
+                    removed = self._subscriptions.pop(params[0], None) is not None
+                    response = {"jsonrpc": "2.0", "id": request['id'], "result": removed}
+                else:
+                    response = {"jsonrpc": "2.0", "id": request.get('id'), "error": {"code": -32601, "message": "Method not found"}}
+                await connection.send(json.dumps(response))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            for subscription_id, (subscribed_connection, _) in list(self._subscriptions.items()):
+                if subscribed_connection is connection:
+                    del self._subscriptions[subscription_id]
+
+    async def _notify(self, connection, subscription_id: int, lamports: int) -> None:
+        notification = {
+            "jsonrpc": "2.0",
+            "method": "accountNotification",
+            "params": {
+                "result": {"context": {"slot": 0}, "value": {"lamports": lamports, "data": ["", "base64"], "owner": "11111111111111111111111111111111", "executable": False, "rentEpoch": 0}},
+                "subscription": subscription_id,
+            },
+        }
+        try:
+            await connection.send(json.dumps(notification))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+class StubRPCServer:
+    # JSON-RPC HTTP con inyección de latencia y errores para probar el pool de endpoints
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: float = 1.0):
+        self.balances = {}          # dirección -> lamports; las desconocidas tienen saldo 0
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.requests = 0
+        self.calls = {}             # método -> número de llamadas
+        self.signatures = {}        # dirección -> firmas, la más reciente primero
+        self.transactions = {}      # firma -> transacción jsonParsed
+        self.token_accounts = {}    # propietario -> {cuenta de token: (mint, unidades, decimales)}
+        self._slot = 0
+        self._server = HTTPServer(self._handle, host, port)
+
+    @property
+    def url(self) -> str:
+        return self._server.url
+
+    async def start(self) -> None:
+        await self._server.start()
+
+    async def stop(self) -> None:
+        await self._server.stop()
+
+    async def _handle(self, request: Request) -> Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if random.random() < self.throttle_rate:
+            return json_response({"jsonrpc": "2.0", "error": {"code": 429, "message": "Too many requests"}}, 429,
+                                 {'Retry-After': str(self.retry_after)})
+        if random.random() < self.error_rate:
+            return json_response({"jsonrpc": "2.0", "error": {"code": -32603, "message": "Internal error"}}, 503)
+        payload = request.json()
+        # Admite peticiones individuales y en lote (array JSON-RPC)
+        if isinstance(payload, list):
+            return json_response([self._dispatch(item) for item in payload])
+        return json_response(self._dispatch(payload))
+
+    def _dispatch(self, request: dict) -> dict:
+        method, params = request.get('method'), request.get('params', [])
+        self.calls[method] = self.calls.get(method, 0) + 1
+        handler = getattr(self, f'_rpc_{method}', None)
+        if handler is None:
+            return {"jsonrpc": "2.0", "id": request.get('id'), "error": {"code": -32601, "message": "Method not found"}}
+        return {"jsonrpc": "2.0", "id": request.get('id'), "result": handler(params)}
+
+    def add_transaction(self, changes: dict[str, int], token_changes: dict = None, fee: int = 5000) -> str:
+        # Registra una transacción sintética y aplica sus variaciones de saldo. changes: dirección -> lamports
+        # (la primera dirección paga la comisión); token_changes: (propietario, mint) -> (unidades, decimales)
+        self._slot += 1
+        signature = ''.join(random.choices('123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz', k=88))
+        addresses = list(changes)
+        pre = [self.balances.get(address, 0) for address in addresses]
+        changes = dict(changes)
+        changes[addresses[0]] -= fee
+        for address, delta in changes.items():
+            self.balances[address] = self.balances.get(address, 0) + delta
+        post = [self.balances[address] for address in addresses]
+        pre_tokens, post_tokens = [], []
+        for index, ((owner, mint), (amount, decimals)) in enumerate((token_changes or {}).items()):
+            before = 10 ** (decimals + 3)
+            for entries, value in ((pre_tokens, before), (post_tokens, before + amount)):
+                entries.append({"accountIndex": len(addresses) + index, "mint": mint, "owner": owner,
+                                "uiTokenAmount": {"amount": str(value), "decimals": decimals}})
+        token_accounts = [f'token-account-{index}' for index in range(len(token_changes or {}))]
+        self.transactions[signature] = {
+            "slot": self._slot, "blockTime": None,
+            "meta": {"err": None, "fee": fee, "preBalances": pre + [0] * len(token_accounts),
+                     "postBalances": post + [0] * len(token_accounts),
+                     "preTokenBalances": pre_tokens, "postTokenBalances": post_tokens},
+            "transaction": {"signatures": [signature], "message": {
+                "accountKeys": [{"pubkey": address, "signer": i == 0, "writable": True} for i, address in enumerate(addresses + token_accounts)]}},
+        }
+        for address in set(addresses) | {owner for owner, _ in (token_changes or {})}:
+            self.signatures.setdefault(address, []).insert(0, signature)
+        return signature
+
+    def _rpc_getSignaturesForAddress(self, params: list) -> list:
+        options = params[1] if len(params) > 1 else {}
+        result = []
+        for signature in self.signatures.get(params[0], []):
+            if signature == options.get('until'):
+                break
+            result.append({"signature": signature, "slot": self.transactions[signature]['slot'], "err": None, "blockTime": None})
+        return result[:options.get('limit', 1000)]
+
+    def _rpc_getTransaction(self, params: list):
+        return self.transactions.get(params[0])
+
+    def _rpc_getBalance(self, params: list) -> dict:
+        return {"context": {"slot": 0}, "value": self.balances.get(params[0], 0)}
+
+    def _token_account(self, address: str):
+        for owner, accounts in self.token_accounts.items():
+            if address in accounts:
+                return owner, accounts[address]
+        return None
+
+    def _rpc_getMultipleAccounts(self, params: list) -> dict:
+        # Las cuentas de token devuelven su campo amount (8 bytes en el offset 64) si se pide ese dataSlice
+        data_slice = (params[1] if len(params) > 1 else {}).get('dataSlice') or {}
+        accounts = []
+        for address in params[0]:
+            token = self._token_account(address)
+            if token is not None:
+                data = bytes(64) + token[1][1].to_bytes(8, 'little') + bytes(93)
+                if data_slice:
+                    data = data[data_slice['offset']:data_slice['offset'] + data_slice['length']]
+                accounts.append({"lamports": 2039280, "data": [base64.b64encode(data).decode(), "base64"],
+                                 "owner": "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA", "executable": False, "rentEpoch": 0})
+            elif address in self.balances:
+                accounts.append({"lamports": self.balances[address], "data": ["", "base64"], "owner": "11111111111111111111111111111111",
+                                 "executable": False, "rentEpoch": 0})
+            else:
+                accounts.append(None)
+        return {"context": {"slot": 0}, "value": accounts}
+
+    def _rpc_getTokenAccountsByOwner(self, params: list) -> dict:
+        # Todas las cuentas del stub pertenecen al programa SPL Token clásico
+        if params[1].get('programId') != 'TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA':
+            return {"context": {"slot": 0}, "value": []}
+        value = [
+            {"pubkey": account, "account": {"lamports": 2039280, "owner": params[1]['programId'], "executable": False, "rentEpoch": 0,
+                                            "data": {"program": "spl-token", "space": 165, "parsed": {"type": "account", "info": {
+                                                "mint": mint, "owner": params[0], "state": "initialized",
+                                                "tokenAmount": {"amount": str(amount), "decimals": decimals}}}}}}
+            for account, (mint, amount, decimals) in self.token_accounts.get(params[0], {}).items()
+        ]
+        return {"context": {"slot": 0}, "value": value}
+
+class StubPriceServer:
+    # API de precios con el formato de Jupiter Price v3 (GET ?ids=mint1,mint2)
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, error_rate: float = 0.0):
+        self.prices = {}            # mint -> precio en USD; los desconocidos no aparecen en la respuesta
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self._server = HTTPServer(self._handle, host, port)
+
+    @property
+    def url(self) -> str:
+        return self._server.url
+
+    async def start(self) -> None:
+        await self._server.start()
+
+    async def stop(self) -> None:
+        await self._server.stop()
+
+    async def _handle(self, request: Request) -> Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if random.random() < self.error_rate:
+            return json_response({"error": "Internal error"}, 503)
+        mints = [mint for mint in request.query.get('ids', '').split(',') if mint]
+        return json_response({mint: {"usdPrice": self.prices[mint], "decimals": 9, "priceChange24h": 0.0}
+                              for mint in mints if mint in self.prices})
+
+async def run_rpc_stub(host: str, port: int, latency: float, error_rate: float, throttle_rate: float) -> None:
+    server = StubRPCServer(host, port, latency, error_rate, throttle_rate)
+    await server.start()
+    logger.info(f'Stub JSON-RPC escuchando en {server.url}')
+    await asyncio.Event().wait()
+
+async def run_price_stub(host: str, port: int, latency: float, error_rate: float, sol_price: float) -> None:
+    server = StubPriceServer(host, port, latency, error_rate)
+    server.prices[SOL_MINT] = sol_price
+    await server.start()
+    logger.info(f'Stub de precios escuchando en {server.url}')
+    # Variación aleatoria del precio de SOL
+    while True:
+        await asyncio.sleep(5)
+        server.prices[SOL_MINT] = round(server.prices[SOL_MINT] * random.uniform(0.99, 1.01), 4)
+
+async def run_pubsub_stub(host: str, port: int, interval: float) -> None:
+    server = StubPubSubServer(host, port)
+    await server.start()
+    logger.info(f'Stub PubSub escuchando en {server.url}')
+    # Cambiar periódicamente el saldo de una wallet suscrita al azar
+    while True:
+        await asyncio.sleep(interval)
+        addresses = list(server.subscribed_addresses)
+        if addresses:
+            address = random.choice(addresses)
+            await server.set_balance(address, server.balances.get(address, 0) + random.randint(-10**9, 10**9))
+
+async def replay_updates(url: str, secret: str, path: str, concurrency: int, repeat: int) -> None:
+    # Envía al webhook actualizaciones de Telegram grabadas (un objeto JSON por línea o un array JSON)
+    with open(path, encoding='utf-8') as f:
+        content = f.read().strip()
+    updates = json.loads(content) if content.startswith('[') else [json.loads(line) for line in content.splitlines() if line.strip()]
+    updates = updates * repeat
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+
+    async def post(client: httpx.AsyncClient, update: dict) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(url, json=update, headers={'X-Telegram-Bot-Api-Secret-Token': secret})
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(post(client, update) for update in updates))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    logger.info(f'{len(updates)} actualizaciones en {elapsed:.2f}s; respuestas {statuses}; '
+                f'latencia p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms')
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Servidores stub de Solana y reenvío de actualizaciones para pruebas locales')
+    subparsers = parser.add_subparsers(dest='server', required=True)
+
+    rpc_parser = subparsers.add_parser('rpc', help='JSON-RPC HTTP')
+    rpc_parser.add_argument('--host', default='127.0.0.1')
+    rpc_parser.add_argument('--port', type=int, default=8899)
+    rpc_parser.add_argument('--latency', type=float, default=0.0, help='segundos de latencia añadida por petición')
+    rpc_parser.add_argument('--error-rate', type=float, default=0.0, help='probabilidad de responder HTTP 503')
+    rpc_parser.add_argument('--throttle-rate', type=float, default=0.0, help='probabilidad de responder HTTP 429')
+
+    pubsub_parser = subparsers.add_parser('pubsub', help='PubSub WebSocket')
+    pubsub_parser.add_argument('--host', default='127.0.0.1')
+    pubsub_parser.add_argument('--port', type=int, default=8900)
+    pubsub_parser.add_argument('--interval', type=float, default=2.0, help='segundos entre cambios de saldo simulados')
+
+    price_parser = subparsers.add_parser('prices', help='API de precios en USD')
+    price_parser.add_argument('--host', default='127.0.0.1')
+    price_parser.add_argument('--port', type=int, default=8901)
+    price_parser.add_argument('--latency', type=float, default=0.0, help='segundos de latencia añadida por petición')
+    price_parser.add_argument('--error-rate', type=float, default=0.0, help='probabilidad de responder HTTP 503')
+    price_parser.add_argument('--sol-price', type=float, default=150.0, help='precio inicial de SOL en USD')
+
+    replay_parser = subparsers.add_parser('replay', help='envía actualizaciones de Telegram grabadas al webhook del bot')
+    replay_parser.add_argument('file', help='actualizaciones en JSON (una por línea o un array)')
+    replay_parser.add_argument('--url', default='http://127.0.0.1:8443/telegram')
+    replay_parser.add_argument('--secret', required=True, help='valor de WEBHOOK_SECRET')
+    replay_parser.add_argument('--concurrency', type=int, default=32, help='peticiones simultáneas')
+    replay_parser.add_argument('--repeat', type=int, default=1, help='veces que se reenvía el archivo')
+
+    args = parser.parse_args()
+    if args.server == 'rpc':
+        asyncio.run(run_rpc_stub(args.host, args.port, args.latency, args.error_rate, args.throttle_rate))
+    elif args.server == 'prices':
+        asyncio.run(run_price_stub(args.host, args.port, args.latency, args.error_rate, args.sol_price))
+    elif args.server == 'replay':
+        asyncio.run(replay_updates(args.url, args.secret, args.file, args.concurrency, args.repeat))
+    else:
+        asyncio.run(run_pubsub_stub(args.host, args.port, args.interval))
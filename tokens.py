@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import time
+from config import TOKEN_DISCOVERY_INTERVAL, TOKEN_DISCOVERY_PER_CYCLE
+from rpc import SolanaRPCClient, RPCError
+from utils import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Seguimiento de saldos de tokens SPL. Las cuentas de token de cada wallet se descubren con
+# getTokenAccountsByOwner y después se sondean como cualquier otra dirección del planificador,
+# leyendo solo los 8 bytes de la cantidad. Cada cuenta y cada wallet se consulta una sola vez,
+# aunque la sigan varios grupos, y las cuentas sin movimiento se sondean cada vez menos.
+
+# Wallets por petición HTTP de descubrimiento (dos llamadas por wallet, una por programa de token)
+DISCOVERY_BATCH_SIZE = 10
+
+class TokenAccount:
+    __slots__ = ('wallet_address', 'mint', 'amount', 'decimals')
+
+    def __init__(self, wallet_address: str, mint: str, amount: int, decimals: int):
+        self.wallet_address = wallet_address
+        self.mint = mint
+        self.amount = amount
+        self.decimals = decimals
+
+class TokenTracker:
+    def __init__(self, rpc_client: SolanaRPCClient, budget: TokenBucket = None):
+        self.rpc = rpc_client
+        # Presupuesto de peticiones compartido con el sondeo; cada petición de descubrimiento cuesta una ficha
+        self.budget = budget
+        # Wallets con algún grupo que sigue sus tokens
+        self.wallets = set()
+        # Cuenta de token -> TokenAccount, y cuentas de cada wallet
+        self.accounts = {}
+        self._by_wallet = {}
+        # Cantidad total por (wallet, mint), sumando todas sus cuentas, y decimales de cada mint
+        self.totals = {}
+        self.decimals = {}
+        # Último descubrimiento de cada wallet (time.monotonic)
+        self._discovered = {}
+        # Cambios pendientes de escribir
+        self._pending_accounts = {}     # cuenta -> fila de token_accounts, o None si se cerró
+        self._pending_totals = {}       # (wallet, mint) -> decimales
+        # Cuentas abiertas y cerradas desde la última llamada a take_account_changes, para el planificador
+        self._opened = set()
+        self._closed = set()
+
+    def sync(self, wallets: set[str], rows: list[tuple]) -> None:
+        # rows: (token_account, wallet_address, mint, amount, decimals) guardadas en la base de datos.
+        # Las cantidades ya conocidas en memoria se conservan
+        now = time.monotonic()
+        for wallet_address in self.wallets - wallets:
+            for account in self._by_wallet.pop(wallet_address, ()):
+                del self.accounts[account]
+            self._discovered.pop(wallet_address, None)
+        self.totals = {key: amount for key, amount in self.totals.items() if key[0] in wallets}
+        self.wallets = wallets
+
+        loaded = set()
+        for account, wallet_address, mint, amount, decimals in rows:
+            if wallet_address not in wallets or account in self.accounts or account in self._pending_accounts:
+                continue
+            self._add(account, TokenAccount(wallet_address, mint, amount, decimals))
+            loaded.add((wallet_address, mint))
+            # Las wallets con cuentas guardadas no necesitan un descubrimiento inicial
+            self._discovered.setdefault(wallet_address, now)
+        for key in loaded:
+            self.totals[key] = self._total(*key)
+
+    def snapshot(self, now: float) -> dict[str, float]:
+        # Segundos desde el último descubrimiento de cada wallet
+        return {wallet_address: now - discovered_at for wallet_address, discovered_at in self._discovered.items()}
+
+    def restore(self, discovered: dict[str, float], now: float) -> None:
+        for wallet_address, age in discovered.items():
+            self._discovered.setdefault(wallet_address, now - age)
+
+    def _add(self, account: str, token_account: TokenAccount) -> None:
+        self.accounts[account] = token_account
+        self.decimals[token_account.mint] = token_account.decimals
+        self._by_wallet.setdefault(token_account.wallet_address, set()).add(account)
+        self._opened.add(account)
+        self._closed.discard(account)
+
+    def _remove(self, account: str) -> None:
+        token_account = self.accounts.pop(account)
+        self._by_wallet.get(token_account.wallet_address, set()).discard(account)
+        self._closed.add(account)
+        self._opened.discard(account)
+
+    def take_account_changes(self) -> tuple[set[str], set[str]]:
+        # (cuentas abiertas, cuentas cerradas) desde la última llamada
+        opened, closed = self._opened, self._closed
+        self._opened, self._closed = set(), set()
+        return opened, closed
+
+    def _total(self, wallet_address: str, mint: str) -> int:
+        return sum(self.accounts[account].amount for account in self._by_wallet.get(wallet_address, ())
+                   if self.accounts[account].mint == mint)
+
+    def due_discovery(self, changed: set[str], now: float) -> list[str]:
+        # Wallets sin descubrir, con movimiento de SOL (crear o cerrar una cuenta de token cuesta renta)
+        # o cuyo último descubrimiento ha caducado
+        due = [wallet_address for wallet_address in self.wallets if wallet_address not in self._discovered]
+        due += [wallet_address for wallet_address in changed if wallet_address in self.wallets and wallet_address in self._discovered]
+        due += [wallet_address for wallet_address, discovered_at in self._discovered.items()
+                if now - discovered_at >= TOKEN_DISCOVERY_INTERVAL and wallet_address not in changed and wallet_address in self.wallets]
+        return list(dict.fromkeys(due))[:TOKEN_DISCOVERY_PER_CYCLE]
+
+    async def discover(self, wallets: list[str]) -> list[tuple]:
+        # Devuelve los cambios (wallet, mint, cantidad anterior, nueva, decimales). El primer descubrimiento
+        # de una wallet solo fija la referencia y no genera cambios
+        batches = [wallets[i:i + DISCOVERY_BATCH_SIZE] for i in range(0, len(wallets), DISCOVERY_BATCH_SIZE)]
+        if self.budget is not None:
+            self.budget.consume(len(batches))
+        results = await asyncio.gather(*(self.rpc.get_token_accounts_by_owner(batch) for batch in batches), return_exceptions=True)
+        now = time.monotonic()
+        touched, baseline = set(), set()
+        for batch, result in zip(batches, results):
+            if isinstance(result, RPCError):
+                logger.error(f'Error al descubrir las cuentas de token de {len(batch)} wallets: {str(result)}')
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            for wallet_address, holdings in zip(batch, result):
+                if holdings is None:
+                    continue
+                if wallet_address not in self._discovered:
+                    baseline.add(wallet_address)
+                self._discovered[wallet_address] = now
+                found = set()
+                for account, mint, amount, decimals in holdings:
+                    found.add(account)
+                    token_account = self.accounts.get(account)
+                    if token_account is None:
+                        self._add(account, TokenAccount(wallet_address, mint, amount, decimals))
+                    elif token_account.amount == amount:
+                        continue
+                    else:
+                        token_account.amount = amount
+                    self._pending_accounts[account] = (account, wallet_address, mint, amount, decimals)
+                    touched.add((wallet_address, mint))
+                # Las cuentas que ya no aparecen se han cerrado
+                for account in self._by_wallet.get(wallet_address, set()) - found:
+                    touched.add((wallet_address, self.accounts[account].mint))
+                    self._remove(account)
+                    self._pending_accounts[account] = None
+        return self._update_totals(touched, baseline)
+
+    def apply_amounts(self, amounts: dict[str, int]) -> tuple[list[tuple], set[str]]:
+        # amounts: cuenta -> cantidad sondeada, o None si se cerró. Devuelve (cambios, cuentas modificadas)
+        touched, changed_accounts = set(), set()
+        for account, amount in amounts.items():
+            token_account = self.accounts.get(account)
+            if token_account is None or token_account.amount == amount:
+                continue
+            changed_accounts.add(account)
+            touched.add((token_account.wallet_address, token_account.mint))
+            if amount is None:
+                self._remove(account)
+                self._pending_accounts[account] = None
+            else:
+                token_account.amount = amount
+                self._pending_accounts[account] = (account, token_account.wallet_address, token_account.mint, amount, token_account.decimals)
+        return self._update_totals(touched, set()), changed_accounts
+
+    def _update_totals(self, touched: set[tuple[str, str]], baseline: set[str]) -> list[tuple]:
+        changes = []
+        for wallet_address, mint in touched:
+            decimals = self.decimals.get(mint, 0)
+            new_amount = self._total(wallet_address, mint)
+            old_amount = self.totals.get((wallet_address, mint), 0)
+            self.totals[(wallet_address, mint)] = new_amount
+            if new_amount == old_amount:
+                continue
+            self._pending_totals[(wallet_address, mint)] = decimals
+            if wallet_address not in baseline:
+                changes.append((wallet_address, mint, old_amount, new_amount, decimals))
+        return changes
+
+    def pending(self) -> tuple[list[tuple], list[str], list[tuple]]:
+        # (cuentas a insertar o actualizar, cuentas cerradas, saldos por (wallet, mint))
+        upserts = [row for row in self._pending_accounts.values() if row is not None]
+        deletes = [account for account, row in self._pending_accounts.items() if row is None]
+        totals = [(wallet_address, mint, self.totals.get((wallet_address, mint), 0), decimals)
+                  for (wallet_address, mint), decimals in self._pending_totals.items()]
+        return upserts, deletes, totals
+
+    def clear_pending(self) -> None:
+        self._pending_accounts.clear()
+        self._pending_totals.clear()
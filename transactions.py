@@ -0,0 +1,243 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from config import TX_SIGNATURES_PER_CHANGE, TX_CACHE_SIZE, TX_CACHE_MAX_ROWS
+import storage
+import metrics
+from rpc import SolanaRPCClient, RPCError, LAMPORTS_PER_SOL
+from utils import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Clasificación de los cambios de saldo a partir de sus transacciones. Cada transacción se descarga
+# y se resume una sola vez (variaciones de SOL y de tokens por cuenta) y el resumen se guarda por firma
+# en una LRU en memoria y en la tabla parsed_transactions, así que una transacción que toca varias
+# wallets vigiladas sirve para clasificarlas todas.
+
+# Mint de SOL envuelto: sus variaciones cuentan como SOL
+NATIVE_MINT = 'So11111111111111111111111111111111111111112'
+# Llamadas por petición HTTP en lote
+TX_BATCH_SIZE = 50
+# Firmas por consulta IN (...) a la caché en disco
+DISK_LOOKUP_CHUNK = 500
+# Inserciones entre dos podas de la caché en disco
+PRUNE_EVERY = 1000
+# Consultas de firmas repetidas, y segundos entre ellas, cuando una dirección que cambió aún no tiene
+# firma nueva visible en el nodo
+EMPTY_SIGNATURE_RETRIES = 2
+EMPTY_SIGNATURE_RETRY_DELAY = 1.0
+
+def summarize_transaction(tx: dict) -> dict:
+    # Resumen compacto de una transacción jsonParsed: variación de lamports por cuenta y de
+    # unidades de token por (propietario, mint), sin las cuentas que no cambian
+    meta = tx.get('meta') or {}
+    account_keys = [key['pubkey'] if isinstance(key, dict) else key for key in tx['transaction']['message']['accountKeys']]
+
+    sol = {}
+    for address, pre, post in zip(account_keys, meta.get('preBalances', []), meta.get('postBalances', [])):
+        if post != pre:
+            sol[address] = post - pre
+
+    tokens, decimals = {}, {}
+    def add_tokens(entries: list, sign: int) -> None:
+        for entry in entries or []:
+            owner = entry.get('owner') or account_keys[entry['accountIndex']]
+            amount = entry['uiTokenAmount']
+            decimals[entry['mint']] = amount['decimals']
+            owner_tokens = tokens.setdefault(owner, {})
+            owner_tokens[entry['mint']] = owner_tokens.get(entry['mint'], 0) + sign * int(amount['amount'])
+    add_tokens(meta.get('preTokenBalances'), -1)
+    add_tokens(meta.get('postTokenBalances'), 1)
+    tokens = {owner: {mint: delta for mint, delta in deltas.items() if delta} for owner, deltas in tokens.items()}
+
+    return {
+        'slot': tx.get('slot'),
+        'block_time': tx.get('blockTime'),
+        'failed': meta.get('err') is not None,
+        'fee': meta.get('fee', 0),
+        'fee_payer': account_keys[0] if account_keys else None,
+        'sol': sol,
+        'tokens': {owner: deltas for owner, deltas in tokens.items() if deltas},
+        'decimals': decimals,
+    }
+
+class Classification:
+    __slots__ = ('signature', 'kind', 'mint', 'amount', 'sol')
+
+    def __init__(self, signature: str, kind: str, mint: str = None, amount: float = 0.0, sol: float = 0.0):
+        self.signature = signature
+        self.kind = kind
+        self.mint = mint
+        self.amount = amount
+        self.sol = sol
+
+def classify_transaction(signature: str, summary: dict, wallet_address: str):
+    # None si la transacción no mueve nada de la wallet (p. ej. solo la menciona)
+    # La comisión no cuenta como movimiento de SOL del pagador
+    sol = summary['sol'].get(wallet_address, 0)
+    if wallet_address == summary['fee_payer']:
+        sol += summary['fee']
+    deltas = dict(summary['tokens'].get(wallet_address, {}))
+    sol += deltas.pop(NATIVE_MINT, 0)
+    received = {mint: delta for mint, delta in deltas.items() if delta > 0}
+    sent = {mint: delta for mint, delta in deltas.items() if delta < 0}
+
+    def token(side: dict) -> tuple[str, float]:
+        mint, delta = max(side.items(), key=lambda item: abs(item[1]))
+        return mint, delta / 10 ** summary['decimals'].get(mint, 0)
+
+    sol_amount = sol / LAMPORTS_PER_SOL
+    if summary['failed']:
+        return Classification(signature, 'Transacción fallida', sol=sol_amount)
+    if received and sent:
+        return Classification(signature, 'Intercambio de tokens', *token(received), sol=sol_amount)
+    if received:
+        kind = 'Compra de token' if sol < 0 else 'Recepción de token'
+        return Classification(signature, kind, *token(received), sol=sol_amount)
+    if sent:
+        kind = 'Venta de token' if sol > 0 else 'Envío de token'
+        return Classification(signature, kind, *token(sent), sol=sol_amount)
+    if sol > 0:
+        return Classification(signature, 'Recepción de SOL', sol=sol_amount)
+    if sol < 0:
+        return Classification(signature, 'Envío de SOL', sol=sol_amount)
+    return None
+
+class TransactionCache:
+    def __init__(self, capacity: int = TX_CACHE_SIZE, max_rows: int = TX_CACHE_MAX_ROWS):
+        self.capacity = capacity
+        self.max_rows = max_rows
+        self._memory = OrderedDict()
+        self._inserts = 0
+
+    def _remember(self, signature: str, summary: dict) -> None:
+        self._memory[signature] = summary
+        self._memory.move_to_end(signature)
+        if len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def get_many(self, signatures: list[str]) -> dict[str, dict]:
+        found = {}
+        for signature in signatures:
+            summary = self._memory.get(signature)
+            if summary is not None:
+                self._memory.move_to_end(signature)
+                found[signature] = summary
+        metrics.tx_cache_lookups.inc(len(found), result='memory')
+
+        missing = [signature for signature in signatures if signature not in found]
+        for i in range(0, len(missing), DISK_LOOKUP_CHUNK):
+            chunk = missing[i:i + DISK_LOOKUP_CHUNK]
+            rows = storage.fetchall(
+                f'SELECT signature, summary FROM parsed_transactions WHERE signature IN ({",".join("?" * len(chunk))})', tuple(chunk))
+            for signature, summary in rows:
+                found[signature] = json.loads(summary)
+                self._remember(signature, found[signature])
+            metrics.tx_cache_lookups.inc(len(rows), result='disk')
+        metrics.tx_cache_lookups.inc(len(signatures) - len(found), result='miss')
+        return found
+
+    def put_many(self, summaries: dict[str, dict]) -> None:
+        if not summaries:
+            return
+        for signature, summary in summaries.items():
+            self._remember(signature, summary)
+        now = int(time.time())
+        with storage.transaction() as conn:
+            conn.executemany('INSERT OR IGNORE INTO parsed_transactions (signature, cached_at, summary) VALUES (?, ?, ?)',
+                             [(signature, now, json.dumps(summary, separators=(',', ':'))) for signature, summary in summaries.items()])
+            self._inserts += len(summaries)
+            if self._inserts >= PRUNE_EVERY:
+                self._inserts = 0
+                self._prune(conn)
+
+    def _prune(self, conn) -> None:
+        # Mantiene la tabla por debajo de max_rows borrando las entradas más antiguas
+        excess = conn.execute('SELECT COUNT(*) FROM parsed_transactions').fetchone()[0] - self.max_rows
+        if excess > 0:
+            conn.execute('''DELETE FROM parsed_transactions WHERE signature IN (
+                                SELECT signature FROM parsed_transactions ORDER BY cached_at LIMIT ?)''', (excess,))
+
+class TransactionClassifier:
+    def __init__(self, rpc_client: SolanaRPCClient, cache: TransactionCache = None,
+                 signatures_per_change: int = TX_SIGNATURES_PER_CHANGE, budget: TokenBucket = None):
+        self.rpc = rpc_client
+        # Presupuesto de peticiones compartido con el sondeo; cada petición en lote cuesta una ficha
+        self.budget = budget
+        self.cache = cache if cache is not None else TransactionCache()
+        self.signatures_per_change = signatures_per_change
+        # Firma más reciente ya clasificada por dirección
+        self._last_signature = {}
+
+    def snapshot(self) -> dict[str, str]:
+        return dict(self._last_signature)
+
+    def restore(self, last_signatures: dict[str, str]) -> None:
+        self._last_signature.update(last_signatures)
+
+    async def _batched(self, fetch, items: list) -> list:
+        chunks = [items[i:i + TX_BATCH_SIZE] for i in range(0, len(items), TX_BATCH_SIZE)]
+        if self.budget is not None:
+            self.budget.consume(len(chunks))
+        results = await asyncio.gather(*(fetch(chunk) for chunk in chunks), return_exceptions=True)
+        flat = []
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, RPCError):
+                logger.error(f'Error en un lote de {len(chunk)} llamadas: {str(result)}')
+                result = [None] * len(chunk)
+            elif isinstance(result, BaseException):
+                raise result
+            flat.extend(result)
+        return flat
+
+    async def classify(self, addresses: list[str], since: dict[str, float] = None) -> dict[str, list[Classification]]:
+        # Clasifica las transacciones nuevas de cada dirección desde la última firma vista, en orden cronológico.
+        # since: momento de la observación anterior de cada dirección; acota la primera consulta, cuando
+        # todavía no hay firma previa y las firmas más recientes pueden ser anteriores al cambio
+        since = since or {}
+        requests = [(address, self._last_signature.get(address), self.signatures_per_change) for address in addresses]
+        signature_lists = await self._batched(self.rpc.get_signatures_for_address, requests)
+        # Cada dirección pedida ha cambiado de saldo, así que tiene alguna transacción nueva. Si el nodo todavía no
+        # la muestra se vuelve a preguntar antes de clasificar por el saldo: de lo contrario esa firma se
+        # atribuiría al cambio siguiente
+        for _ in range(EMPTY_SIGNATURE_RETRIES):
+            empty = [index for index, entries in enumerate(signature_lists) if entries == []]
+            if not empty:
+                break
+            await asyncio.sleep(EMPTY_SIGNATURE_RETRY_DELAY)
+            retried = await self._batched(self.rpc.get_signatures_for_address, [requests[index] for index in empty])
+            for index, entries in zip(empty, retried):
+                signature_lists[index] = entries
+
+        new_signatures = {}
+        for address, entries in zip(addresses, signature_lists):
+            if not entries:
+                continue
+            newest = entries[0]['signature']
+            if address not in self._last_signature and address in since:
+                entries = [entry for entry in entries if entry.get('blockTime') is None or entry['blockTime'] >= since[address]]
+            self._last_signature[address] = newest
+            new_signatures[address] = [entry['signature'] for entry in reversed(entries)]
+
+        # Cada firma se resuelve una vez aunque aparezca en varias wallets
+        unique = list(dict.fromkeys(signature for signatures in new_signatures.values() for signature in signatures))
+        summaries = self.cache.get_many(unique)
+        missing = [signature for signature in unique if signature not in summaries]
+        fetched = {}
+        for signature, tx in zip(missing, await self._batched(self.rpc.get_transactions, missing)):
+            if tx is None:
+                continue
+            try:
+                fetched[signature] = summarize_transaction(tx)
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                logger.warning(f'No se pudo analizar la transacción {signature}: {type(e).__name__} {str(e)}')
+        self.cache.put_many(fetched)
+        summaries.update(fetched)
+
+        classifications = {}
+        for address, signatures in new_signatures.items():
+            found = [classify_transaction(signature, summaries[signature], address) for signature in signatures if signature in summaries]
+            classifications[address] = [classification for classification in found if classification is not None]
+        return classifications
@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    def consume(self, tokens: float = 1) -> None:
+        # Descuenta sin esperar aunque el saldo quede negativo: lo ya enviado se paga con las fichas siguientes
+        self._refill()
+        self._tokens -= tokens
+
+    def available(self) -> int:
+        # Fichas enteras disponibles ahora mismo, sin consumirlas
+        self._refill()
+        return int(self._tokens)
+
+    def delay(self, tokens: float = 1) -> float:
+        # Segundos hasta que haya fichas suficientes
+        self._refill()
+        return max(0.0, (tokens - self._tokens) / self.rate)
+
+    async def acquire(self, tokens: float = 1) -> None:
+        while not self.try_acquire(tokens):
+            await asyncio.sleep(self.delay(tokens))
@@ -0,0 +1,100 @@
+import asyncio
+import hmac
+import logging
+import time
+from telegram import Update
+from telegram.ext import Application
+from config import WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_WORKERS, WEBHOOK_MAX_PENDING
+from http_server import Request, Response, text_response
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Recepción de actualizaciones de Telegram por webhook. Cada actualización se responde en cuanto
+# se valida y se procesa después en segundo plano: como mucho `workers` manejadores a la vez y, dentro
+# de un mismo chat, en orden de llegada (un botón y el texto que le sigue no se adelantan).
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+class WebhookReceiver:
+    def __init__(self, application: Application, secret: str = WEBHOOK_SECRET, path: str = WEBHOOK_PATH,
+                 workers: int = WEBHOOK_WORKERS, max_pending: int = WEBHOOK_MAX_PENDING):
+        if not secret:
+            raise ValueError('El modo webhook necesita WEBHOOK_SECRET')
+        self.application = application
+        self.secret = secret.encode()
+        self.path = path
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max(1, workers))
+        self._chat_locks = {}       # chat_id -> [asyncio.Lock, actualizaciones en espera o en curso]
+        self._tasks = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        metrics.webhook_pending.function = lambda: len(self._tasks)
+
+    async def handle(self, request: Request) -> Response:
+        if request.path != self.path:
+            return text_response('Not Found', 404)
+        if request.method != 'POST':
+            return text_response('Method Not Allowed', 405)
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, '').encode(), self.secret):
+            metrics.webhook_updates.inc(result='forbidden')
+            return text_response('Forbidden', 403)
+        if len(self._tasks) >= self.max_pending:
+            # Telegram reintenta las respuestas que no son 2xx: la actualización no se pierde
+            metrics.webhook_updates.inc(result='overloaded')
+            return text_response('Service Unavailable', 503)
+        try:
+            update = Update.de_json(request.json(), self.application.bot)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            logger.warning(f'Actualización de Telegram no válida: {str(e)}')
+            metrics.webhook_updates.inc(result='invalid')
+            return text_response('Bad Request', 400)
+
+        metrics.webhook_updates.inc(result='accepted')
+        task = asyncio.create_task(self._process(update, time.monotonic()))
+        self._tasks.add(task)
+        self._idle.clear()
+        task.add_done_callback(self._done)
+        return Response(200)
+
+    def _done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not self._tasks:
+            self._idle.set()
+
+    async def _process(self, update: Update, received_at: float) -> None:
+        chat = update.effective_chat
+        key = chat.id if chat is not None else None
+        if key is None:
+            async with self._semaphore:
+                await self._dispatch(update, received_at)
+            return
+
+        # El candado del chat se toma antes que la plaza de trabajo para no ocuparla esperando
+        entry = self._chat_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0], self._semaphore:
+                await self._dispatch(update, received_at)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[key]
+
+    async def _dispatch(self, update: Update, received_at: float) -> None:
+        try:
+            # Los errores de los manejadores los recibe el error_handler de la aplicación
+            await self.application.process_update(update)
+        except Exception:
+            logger.exception(f'Error al procesar la actualización {update.update_id}')
+        finally:
+            metrics.update_seconds.observe(time.monotonic() - received_at)
+
+    async def drain(self, timeout: float) -> bool:
+        # Espera a que terminen las actualizaciones recibidas; devuelve False si quedan al agotar el plazo
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return not self._tasks